@@ -0,0 +1,186 @@
+import os
+import shutil
+import tempfile
+import threading
+
+import config
+from util import *
+
+# A persistent cache of build artefacts, shared between problems, contests, clones and CI jobs.
+#
+# Each entry is a directory named after the hash of
+# - the source files of the program,
+# - the compile and run commands, with the build directory normalized, and
+# - the version of the compiler.
+# It contains all files written to the build directory by the compile command.
+#
+# The cache lives in $XDG_CACHE_HOME/bapctools/build by default. Entries are evicted
+# least-recently-used first when the total size exceeds --build-cache-size MB.
+
+# Map from compiler executable to the hash of its `--version` output.
+_compiler_versions = {}
+_compiler_versions_lock = threading.Lock()
+
+# Only one thread at a time may evict entries.
+_evict_lock = threading.Lock()
+# The size of each entry in the cache. Entries never change once written.
+_entry_sizes = {}
+
+
+def enabled():
+    return not config.args.no_build_cache
+
+
+def cache_dir():
+    if config.args.build_cache:
+        return Path(config.args.build_cache).resolve()
+    if is_windows():
+        base = Path(os.getenv('LocalAppData'))
+    elif os.getenv('XDG_CACHE_HOME'):
+        base = Path(os.getenv('XDG_CACHE_HOME'))
+    else:
+        base = Path(os.getenv('HOME')) / '.cache'
+    return base / 'bapctools' / 'build'
+
+
+def _compiler_version(exe):
+    with _compiler_versions_lock:
+        if exe in _compiler_versions:
+            return _compiler_versions[exe]
+
+    path = shutil.which(exe)
+    version = ''
+    if path is not None:
+        ret = exec_command([path, '--version'], crop=False, timeout=10)
+        version = (ret.out or '') + (ret.err or '')
+
+    h = combine_hashes([path, version])
+    with _compiler_versions_lock:
+        _compiler_versions[exe] = h
+    return h
+
+
+# A hash identifying the build of the given program: its sources, its commands, and the
+# version of the compiler, or of the interpreter for programs without a compile step.
+def build_hash(program):
+    command = program.compile_command or program.run_command
+    # The run command of build scripts is the program itself.
+    if program.language == 'manual' or not command:
+        return program.hash
+    return combine_hashes([program.hash, _compiler_version(command[0])])
+
+
+# The cache key for the given program, or None when it can not be cached.
+def _key(program):
+    # Programs without a compile step have nothing to cache.
+    if not program.compile_command:
+        return None
+    # Build scripts may depend on anything, so they are never cached.
+    if program.language == 'manual':
+        return None
+    return build_hash(program)
+
+
+def _copy(src, dst):
+    if src.is_dir() and not src.is_symlink():
+        shutil.copytree(src, dst, symlinks=True)
+    else:
+        shutil.copy2(src, dst, follow_symlinks=False)
+
+
+# Copy the cached build artefacts for program into its build directory.
+# Returns True on a cache hit.
+def restore(program):
+    if not enabled():
+        return False
+    key = _key(program)
+    if key is None:
+        return False
+    entry = cache_dir() / key
+    if not entry.is_dir():
+        return False
+
+    try:
+        # Mark the entry as recently used.
+        os.utime(entry)
+        for f in entry.iterdir():
+            _copy(f, program.tmpdir / f.name)
+    except OSError:
+        # The entry was evicted concurrently. Clean up and build normally.
+        for f in program.tmpdir.iterdir():
+            if f not in program.input_files:
+                if f.is_dir() and not f.is_symlink():
+                    shutil.rmtree(f)
+                else:
+                    f.unlink()
+        return False
+
+    return True
+
+
+# Store the build artefacts of program (all files in the build directory that are
+# not sources) in the cache.
+def store(program):
+    if not enabled():
+        return
+    key = _key(program)
+    if key is None:
+        return
+    directory = cache_dir()
+    entry = directory / key
+    if entry.is_dir():
+        return
+
+    try:
+        directory.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary directory first, so that other processes never see
+        # partial entries.
+        tmp = Path(tempfile.mkdtemp(prefix='.tmp_', dir=directory))
+        for f in program.tmpdir.iterdir():
+            if f not in program.input_files and f.name != 'meta_':
+                _copy(f, tmp / f.name)
+        try:
+            tmp.rename(entry)
+        except OSError:
+            # Another process stored the same entry in the meantime.
+            shutil.rmtree(tmp, ignore_errors=True)
+    except OSError as e:
+        program.bar.debug(f'Could not store build in cache: {e}')
+        return
+
+    _evict(directory)
+
+
+def _entry_size(entry):
+    if entry not in _entry_sizes:
+        size = 0
+        for root, dirs, files in os.walk(entry):
+            for f in files:
+                size += os.lstat(os.path.join(root, f)).st_size
+        _entry_sizes[entry] = size
+    return _entry_sizes[entry]
+
+
+# Remove least recently used entries until the cache fits in --build-cache-size.
+def _evict(directory):
+    limit = config.args.build_cache_size * 1024 * 1024
+    with _evict_lock:
+        entries = []
+        total = 0
+        for entry in directory.iterdir():
+            if entry.name.startswith('.'):
+                continue
+            try:
+                size = _entry_size(entry)
+                entries.append((entry.stat().st_mtime, size, entry))
+            except OSError:
+                # Evicted by another process.
+                continue
+            total += size
+
+        for _, size, entry in sorted(entries):
+            if total <= limit:
+                break
+            shutil.rmtree(entry, ignore_errors=True)
+            _entry_sizes.pop(entry, None)
+            total -= size
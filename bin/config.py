@@ -26,6 +26,21 @@ VALIDATION_MODES = ['default', 'custom', 'custom interactive']
 MAX_PRIORITY = max(PRIORITY.values())
 MAX_PRIORITY_VERDICT = [v for v in PRIORITY if PRIORITY[v] == MAX_PRIORITY]
 
+# With --rerun-failed, accepted results taking at least this fraction of the timelimit are rerun.
+RERUN_TIMELIMIT_FRACTION = 0.8
+
+# With --repeat, runs are repeated until the 95% confidence interval of the mean duration is
+# within this fraction of the mean.
+REPEAT_PRECISION = 0.02
+
+# The suggested timelimit is this factor times the slowest duration of accepted submissions.
+TIMELIMIT_AC_FACTOR = 2
+
+# A crashed submission is considered to have exceeded the memory limit when its peak memory
+# usage is at least this fraction of the limit, or when its stderr contains one of the messages.
+MLE_FRACTION = 0.9
+MLE_MESSAGES = ['std::bad_alloc', 'MemoryError', 'OutOfMemoryError', 'out of memory']
+
 # When --table is set, this threshold determines the number of identical profiles needed to get flagged.
 TABLE_THRESHOLD = 4
 
@@ -64,6 +79,7 @@ default_args = {
     'jobs': os.cpu_count() // 2,
     'time': 600,  # Used for `bt fuzz`
     'verbose': 0,
+    'build_cache_size': 2048,  # MB
 }
 
 
@@ -71,10 +87,10 @@ default_args = {
 """
 for cmd in $(bapctools --help | grep '^  {' | sed 's/  {//;s/}//;s/,/ /g') ; do bapctools $cmd --help ; done |& \
 grep '^  [^ ]' | sed 's/^  //' | cut -d ' ' -f 1 | sed -E 's/,//;s/^-?-?//;s/-/_/g' | sort -u | \
-grep -Ev '^(h|jobs|time|verbose)$' | sed "s/^/'/;s/$/',/" | tr '\n' ' ' | sed 's/^/args_list = [/;s/, $/]\n/'
+grep -Ev '^(h|jobs|time|verbose|build_cache_size)$' | sed "s/^/'/;s/$/',/" | tr '\n' ' ' | sed 's/^/args_list = [/;s/, $/]\n/'
 """
 # fmt: off
-args_list = ['1', 'add_manual', 'all', 'api', 'author', 'check_deterministic', 'clean', 'clean_generated', 'cleanup_generated', 'contest', 'contest_id', 'contestname', 'cp', 'cpp_flags', 'default_solution', 'directory', 'error', 'force', 'force_build', 'ignore_validators', 'input', 'interaction', 'interactive', 'kattis', 'memory', 'move_manual', 'move_to', 'no_bar', 'no_generate', 'no_solutions', 'no_timelimit', 'order', 'order_from_ccs', 'output', 'password', 'problem', 'problemname', 'remove', 'samples', 'scoreboard_repo', 'skel', 'skip', 'skip_solution', 'skip_testcase_sanity_checks', 'skip_visualizer', 'submissions', 'table', 'testcases', 'timelimit', 'timeout', 'username', 'validation', 'watch', 'web']
+args_list = ['1', 'add_manual', 'all', 'api', 'author', 'build_cache', 'check_deterministic', 'clean', 'clean_generated', 'cleanup_generated', 'contest', 'contest_id', 'contestname', 'cp', 'cpp_flags', 'default_solution', 'directory', 'error', 'force', 'force_build', 'ignore_validators', 'input', 'interaction', 'interactive', 'kattis', 'memory', 'move_manual', 'move_to', 'near_duplicates', 'no_bar', 'no_build_cache', 'no_cds', 'no_generate', 'no_smt', 'no_solutions', 'no_timelimit', 'no_zygote', 'order', 'order_from_ccs', 'output', 'password', 'pin_cores', 'problem', 'problem_jobs', 'problemname', 'remove', 'repeat', 'report', 'rerun', 'rerun_failed', 'samples', 'scoreboard_repo', 'skel', 'skip', 'skip_solution', 'skip_testcase_sanity_checks', 'skip_visualizer', 'stream', 'submissions', 'table', 'testcases', 'timelimit', 'timeout', 'username', 'validation', 'watch', 'web']
 # fmt: on
 
 
@@ -0,0 +1,202 @@
+import math
+import re
+import sys
+import time
+
+from fractions import Fraction
+from util import *
+
+# An in-process version of support/default_output_validator.cpp.
+#
+# For problems with many small testcases, starting a validator process for each run takes
+# much longer than comparing the output. The common cases are handled here using bytes
+# operations implemented in C: the output and answer are compared as a whole first, and
+# tokenized with bytes.split() otherwise. Only tokens that differ are parsed as floats.
+#
+# Cases where the result could differ from the C++ validator, which compares floats as
+# long doubles, return None so that the C++ validator is run instead. These are tokens
+# that are not plain decimal floats, values close to the double range, and errors very
+# close to the tolerance.
+
+# The tokens accepted by both stold and float() in the same way.
+_FLOAT_REGEX = re.compile(rb'[+-]?(\d+\.?\d*|\.\d+)([eE][+-]?\d+)?|[+-]?(inf|infinity|nan)', re.I)
+# Whitespace tokens and non-whitespace tokens, for space_change_sensitive.
+# These are the characters for which isspace() is true in the C locale.
+_TOKEN_REGEX = re.compile(rb'[^ \t\n\v\f\r]+|[ \t\n\v\f\r]')
+# Errors within this relative distance from the tolerance are left to the C++ validator.
+_TOLERANCE_MARGIN = 1e-9
+
+
+class _Fallback(Exception):
+    pass
+
+
+def _parse_flags(flags):
+    settings = {
+        'case_sensitive': False,
+        'space_change_sensitive': False,
+        'float_tolerance': 0,
+        'float_absolute_tolerance': 0,
+        'float_relative_tolerance': 0,
+    }
+    flags = [str(flag) for flag in flags]
+    for i, flag in enumerate(flags):
+        if flag in ['case_sensitive', 'space_change_sensitive']:
+            settings[flag] = True
+        elif flag in settings:
+            if i + 1 == len(flags):
+                raise _Fallback()
+            try:
+                settings[flag] = float(flags[i + 1])
+            except ValueError:
+                raise _Fallback()
+
+    if settings['float_tolerance'] != 0:
+        if settings['float_absolute_tolerance'] != 0 or settings['float_relative_tolerance'] != 0:
+            raise _Fallback()
+        settings['float_absolute_tolerance'] = settings['float_tolerance']
+        settings['float_relative_tolerance'] = settings['float_tolerance']
+    return settings
+
+
+def _strip_newline(s):
+    return s[:-1] if s.endswith(b'\n') else s
+
+
+def _quick_diff(out, ans):
+    if ans.count(b'\n') <= 1 and out.count(b'\n') <= 1:
+        message = b'Got ' + _strip_newline(out) + b' wanted ' + _strip_newline(ans)
+        if len(message) > 200:
+            message = message[:200] + b' ...'
+        return message.decode('utf-8', 'replace')
+    return ''
+
+
+# Tokens that stold parses differently from float(): hexadecimal floats and nan(...).
+_SPECIAL_FLOAT_REGEX = re.compile(rb'[+-]?(0x|nan\()', re.I)
+
+
+# Parse w like stold. Returns None when stold would not parse the complete token.
+def _parse_float(w):
+    if _SPECIAL_FLOAT_REGEX.match(w):
+        raise _Fallback()
+    if _FLOAT_REGEX.fullmatch(w) is None:
+        return None
+    v = float(w)
+    if math.isfinite(v):
+        # Values outside the double range, or close to it, are handled differently by stold.
+        if v != 0 and not 1e-300 < abs(v) < 1e300:
+            raise _Fallback()
+        if v == 0 and re.search(rb'[1-9]', re.split(rb'[eE]', w)[0]):
+            raise _Fallback()
+    elif math.isinf(v) and b'n' not in w.lower():
+        raise _Fallback()
+    return v
+
+
+# Whether err is larger than tolerance. The C++ validator computes err using long doubles,
+# so it may decide differently when err is within slack of the tolerance, unless exact()
+# returns True, i.e. err is computed without any rounding.
+def _outside_tolerance(err, tolerance, slack, exact):
+    if abs(err - tolerance) <= slack + _TOLERANCE_MARGIN * tolerance and not exact():
+        raise _Fallback()
+    return err > tolerance
+
+
+# Compare out and ans like support/default_output_validator.cpp.
+# Returns (accepted, message), or raises _Fallback.
+def _compare(out, ans, settings):
+    # Make lower case if needed.
+    if not settings['case_sensitive']:
+        out = out.lower()
+        ans = ans.lower()
+        if out == ans:
+            return True, 'case'
+
+    floatabs = settings['float_absolute_tolerance']
+    floatrel = settings['float_relative_tolerance']
+    floats = floatabs != 0 or floatrel != 0
+
+    if settings['space_change_sensitive'] and not floats:
+        return False, _quick_diff(out, ans)
+
+    if settings['space_change_sensitive']:
+        ans_words = _TOKEN_REGEX.findall(ans)
+        out_words = _TOKEN_REGEX.findall(out)
+    else:
+        ans_words = ans.split()
+        out_words = out.split()
+
+    if ans_words == out_words:
+        return True, 'white space'
+
+    if not floats or len(out_words) != len(ans_words):
+        return False, _quick_diff(out, ans)
+
+    max_abs_err = 0
+    max_rel_err = 0
+    for w1, w2 in zip(ans_words, out_words):
+        if w1 == w2:
+            continue
+
+        # If the answer term doesn't parse as a float, w1 and w2 must be equal.
+        v1 = _parse_float(w1)
+        if v1 is None:
+            return False, _quick_diff(w2, w1)
+        # If the output term doesn't parse as a float -> WA.
+        v2 = _parse_float(w2)
+        if v2 is None:
+            # stold fails when w2 does not start with a float, and parses only a prefix otherwise.
+            if _FLOAT_REGEX.match(w2) is None:
+                return False, _quick_diff(out, ans)
+            return False, _quick_diff(w2, w1)
+
+        # OK if w1 and w2 represent the same (possibly inf) value.
+        if v1 == v2:
+            continue
+
+        # Inequal nan and inf values are never within the tolerance.
+        if not math.isfinite(v1) or not math.isfinite(v2):
+            return False, _quick_diff(w2, w1)
+
+        abserr = abs(v1 - v2)
+        relerr = abs((v1 - v2) / v1) if v1 != 0 else 1000
+        max_abs_err = max(max_abs_err, abserr)
+        max_rel_err = max(max_rel_err, relerr)
+
+        # The rounding error of the values parsed as doubles.
+        slack = 4 * sys.float_info.epsilon * max(abs(v1), abs(v2))
+
+        def exact_abserr():
+            return (
+                Fraction(w1.decode()) == v1
+                and Fraction(w2.decode()) == v2
+                and abs(Fraction(v1) - Fraction(v2)) == abserr
+            )
+
+        def exact_relerr():
+            return v1 != 0 and exact_abserr() and abserr / abs(Fraction(v1)) == relerr
+
+        if _outside_tolerance(abserr, floatabs, slack, exact_abserr) and _outside_tolerance(
+            relerr, floatrel, slack / abs(v1) if v1 != 0 else 0, exact_relerr
+        ):
+            return False, _quick_diff(w2, w1)
+
+    return True, f'float: abs {max_abs_err:.2g} rel {max_rel_err:.2g}'
+
+
+# Validate the output of the given run with the given default output validator flags.
+# Returns an ExecResult like OutputValidator.run, or None when the C++ validator must be used.
+def validate(testcase, run, flags):
+    start = time.thread_time()
+    try:
+        settings = _parse_flags(flags)
+        with map_file(run.out_path) as out, map_file(testcase.ans_path) as ans:
+            # Fast path: the output is identical to the answer.
+            if len(out) == len(ans) and memoryview(out) == memoryview(ans):
+                accepted, message = True, ''
+            else:
+                accepted, message = _compare(out[:], ans[:], settings)
+    except (_Fallback, OSError):
+        return None
+    return ExecResult(accepted, time.thread_time() - start, crop_output(message + '\n'), None)
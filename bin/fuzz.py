@@ -131,11 +131,7 @@ def _try_generator_invocation(problem, t, submissions, i):
         localbar.done()
 
     # Run all submissions against the testcase.
-    in_parallel = True
-    if problem.interactive:
-        in_parallel = False
-        verbose('Disabling parallelization for interactive problem.')
-    p = parallel.Parallel(run_submission, in_parallel)
+    p = parallel.Parallel(run_submission)
     for submission in submissions:
         p.put(submission)
     p.done()
@@ -156,11 +152,12 @@ def fuzz(problem):
         return False
 
     # Filter to only keep rules depending on seed.
+    # Rules with a count: key are skipped, since they can not be saved as a single testcase.
     def filter_dir(d):
         d.data = list(
             filter(
                 lambda t: isinstance(t, generate.Directory)
-                or (not t.manual and t.generator.uses_seed),
+                or (not t.manual and t.generator.uses_seed and t.generator.count is None),
                 d.data,
             )
         )
@@ -144,6 +144,9 @@ class Invocation:
 
 
 class GeneratorInvocation(Invocation):
+    # The number of testcases written by a single run, see MultiGeneratorInvocation.
+    count = None
+
     def __init__(self, problem, string):
         super().__init__(problem, string, allow_absolute=False)
 
@@ -151,7 +154,7 @@ class GeneratorInvocation(Invocation):
     def run(self, bar, cwd, name, seed, retries=1):
         for retry in range(retries):
             result = self.program.run(
-                bar, cwd, name, args=self._sub_args(name=name, seed=seed + retry)
+                bar, cwd, name, args=self._sub_args(name=name, seed=seed + retry), count=self.count
             )
             if result.ok is True:
                 break
@@ -170,6 +173,82 @@ class GeneratorInvocation(Invocation):
         return result
 
 
+# The runs of the generator of a testcase with a count: key, shared by the testcases it expands to.
+class GeneratorRuns:
+    def __init__(self, name, path, count):
+        # The name of the rule in generators.yaml, and its path relative to data/.
+        self.name = name
+        self.path = path
+        self.count = count
+        self.lock = threading.Lock()
+        # Maps (seed, attempt) to the result and working directory of each run, and the name of
+        # the testcase that started it.
+        self.results = {}
+
+
+# The generator invocation of one of the testcases of a rule with a count: key.
+# The generator is run once for all testcases of the rule, with {count} replaced by the number
+# of testcases and {name} by the name of the rule. It writes 1.in up to {count}.in, and
+# optionally other files like 1.ans, and each testcase copies the files with its own index.
+class MultiGeneratorInvocation(GeneratorInvocation):
+    COUNT_REGEX = re.compile(r'\{count\}')
+
+    def __init__(self, problem, string, runs, index):
+        super().__init__(problem, string)
+        self.problem = problem
+        self.runs = runs
+        self.count = runs.count
+        self.index = index
+        # The number of runs requested by this testcase for each seed. The n-th request of each
+        # testcase uses the n-th run, so that checking for determinism runs the generator again.
+        self.attempts = {}
+
+    # Each testcase only depends on its own part of the output of the generator.
+    def cache_command(self, seed=None):
+        return f'{super().cache_command(seed)} [{self.index}/{self.count}]'
+
+    def _sub_args(self, *, name, seed=None):
+        args = super()._sub_args(name=name, seed=seed)
+        return [self.COUNT_REGEX.sub(str(self.count), arg) for arg in args]
+
+    def run(self, bar, cwd, name, seed, retries=1):
+        attempt = self.attempts.get(seed, 0)
+        self.attempts[seed] = attempt + 1
+
+        key = (seed, attempt)
+        with self.runs.lock:
+            first = key not in self.runs.results
+            if first:
+                # Not inside tmpdir/data, where it could be the directory of a testcase named
+                # like the rule, which is cleaned when that testcase is generated.
+                run_cwd = self.problem.tmpdir / 'count_runs' / self.runs.path / f'{seed}-{attempt}'
+                run_cwd.mkdir(parents=True, exist_ok=True)
+                result = super().run(bar, run_cwd, self.runs.name, seed, retries)
+                self.runs.results[key] = (result, run_cwd, name)
+        result, run_cwd, runner = self.runs.results[key]
+        result = copy.copy(result)
+
+        # Clean the directory, but not the meta_ file.
+        for f in cwd.iterdir():
+            if f.name in ['meta_', 'meta_.yaml']:
+                continue
+            if f.is_dir() and not f.is_symlink():
+                shutil.rmtree(f)
+            else:
+                f.unlink()
+
+        if result.ok is not True:
+            if not first:
+                bar.error(f'Failed, see {runner}')
+            return result
+
+        for ext in config.KNOWN_DATA_EXTENSIONS:
+            f = run_cwd / f'{self.index}{ext}'
+            if f.is_file():
+                shutil.copy(f, cwd / (name + ext))
+        return result
+
+
 class VisualizerInvocation(Invocation):
     def __init__(self, problem, string):
         super().__init__(problem, string, allow_absolute=True, allow_relative=False)
@@ -235,13 +314,27 @@ class SolutionInvocation(Invocation):
 class DefaultSolutionInvocation(SolutionInvocation):
     def __init__(self, problem):
         super().__init__(problem, problem.default_solution_path())
+        # Whether the solution was chosen randomly from several accepted submissions, instead
+        # of given with --default_solution or being the only accepted submission.
+        self.random = (
+            not config.args.default_solution
+            and len(glob(problem.path, 'submissions/accepted/*')) > 1
+        )
 
     # Fix the cache_command to prevent regeneration from the random default solution.
     def cache_command(self, seed=None):
         return 'default_solution'
 
 
-KNOWN_TESTCASE_KEYS = ['type', 'input', 'solution', 'visualizer', 'random_salt', 'retries']
+KNOWN_TESTCASE_KEYS = [
+    'type',
+    'input',
+    'solution',
+    'visualizer',
+    'random_salt',
+    'retries',
+    'count',
+]
 RESERVED_TESTCASE_KEYS = ['data', 'testdata.yaml', 'include']
 KNOWN_DIRECTORY_KEYS = [
     'type',
@@ -253,7 +346,7 @@ KNOWN_DIRECTORY_KEYS = [
     'random_salt',
     'retries',
 ]
-RESERVED_DIRECTORY_KEYS = ['input']
+RESERVED_DIRECTORY_KEYS = ['input', 'count']
 KNOWN_ROOT_KEYS = ['generators', 'parallel', 'gitignore_generated']
 
 
@@ -325,7 +418,8 @@ class Rule:
 
 
 class TestcaseRule(Rule):
-    def __init__(self, problem, generator_config, name: str, yaml, parent, listed):
+    # runs_index is a pair (GeneratorRuns, index) for testcases expanded from a count: key.
+    def __init__(self, problem, generator_config, name: str, yaml, parent, listed, runs_index=None):
         assert is_testcase(yaml)
         assert config.COMPILED_FILE_NAME_REGEX.fullmatch(name + '.in')
 
@@ -384,17 +478,22 @@ class TestcaseRule(Rule):
             # leading and trailing whitespace is stripped.
             seed_value = self.config.random_salt + inpt.strip()
             self.seed = int(hashlib.sha512(seed_value.encode('utf-8')).hexdigest(), 16) % (2**31)
-            self.generator = GeneratorInvocation(problem, inpt)
+            if runs_index is None:
+                self.generator = GeneratorInvocation(problem, inpt)
+            else:
+                self.generator = MultiGeneratorInvocation(problem, inpt, *runs_index)
 
+        # The testcases expanded from a count: key share a single rule.
         key = (inpt, self.config.random_salt)
-        if key in generator_config.rules_cache:
-            error(
-                f'Found duplicate rule "{inpt}" at {generator_config.rules_cache[key]} and {self.path}'
-            )
-        generator_config.rules_cache[key] = self.path
+        if runs_index is None or runs_index[1] == 1:
+            if key in generator_config.rules_cache:
+                error(
+                    f'Found duplicate rule "{inpt}" at {generator_config.rules_cache[key]} and {self.path}'
+                )
+            generator_config.rules_cache[key] = self.path
 
-    def generate(t, problem, generator_config, parent_bar):
-        bar = parent_bar.start(str(t.path))
+    def generate(t, problem, generator_config, parent_bar, section=None):
+        bar = parent_bar.start(str(t.path), section=section)
 
         # E.g. bapctmp/problem/data/secret/1.in
         cwd = problem.tmpdir / 'data' / t.path
@@ -408,14 +507,14 @@ class TestcaseRule(Rule):
         target_ansfile = target_dir / (t.name + '.ans')
 
         def add_testdata_to_cache():
-            # Store the generated testdata for deduplication of unlisted manual cases.
-            generator_config.generated_testdata[target_infile.read_text()] = t
+            # Store the digest of the generated testdata for deduplication of unlisted manual cases.
+            generator_config.generated_testdata[problem.file_digest(target_infile)] = t
 
         def deduplicate_unlisted():
             # If this is an unlisted testcase, check if we have already generated a testcase with
             # the same data:
             assert target_infile.is_file()
-            testdata = target_infile.read_text()
+            testdata = problem.file_digest(target_infile)
             if testdata not in generator_config.generated_testdata:
                 return False
             # Make sure that all files that exist both in the manual and generated case are equal.
@@ -431,7 +530,7 @@ class TestcaseRule(Rule):
                 generated = generated_infile.with_suffix(ext)
                 if not (manual.is_file() and generated.is_file()):
                     continue
-                if manual.read_bytes() == generated.read_bytes():
+                if problem.file_digest(manual) == problem.file_digest(generated):
                     continue
                 distinct = manual.name
                 break
@@ -534,29 +633,39 @@ class TestcaseRule(Rule):
         def up_to_date():
             # The testcase is up to date if:
             # - both target infile ans ansfile exist
-            # - meta_ exists with a timestamp newer than the 3 Invocation timestamps (Generator/Submission/Visualizer).
-            # - meta_ exists with a timestamp newer than target infile ans ansfile
-            # - meta_ contains exactly the right content
+            # - meta_ contains exactly the right invocations and hashes of the
+            #   generator/manual source, solution and visualizer
+            # - the hashes of target infile and ansfile equal the hashes stored in meta_
             #
             # Use generate --all to skip this check.
 
-            last_change = 0
             t.cache_data = {}
             if t.manual:
-                last_change = max(last_change, (problem.path / t.source).stat().st_mtime)
                 t.cache_data['source'] = str(t.source)
+                # Inline cases only use the .in, other manual cases copy all related files.
+                source_hashes = []
+                for ext in ['.in'] if t.inline else config.KNOWN_DATA_EXTENSIONS:
+                    f = (problem.path / t.source).with_suffix(ext)
+                    if f.is_file():
+                        source_hashes += [ext, hash_file(f)]
+                t.cache_data['source_hash'] = combine_hashes(source_hashes)
             else:
-                if t.generator.program is not None:
-                    last_change = max(last_change, t.generator.program.timestamp)
                 t.cache_data['generator'] = t.generator.cache_command(seed=t.seed)
+                if t.generator.program is not None:
+                    t.cache_data['generator_hash'] = t.generator.program.hash
             if t.config.solution:
-                if t.config.solution.program is not None:
-                    last_change = max(last_change, t.config.solution.program.timestamp)
                 t.cache_data['solution'] = t.config.solution.cache_command()
+                # A randomly chosen default solution differs between invocations, so its hash
+                # is not stored.
+                solution = t.config.solution
+                if solution.program is not None and not (
+                    isinstance(solution, DefaultSolutionInvocation) and solution.random
+                ):
+                    t.cache_data['solution_hash'] = solution.program.hash
             if t.config.visualizer:
-                if t.config.visualizer.program is not None:
-                    last_change = max(last_change, t.config.visualizer.program.timestamp)
                 t.cache_data['visualizer'] = t.config.visualizer.cache_command()
+                if t.config.visualizer.program is not None:
+                    t.cache_data['visualizer_hash'] = t.config.visualizer.program.hash
 
             if config.args.all:
                 return False
@@ -572,15 +681,47 @@ class TestcaseRule(Rule):
             ):
                 return False
 
-            last_change = max(last_change, target_infile.stat().st_mtime)
-            last_change = max(last_change, target_ansfile.stat().st_mtime)
-
             if not meta_path.is_file():
                 return False
 
             meta_yaml = read_yaml(meta_path)
-            last_generate = meta_path.stat().st_mtime
-            return last_generate >= last_change and meta_yaml == t.cache_data
+            if not isinstance(meta_yaml, dict) or 'files' not in meta_yaml:
+                return False
+            old_files = meta_yaml.pop('files')
+            if meta_yaml != t.cache_data:
+                return False
+
+            files = target_file_hashes(old_files)
+            if any(files[ext][2] != old_files.get(ext, [None] * 3)[2] for ext in files):
+                return False
+            # Only the timestamps changed, e.g. after a git checkout. Store them to skip
+            # hashing the files next time.
+            if files != old_files:
+                write_meta(files)
+            return True
+
+        # Return the [size, mtime, hash] of the target infile and ansfile.
+        # Hashes in old_files are reused when the size and mtime did not change.
+        def target_file_hashes(old_files={}):
+            files = {}
+            for target in [target_infile, target_ansfile]:
+                if not target.is_file():
+                    continue
+                stat = target.stat()
+                old = old_files.get(target.suffix)
+                if old and old[0] == stat.st_size and old[1] == stat.st_mtime_ns:
+                    files[target.suffix] = old
+                else:
+                    files[target.suffix] = [
+                        stat.st_size,
+                        stat.st_mtime_ns,
+                        problem.file_digest(target),
+                    ]
+            return files
+
+        def write_meta(files):
+            with meta_path.open('w') as meta_file:
+                yamllib.dump({**t.cache_data, 'files': files}, meta_file)
 
         if up_to_date():
             check_deterministic()
@@ -747,7 +888,7 @@ class TestcaseRule(Rule):
 
         # Update metadata
         if not skipped:
-            yamllib.dump(t.cache_data, meta_path.open('w'))
+            write_meta(target_file_hashes())
 
         # If the .in was changed but not overwritten, check_deterministic will surely fail.
         if not skipped_in:
@@ -850,12 +991,12 @@ class Directory(Rule):
         if dir_last and dir_f:
             dir_f(self)
 
-    def generate(d, problem, generator_config, bar):
+    def generate(d, problem, generator_config, parent_bar, section=None):
         # Generate the current directory:
         # - create the directory
         # - write testdata.yaml
         # - include linked testcases
-        bar.start(str(d.path))
+        bar = parent_bar.start(str(d.path), section=section)
 
         dir_path = problem.path / 'data' / d.path
         dir_path.mkdir(parents=True, exist_ok=True)
@@ -919,6 +1060,43 @@ def numbered_testcase_name(basename, i, n, existing_prefix=False):
         return number_prefix, ''
 
 
+# Builds programs of one type as tasks of the dependency graph in GeneratorConfig.run, logging
+# to a separate section of the progress bar. The section ends when the last program is built.
+class BuildSection:
+    def __init__(self, bar, prefix):
+        self.bar = bar
+        self.section = bar.add_section(prefix, 0)
+        self.left = 0
+        self.ended = False
+
+    # Add the given programs to the progress bar. Returns a task building each of them.
+    def add(self, programs):
+        with self.bar.lock:
+            self.bar.count += len(programs)
+            for p in programs:
+                self.section.item_width = max(self.section.item_width, ProgressBar.item_len(p) + 1)
+            if self.section.active:
+                self.bar.item_width = self.section.item_width
+            self.left += len(programs)
+        return [lambda p=p: self.build(p) for p in programs]
+
+    def build(self, p):
+        localbar = self.bar.start(p, section=self.section)
+        ok = p.build(localbar)
+        localbar.done()
+        with self.bar.lock:
+            self.left -= 1
+            last = self.left == 0
+        if last:
+            self.end()
+        return ok
+
+    def end(self):
+        if not self.ended:
+            self.ended = True
+            self.bar.end_section(self.section, '')
+
+
 class GeneratorConfig:
     def parse_generators(generators_yaml):
         check_type('Generators', generators_yaml, dict)
@@ -958,8 +1136,8 @@ class GeneratorConfig:
         self.known_directories = set()
         # A set of testcase rules, including seeds.
         self.rules_cache = dict()
-        # The set of generated testcases keyed by testdata.
-        # Used to delete duplicated unlisted manual cases.
+        # The set of generated testcases keyed by the digest of their .in file, see
+        # Problem.file_digest. Used to delete duplicated unlisted manual cases.
         self.generated_testdata = dict()
 
         if yaml_path.is_file():
@@ -985,7 +1163,7 @@ class GeneratorConfig:
                 setattr(self, key, default)
 
         # Main recursive parsing function.
-        def parse(name, yaml, parent, listed=True):
+        def parse(name, yaml, parent, listed=True, runs_index=None):
 
             # Skip unlisted `data/bad` directory: we should not generate .ans files there.
             if name == 'bad' and parent.path == Path('.') and listed is False:
@@ -1006,7 +1184,9 @@ class GeneratorConfig:
                 if not process_testcase(self.problem, parent.path / name):
                     return None
 
-                t = TestcaseRule(self.problem, self, name, yaml, parent, listed=listed)
+                t = TestcaseRule(
+                    self.problem, self, name, yaml, parent, listed=listed, runs_index=runs_index
+                )
                 assert t.path not in self.known_cases
                 self.known_cases.add(t.path)
                 return t
@@ -1048,10 +1228,13 @@ class GeneratorConfig:
                                 fatal(
                                     f'Unnumbered testcases must not have an empty key: {Path("data") / d.path / child_name}/\'\''
                                 )
-                        done.add(child_name)
-                        c = parse(child_name, child_yaml, d, listed=listed)
-                        if c is not None:
-                            d.data.append(c)
+                        for child_name, runs_index in expand_count(child_name, child_yaml, d):
+                            done.add(child_name)
+                            c = parse(
+                                child_name, child_yaml, d, listed=listed, runs_index=runs_index
+                            )
+                            if c is not None:
+                                d.data.append(c)
 
             # Find unlisted testcases and directories.
             dir_path = self.problem.path / 'data' / d.path
@@ -1081,24 +1264,47 @@ class GeneratorConfig:
 
             return d
 
-        self.root_dir = parse('', yaml, RootDirectory())
-
-    def build(self, build_visualizers=True):
-        if config.args.add_manual or config.args.move_manual:
-            return
+        # A testcase with a count: key expands into the testcases <name>-1 up to <name>-<count>,
+        # numbered with the same width. Returns a list of pairs (name, runs_index).
+        def expand_count(name, yaml, parent):
+            if not (isinstance(yaml, dict) and is_testcase(yaml) and 'count' in yaml):
+                return [(name, None)]
+            count = yaml['count']
+            check_type('Count', count, int, parent.path / name)
+            if count < 1:
+                fatal(f'Count must be positive at {parent.path / name}.')
+            runs = GeneratorRuns(name, parent.path / name, count)
+            width = len(str(count))
+            return [(f'{name}-{i:0{width}}', (runs, i)) for i in range(1, count + 1)]
 
-        generators_used = set()
-        solutions_used = set()
-        visualizers_used = set()
+        self.root_dir = parse('', yaml, RootDirectory())
 
-        # Collect all programs that need building.
-        # Also, convert the default submission into an actual Invocation.
+    # Collect all programs that need building.
+    # Also, convert the default submission into an actual Invocation.
+    # Returns a map from each program type to the programs of that type, and a map from each
+    # testcase to the programs it uses.
+    def collect_programs(self, build_visualizers=True):
+        programs = {program.Generator: {}, run.Submission: {}, program.Visualizer: {}}
+        uses = {}
         default_solution = None
 
-        def collect_programs(t):
-            if isinstance(t, TestcaseRule):
-                if not t.manual:
-                    generators_used.add(t.generator.program_path)
+        def add_program(program_type, program_path):
+            if program_path not in programs[program_type]:
+                path = self.problem.path / program_path
+                if program_type is program.Generator and program_path in self.generators:
+                    deps = [Path(self.problem.path) / d for d in self.generators[program_path]]
+                    p = program_type(self.problem, path, deps=deps)
+                elif program_type is run.Submission:
+                    p = program_type(self.problem, path, skip_double_build_warning=True)
+                else:
+                    p = program_type(self.problem, path)
+                programs[program_type][program_path] = p
+            return programs[program_type][program_path]
+
+        def collect(t):
+            uses[t] = []
+            if isinstance(t, TestcaseRule) and not t.manual:
+                uses[t].append(add_program(program.Generator, t.generator.program_path))
             if t.config.solution:
                 if config.args.skip_solution:
                     t.config.solution = None
@@ -1109,59 +1315,107 @@ class GeneratorConfig:
                         if default_solution is None:
                             default_solution = DefaultSolutionInvocation(self.problem)
                         t.config.solution = default_solution
-                    solutions_used.add(t.config.solution.program_path)
+                    uses[t].append(add_program(run.Submission, t.config.solution.program_path))
             if build_visualizers and t.config.visualizer:
-                visualizers_used.add(t.config.visualizer.program_path)
+                uses[t].append(add_program(program.Visualizer, t.config.visualizer.program_path))
 
-        self.root_dir.walk(collect_programs, dir_f=None)
+        self.root_dir.walk(collect, dir_f=None)
+        return programs, uses
 
-        def build_programs(program_type, program_paths):
-            programs = []
-            for program_path in program_paths:
-                path = self.problem.path / program_path
-                deps = None
-                if program_type is program.Generator and program_path in self.generators:
-                    deps = [Path(self.problem.path) / d for d in self.generators[program_path]]
-                    programs.append(program_type(self.problem, path, deps=deps))
-                else:
-                    if program_type is run.Submission:
-                        programs.append(
-                            program_type(self.problem, path, skip_double_build_warning=True)
-                        )
-                    else:
-                        programs.append(program_type(self.problem, path))
+    # Returns tasks building all programs and validators, each type in its own section of bar,
+    # and a map from each testcase to the tasks it depends on.
+    def build_graph(self, bar, build_visualizers=True):
+        programs, uses = self.collect_programs(build_visualizers)
 
-            bar = ProgressBar('Build ' + program_type.subdir, items=programs)
+        tasks = []
+        program_tasks = {}
+        for program_type, type_programs in programs.items():
+            if len(type_programs) == 0:
+                continue
+            type_programs = list(type_programs.values())
+            type_tasks = BuildSection(bar, 'Build ' + program_type.subdir).add(type_programs)
+            program_tasks.update(zip(type_programs, type_tasks))
+            tasks += type_tasks
+
+        # The validators are only known once problem.validators is called, so their
+        # sections are filled by the task building them, which builds them in parallel.
+        def build(section, validators):
+            # Appending is atomic, unlike `ok &= ...` from multiple threads.
+            results = []
+            p = parallel.Parallel(lambda task: results.append(task()))
+            for task in section.add(validators):
+                p.put(task)
+            p.done()
+            return all(results)
 
-            def build_program(p):
-                localbar = bar.start(p)
-                p.build(localbar)
-                localbar.done()
+        validator_tasks = []
+        for validator_type in ['input_format', 'output_format']:
+            section = BuildSection(bar, f'Build {validator_type} validators')
 
-            p = parallel.Parallel(build_program)
-            for pr in programs:
-                p.put(pr)
-            p.done()
+            def build_validators(section=section, validator_type=validator_type):
+                self.problem.validators(
+                    validator_type, build=lambda _, validators: build(section, validators)
+                )
+                section.end()
 
-            bar.finalize(print_done=False)
+            validator_tasks.append(build_validators)
+        tasks += validator_tasks
 
-        # TODO: Consider building all types of programs in parallel as well.
-        build_programs(program.Generator, generators_used)
-        build_programs(run.Submission, solutions_used)
-        build_programs(program.Visualizer, visualizers_used)
+        dependencies = {t: [program_tasks[p] for p in uses[t]] + validator_tasks for t in uses}
+        return tasks, dependencies
 
-        self.problem.validators('input_format')
-        self.problem.validators('output_format')
+    # Drop the solution and visualizer of a testcase when they failed to build.
+    def cleanup_build_failures(self, t, build_visualizers=True):
+        if t.config.solution and t.config.solution.program is None:
+            t.config.solution = None
+        if not build_visualizers or (t.config.visualizer and t.config.visualizer.program is None):
+            t.config.visualizer = None
 
-        def cleanup_build_failures(t):
-            if t.config.solution and t.config.solution.program is None:
-                t.config.solution = None
-            if not build_visualizers or (
-                t.config.visualizer and t.config.visualizer.program is None
-            ):
-                t.config.visualizer = None
+    # Build all programs and validators, without generating testcases.
+    def build(self, build_visualizers=True):
+        if config.args.add_manual or config.args.move_manual:
+            return
+
+        bar = ProgressBar('Build', items=[])
+        tasks, _ = self.build_graph(bar, build_visualizers)
+        parallel.run_graph(lambda task: task(), tasks, {})
+        bar.finalize(print_done=False)
+
+        self.root_dir.walk(lambda t: self.cleanup_build_failures(t, build_visualizers), dir_f=None)
+
+    # Returns all directories and the listed testcases in the order of generators.yaml, and a map
+    # from each of them to the directories and testcases that must be generated first:
+    # - a directory or testcase depends on its parent directory, which creates the directory,
+    # - a directory depends on the testcases it includes, or on the directory that included
+    #   them, which creates the symlinks.
+    def dependency_graph(self):
+        rules = []
+        self.root_dir.walk(
+            lambda t: rules.append(t) if t.listed else None, lambda d: rules.append(d)
+        )
 
-        self.root_dir.walk(cleanup_build_failures, dir_f=None)
+        # Map from the path of each testcase, directory and included testcase to the rules
+        # that create it. A directory is created by the rules of all testcases inside it.
+        producers = {}
+        for r in rules:
+            producers.setdefault(r.path, []).append(r)
+            if isinstance(r, Directory):
+                for include in r.includes:
+                    producers.setdefault(r.path / include.name, []).append(r)
+            else:
+                for parent in r.path.parents:
+                    producers.setdefault(parent, []).append(r)
+
+        dependencies = {}
+        for r in rules:
+            deps = []
+            if isinstance(r.parent, Directory):
+                deps.append(r.parent)
+            if isinstance(r, Directory):
+                for include in r.includes:
+                    deps += [p for p in producers.get(include, []) if p is not r]
+            dependencies[r] = deps
+        return rules, dependencies
 
     def run(self):
 
@@ -1179,46 +1433,51 @@ class GeneratorConfig:
             return
 
         bar = ProgressBar('Generate', items=item_names)
+        print_done = True
 
         if config.args.add_manual:
             self.add_unlisted_to_generators_yaml(bar)
         elif config.args.move_manual:
             self.move_inline_manual_to_directory(bar)
         else:
-            in_parallel = True
-            if self.problem.interactive:
-                in_parallel = False
-                verbose('Disabling parallelization for interactive problem.')
-
             # Testcases are generated in two step:
-            # 1. Generate directories and testcases listed in generators.yaml.
-            #    Each directory is only started after previous directories have
-            #    finished and handled by the main thread, to avoid problems with
-            #    included testcases.
+            # 1. Build all programs, and generate directories and testcases listed in
+            #    generators.yaml. Each program, directory and testcase is started as soon
+            #    as everything it depends on is done, see build_graph and dependency_graph.
+            #    In particular, a testcase only waits for its own generator, solution and
+            #    visualizer, and for the validators.
             # 2. Generate unlisted testcases. These come
             #    after to deduplicate them against generated testcases.
+            builds, build_dependencies = self.build_graph(bar)
+            section = bar.add_section('Generate', max(map(len, map(str, item_names)), default=0))
+
+            def generate_rule(r):
+                if isinstance(r, TestcaseRule):
+                    self.cleanup_build_failures(r)
+                r.generate(self.problem, self, bar, section)
 
             # 1
-            p = parallel.Parallel(
-                lambda t: t.listed and t.generate(self.problem, self, bar), in_parallel
+            rules, dependencies = self.dependency_graph()
+            for r in rules:
+                dependencies[r] += build_dependencies.get(r, [])
+            parallel.run_graph(
+                lambda task: generate_rule(task) if isinstance(task, Rule) else task(),
+                builds + rules,
+                dependencies,
             )
 
-            def generate_dir(d):
-                p.join()
-                d.generate(self.problem, self, bar)
-
-            self.root_dir.walk(p.put, generate_dir)
-            p.done()
-
             # 2
-            p = parallel.Parallel(
-                lambda t: not t.listed and t.generate(self.problem, self, bar), in_parallel
-            )
+            p = parallel.Parallel(lambda t: not t.listed and generate_rule(t))
             # Directories have already been generated so can be skipped now.
             self.root_dir.walk(p.put, None)
             p.done()
 
-        bar.finalize()
+            bar.end_section(section, '')
+            # The lines logged in the section are followed by an empty line already.
+            print_done = not section.logged
+
+        bar.finalize(print_done=print_done)
+        self.problem.save_digests()
 
         self.update_gitignore_file()
 
@@ -1630,7 +1889,6 @@ class GeneratorConfig:
 def generate(problem):
     config = GeneratorConfig(problem)
     if config.ok:
-        config.build()
         config.run()
     return True
 
@@ -1,7 +1,9 @@
+import select
 import signal
 import time
 import subprocess
 import sys
+import threading
 
 import config
 
@@ -14,6 +16,143 @@ if not is_windows():
 BUFFER_SIZE = 2 ** 20
 
 
+# Copies everything read from the file descriptor src to dst in a separate thread, until src
+# is closed or stop() is called. dst is closed afterwards.
+# When log is given, each line is written to log, prefixed with prefix, before it is copied.
+# Lines are written to log at once, so that relays sharing log (and log_lock) never mix up
+# their lines. Data that is not followed by a newline yet is copied immediately, but only
+# logged once the line is complete.
+class Relay:
+    def __init__(self, src, dst, *, log=None, prefix='', log_lock=None):
+        self.src = src
+        self.dst = dst
+        self.log = log
+        self.prefix = prefix
+        self.log_lock = log_lock or threading.Lock()
+        self.stopping = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _write_log(self, data):
+        lines = data.decode('utf-8', 'replace').split('\n')
+        if lines[-1] == '':
+            lines.pop()
+        with self.log_lock:
+            for line in lines:
+                self.log.write(self.prefix + line + '\n')
+            self.log.flush()
+
+    def _run(self):
+        # The start of the current line, when not logged yet.
+        partial = b''
+        try:
+            while not self.stopping:
+                # Check self.stopping regularly.
+                if not select.select([self.src], [], [], 0.1)[0]:
+                    continue
+                data = os.read(self.src, BUFFER_SIZE)
+                if not data:
+                    break
+                if self.log is not None:
+                    end = data.rfind(b'\n') + 1
+                    if end > 0:
+                        self._write_log(partial + data[:end])
+                        partial = data[end:]
+                    else:
+                        partial += data
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self.dst, view) :]
+        except OSError:
+            # The reading program exited.
+            pass
+        finally:
+            if self.log is not None and partial:
+                self._write_log(partial)
+            os.close(self.dst)
+
+    # Wait until src is closed.
+    def join(self):
+        self.thread.join()
+
+    # Stop copying, even when src is not closed yet.
+    def stop(self):
+        self.stopping = True
+        self.thread.join()
+
+
+# Waits for a set of child processes, without affecting other children of this process.
+# This uses a pidfd for each child when supported (Linux 5.3 and Python 3.9), and polls
+# the children otherwise.
+class _Children:
+    def __init__(self):
+        # Map from pid to subprocess.Popen of the children that did not exit yet.
+        self.processes = {}
+        self.pidfds = {}
+        self.poller = select.poll() if hasattr(os, 'pidfd_open') else None
+
+    def add(self, process):
+        pid = process.pid
+        self.processes[pid] = process
+        if self.poller is not None:
+            try:
+                fd = os.pidfd_open(pid)
+            except OSError:
+                # Not supported by the kernel.
+                self.poller = None
+                return
+            self.pidfds[fd] = pid
+            self.poller.register(fd, select.POLLIN)
+
+    # Wait until one of the children exits, or until the time.monotonic() deadline passes.
+    # Returns (pid, status, rusage) of the reaped child, or None at the deadline.
+    def wait(self, deadline):
+        while True:
+            if self.poller is not None:
+                if deadline is None:
+                    timeout = None
+                else:
+                    timeout = max(0, (deadline - time.monotonic()) * 1000)
+                for fd, _ in self.poller.poll(timeout):
+                    pid = self.pidfds.pop(fd)
+                    self.poller.unregister(fd)
+                    os.close(fd)
+                    return self._reap(pid, 0)
+            else:
+                for pid in list(self.processes):
+                    result = self._reap(pid, os.WNOHANG)
+                    if result is not None:
+                        return result
+                time.sleep(0.001)
+            if deadline is not None and time.monotonic() >= deadline:
+                return None
+
+    def _reap(self, pid, options):
+        wpid, status, rusage = os.wait4(pid, options)
+        if wpid == 0:
+            return None
+        # Prevent subprocess from waiting for this pid again, which could reap an unrelated
+        # process that reused the pid.
+        process = self.processes.pop(pid)
+        process.returncode = (
+            os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+        )
+        return pid, status, rusage
+
+    # Kill all children that did not exit yet.
+    def kill(self):
+        for pid in self.processes:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+
+    def close(self):
+        for fd in self.pidfds:
+            os.close(fd)
+        self.pidfds = {}
+
+
 # Return a ExecResult object amended with verdict.
 def run_interactive_testcase(
     run,
@@ -26,7 +165,9 @@ def run_interactive_testcase(
     # True: stdout
     # else: path
     interaction=False,
-    submission_args=None
+    submission_args=None,
+    # The cpu to pin the submission to, see parallel.pinned_core.
+    cpu=None
 ):
 
     output_validators = run.problem.validators('output')
@@ -56,7 +197,7 @@ def run_interactive_testcase(
 
     submission_command = run.submission.run_command
     if submission_args:
-        submission_command += submission_args
+        submission_command = submission_command + submission_args
 
     # Both validator and submission run in their own directory.
     validator_dir = output_validator.tmpdir
@@ -101,6 +242,7 @@ def run_interactive_testcase(
             stderr=team_error,
             cwd=submission_dir,
             timeout=timeout,
+            cpu=cpu,
         )
 
         # Wait
@@ -140,8 +282,9 @@ def run_interactive_testcase(
     # - Update the size to 1MB
     # - Start validator
     # - Start submission, limiting CPU time to timelimit+1s
-    # - Set alarm for timelimit+1s, and kill submission on SIGALRM if needed.
-    # - Wait for either validator or submission to finish
+    # - Wait for either validator or submission to finish, and kill the submission when the
+    #   timeout is reached. Only the children started here are waited for, so that
+    #   interactive runs can run in parallel.
     # - Close first program + write end of pipe + read end of team output if validator exited first with non-AC.
     # - Close remaining program + write end of pipe
     # - Close remaining read end of pipes
@@ -169,35 +312,11 @@ def run_interactive_testcase(
         team_in = val_log_in
 
     if interaction:
-        # Connect pipes with tee.
-        TEE_CODE = R'''
-import sys
-c = sys.argv[1]
-new = True
-while True:
-    l = sys.stdin.read(1)
-    if l=='': break
-    sys.stdout.write(l)
-    sys.stdout.flush()
-    if new: sys.stderr.write(c)
-    sys.stderr.write(l)
-    sys.stderr.flush()
-    new = l=='\n'
-'''
-        team_tee = subprocess.Popen(
-            ['python3', '-c', TEE_CODE, '>'],
-            stdin=team_log_in,
-            stdout=team_log_out,
-            stderr=interaction_file,
-        )
-        team_tee_pid = team_tee.pid
-        val_tee = subprocess.Popen(
-            ['python3', '-c', TEE_CODE, '<'],
-            stdin=val_log_in,
-            stdout=val_log_out,
-            stderr=interaction_file,
-        )
-        val_tee_pid = val_tee.pid
+        # Copy between the submission and validator in this process, logging the interaction.
+        log = interaction_file or sys.stderr
+        log_lock = threading.Lock()
+        team_relay = Relay(team_log_in, team_log_out, log=log, prefix='>', log_lock=log_lock)
+        val_relay = Relay(val_log_in, val_log_out, log=log, prefix='<', log_lock=log_lock)
 
     # Use manual pipes with a large buffer instead of subprocess.PIPE for validator and team output.
     if validator_error is False:
@@ -209,6 +328,7 @@ while True:
     else:
         team_error_in, team_error_out = None, team_error
 
+    tstart = time.monotonic()
     validator = subprocess.Popen(
         validator_command,
         stdin=val_in,
@@ -226,45 +346,38 @@ while True:
         stdout=team_out,
         stderr=team_error_out,
         cwd=submission_dir,
-        preexec_fn=limit_setter(submission_command, timeout, memory_limit),
+        preexec_fn=limit_setter(submission_command, timeout, memory_limit, cpu),
     )
     submission_pid = submission.pid
 
+    children = _Children()
+    children.add(validator)
+    children.add(submission)
+
     # Will be filled in the loop below.
     validator_status = None
     submission_status = None
     submission_time = None
+    submission_rusage = None
+    validator_rusage = None
     first = None
 
     kill_submission = False
 
-    def kill_submission_handler(signal, frame):
-        nonlocal submission_time
-        if not kill_submission:
-            submission_time = timeout
-        submission.kill()
-        try:
-            validator.kill()
-        except ProcessLookupError:
-            # Validator already exited.
-            pass
-        if interaction:
-            team_tee.kill()
-            val_tee.kill()
-
-    signal.signal(signal.SIGALRM, kill_submission_handler)
-
-    # Raise alarm after timeout reached
-    signal.alarm(timeout)
+    # Kill the submission when the timeout is reached.
+    deadline = tstart + timeout
 
     # Wait for first to finish
-    left = 4 if interaction else 2
     first_done = True
-    while left > 0:
-        if kill_submission:
-            # Kill the submission asynchronously.
-            signal.setitimer(signal.ITIMER_REAL, 0.001, 0)
-        pid, status, rusage = os.wait3(0)
+    while children.processes:
+        result = children.wait(deadline)
+        if result is None:
+            if not kill_submission:
+                submission_time = timeout
+            children.kill()
+            deadline = None
+            continue
+        pid, status, rusage = result
 
         # On abnormal exit (e.g. from calling abort() in an assert), we set status to -1.
         status = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -1
@@ -273,49 +386,50 @@ while True:
             if first is None:
                 first = 'validator'
             validator_status = status
+            validator_rusage = rusage
 
             # Close the output stream.
             os.close(val_out)
-            if interaction:
-                os.close(val_log_out)
 
             # Kill the team submission in case we already know it's WA.
             if first_done and validator_status != config.RTV_AC:
                 kill_submission = True
-            left -= 1
+                # Kill the submission after a millisecond.
+                deadline = time.monotonic() + 0.001
             first_done = False
             continue
 
         if pid == submission_pid:
-            signal.alarm(0)
+            deadline = None
             if first is None:
                 first = 'submission'
             submission_status = status
+            submission_rusage = rusage
 
             # Close the output stream.
             os.close(team_out)
-            if interaction:
-                os.close(team_log_out)
 
-            # Possibly already written by the alarm.
+            # Possibly already written at the deadline.
             if submission_time is None:
                 submission_time = rusage.ru_utime + rusage.ru_stime
-            left -= 1
             first_done = False
             continue
 
-        if interaction:
-            if pid == team_tee_pid or pid == val_tee_pid:
-                left -= 1
-                first_done = False
-                continue
+    children.close()
+
+    tend = time.monotonic()
 
     os.close(val_in)
-    if interaction:
-        os.close(val_log_in)
     os.close(team_in)
     if interaction:
+        # The relays stop once both programs closed their output. Closing the input of the
+        # programs above stops relays that are blocked on a full pipe.
+        team_relay.join()
+        val_relay.join()
+        os.close(val_log_in)
         os.close(team_log_in)
+        if interaction_file is not None:
+            interaction_file.close()
 
     did_timeout = submission_time > timelimit
     aborted = submission_time >= timeout
@@ -370,4 +484,9 @@ while True:
     elif team_error is not None:
         team_err = submission.stderr.read().decode('utf-8', 'replace')
 
-    return ExecResult(True, submission_time, val_err, team_err, verdict, print_verdict)
+    result = ExecResult(True, submission_time, val_err, team_err, verdict, print_verdict)
+    result.returncode = submission_status
+    result.wall_time = tend - tstart
+    result.peak_rss = peak_rss(submission_rusage)
+    result.validator_time = validator_rusage.ru_utime + validator_rusage.ru_stime
+    return result
@@ -1,23 +1,125 @@
 #!/usr/bin/env python3
-import queue
+import bisect
+import contextlib
+import heapq
+import os
 import threading
 import signal
+import time
+
+from pathlib import Path
 
 import config
 import util
 
 
+# The amount of physical memory in MB, or None when it can not be determined.
+def _physical_memory():
+    try:
+        return os.sysconf('SC_PHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+# The amount of memory in MB that may be claimed by the tasks of each Parallel.
+memory_budget = _physical_memory()
+
+
+# The logical cpus this process may use, grouped by physical core.
+def _physical_cores():
+    cores = {}
+    for cpu in sorted(os.sched_getaffinity(0)):
+        try:
+            siblings_path = Path(f'/sys/devices/system/cpu/cpu{cpu}/topology/thread_siblings_list')
+            siblings = siblings_path.read_text().strip()
+        except OSError:
+            siblings = str(cpu)
+        cores.setdefault(siblings, []).append(cpu)
+    return list(cores.values())
+
+
+# The logical cpus that runs are pinned to with --pin-cores.
+# Each cpu is used by at most one run at a time. The first logical cpu of each physical core
+# is handed out before any of its SMT siblings. With --no-smt, the siblings are never used.
+class CorePool:
+    def __init__(self, no_smt):
+        cores = _physical_cores()
+        if no_smt:
+            cores = [core[:1] for core in cores]
+        depth = max(len(core) for core in cores)
+        self.cpus = [core[i] for i in range(depth) for core in cores if i < len(core)]
+        # Indices into self.cpus of the free cpus, in order of preference.
+        self.free = list(range(len(self.cpus)))
+        self.cv = threading.Condition()
+
+    # Claim a free cpu, waiting for one when all are in use.
+    @contextlib.contextmanager
+    def claim(self):
+        with self.cv:
+            while not self.free:
+                self.cv.wait()
+            index = self.free.pop(0)
+        try:
+            yield self.cpus[index]
+        finally:
+            with self.cv:
+                bisect.insort(self.free, index)
+                self.cv.notify()
+
+
+_core_pool = None
+_core_pool_lock = threading.Lock()
+
+
+# Context manager that claims a cpu to pin a run to with --pin-cores, or yields None.
+def pinned_core():
+    global _core_pool
+    if not config.args.pin_cores and not config.args.no_smt:
+        return contextlib.nullcontext()
+    with _core_pool_lock:
+        if _core_pool is None:
+            if not hasattr(os, 'sched_setaffinity'):
+                util.warn('--pin-cores is not supported on this platform.')
+                config.args.pin_cores = config.args.no_smt = False
+                return contextlib.nullcontext()
+            _core_pool = CorePool(config.args.no_smt)
+    return _core_pool.claim()
+
+
 class Parallel:
     # f(task): the function to run on each queue item.
     # num_threads: True: the configured default
     #              None/False/0: disable parallelization
+    #
+    # Each task declares the number of cpus and the amount of memory (in MB) it needs.
+    # A task is only started when enough cpus (out of num_threads) and memory (out of the
+    # physical memory) are available. Tasks with a higher priority are started first, and
+    # tasks with equal priority are started in the order they were added.
     def __init__(self, f, num_threads=True):
-        self.q = queue.Queue()
-        self.error = None
         self.f = f
+        self.error = None
         self.stopping = False
+        self.finishing = False
 
         self.num_threads = config.args.jobs if num_threads is True else num_threads
+        self.memory_budget = memory_budget
+
+        # Heap of (-priority, index, cpus, memory, task) of tasks that were not started yet.
+        self.tasks = []
+        self.index = 0
+        self.cv = threading.Condition()
+        # Number of running tasks and the resources they claimed.
+        self.running = 0
+        self.cpus = 0
+        self.memory = 0
+
+        # Metrics, see metrics().
+        self.start_time = time.monotonic()
+        self.num_tasks = 0
+        self.max_queue_depth = 0
+        self.max_memory = 0
+        self.cpu_time = 0
+        self.last_update = self.start_time
 
         if self.num_threads:
             self.threads = []
@@ -26,38 +128,92 @@ class Parallel:
                 t.start()
                 self.threads.append(t)
 
-            signal.signal(signal.SIGINT, self._interrupt_handler)
+            # Signal handlers can only be set from the main thread, e.g. not for a Parallel
+            # started by a task of another Parallel.
+            if threading.current_thread() is threading.main_thread():
+                signal.signal(signal.SIGINT, self._interrupt_handler)
+
+    # Accumulate the cpu time claimed since the last change. Must hold self.cv.
+    def _update_cpu_time(self):
+        now = time.monotonic()
+        self.cpu_time += self.cpus * (now - self.last_update)
+        self.last_update = now
+
+    # Pop the next task when its resources are available. Must hold self.cv.
+    def _admit(self):
+        if not self.tasks:
+            return None
+        _, _, cpus, memory, task = self.tasks[0]
+        if self.running > 0:
+            if self.cpus + cpus > self.num_threads:
+                return None
+            if self.memory_budget is not None and self.memory + memory > self.memory_budget:
+                return None
+        heapq.heappop(self.tasks)
+        self._update_cpu_time()
+        self.running += 1
+        self.cpus += cpus
+        self.memory += memory
+        self.max_memory = max(self.max_memory, self.memory)
+        return (task, cpus, memory)
 
     def _worker(self):
-        try:
-            while not self.stopping:
-                task = self.q.get()
-                if task is None:
-                    break
+        while True:
+            with self.cv:
+                while True:
+                    if self.stopping:
+                        return
+                    admitted = self._admit()
+                    if admitted is not None:
+                        break
+                    if self.finishing and not self.tasks:
+                        return
+                    self.cv.wait()
+
+            task, cpus, memory = admitted
+            try:
                 self.f(task)
-                self.q.task_done()
-        except Exception as e:
-            self.stop()
-            if not self.error:
-                self.error = e
+            except Exception as e:
+                self.stop()
+                if not self.error:
+                    self.error = e
+            finally:
+                with self.cv:
+                    self._update_cpu_time()
+                    self.running -= 1
+                    self.cpus -= cpus
+                    self.memory -= memory
+                    self.cv.notify_all()
 
     def _interrupt_handler(self, sig, frame):
         util.fatal('Running interrupted')
 
     # Add one task.
-    def put(self, task):
+    # priority: tasks with a higher priority are started first.
+    # cpus: the number of cpus used by the task, e.g. 2 for interactive runs.
+    # memory: the amount of memory in MB the task may use, or None when unknown.
+    def put(self, task, *, priority=0, cpus=1, memory=None):
         if self.stopping:
             return
 
+        self.num_tasks += 1
         if self.num_threads:
-            self.q.put(task)
+            with self.cv:
+                cpus = min(cpus, self.num_threads)
+                heapq.heappush(self.tasks, (-priority, self.index, cpus, memory or 0, task))
+                self.index += 1
+                self.max_queue_depth = max(self.max_queue_depth, len(self.tasks))
+                self.cv.notify()
         else:
             self.f(task)
 
     def join(self):
         if self.error:
             raise self.error
-        self.q.join()
+        if self.num_threads:
+            with self.cv:
+                while (self.tasks and not self.stopping) or self.running:
+                    self.cv.wait()
         if self.error:
             raise self.error
 
@@ -66,8 +222,9 @@ class Parallel:
         if not self.num_threads:
             return
 
-        for _ in range(self.num_threads):
-            self.q.put(None)
+        with self.cv:
+            self.finishing = True
+            self.cv.notify_all()
 
         for t in self.threads:
             t.join()
@@ -86,10 +243,63 @@ class Parallel:
         if not self.num_threads:
             return
 
-        try:
-            while True:
-                self.q.get(block=False)
-        except queue.Empty:
-            pass
-        for _ in range(self.num_threads):
-            self.q.put(None)
+        with self.cv:
+            self.tasks = []
+            self.cv.notify_all()
+
+    # Statistics of the tasks run so far:
+    # - tasks: the number of tasks,
+    # - queue_depth: the current and maximum number of tasks waiting to be started,
+    # - utilization: the average fraction of cpus claimed by running tasks,
+    # - memory: the maximum amount of memory claimed at the same time, in MB.
+    def metrics(self):
+        with self.cv:
+            self._update_cpu_time()
+            wall_time = self.last_update - self.start_time
+            return {
+                'tasks': self.num_tasks,
+                'queue_depth': (len(self.tasks), self.max_queue_depth),
+                'utilization': (
+                    self.cpu_time / (wall_time * self.num_threads)
+                    if self.num_threads and wall_time > 0
+                    else 0
+                ),
+                'memory': self.max_memory,
+            }
+
+
+# Run f on each of the given tasks in parallel, starting each task only once all tasks it
+# depends on are done. dependencies maps a task to the list of tasks it depends on, which must
+# all be in tasks, and must not contain cycles. Of the tasks that can be started, the one that
+# comes first in tasks is started first.
+def run_graph(f, tasks, dependencies, num_threads=True):
+    index = {task: i for i, task in enumerate(tasks)}
+    # The number of dependencies of each task that are not done yet.
+    waiting = {task: len(dependencies.get(task, [])) for task in tasks}
+    dependents = {task: [] for task in tasks}
+    for task in tasks:
+        for dependency in dependencies.get(task, []):
+            dependents[dependency].append(task)
+    lock = threading.Lock()
+
+    def run(task):
+        # When f raises, the dependents are never started.
+        f(task)
+        # Start the dependents that are now ready. This happens before this task is
+        # marked as done, so that join() below does not return early.
+        ready = []
+        with lock:
+            for dependent in dependents[task]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    ready.append(dependent)
+        for dependent in ready:
+            p.put(dependent, priority=-index[dependent])
+
+    # Without threads, put() runs tasks directly, so find the initial tasks first.
+    initial = [task for task in tasks if waiting[task] == 0]
+    p = Parallel(run, num_threads)
+    for task in initial:
+        p.put(task, priority=-index[task])
+    p.join()
+    p.done()
@@ -2,9 +2,13 @@ import re
 import glob
 import argparse
 import hashlib
+import math
 import random
 import shlex
+import statistics
 import sys
+import threading
+import yaml as yamllib
 
 from pathlib import Path
 
@@ -39,6 +43,9 @@ class Problem:
         self._program_callbacks = dict()
         # Dictionary from path to parsed file contents.
         self._testdata_yamls = dict()
+        # Digests of testcase files, see file_digest.
+        self._digests = None
+        self._digests_lock = threading.Lock()
 
         # The label for the problem: A, B, A1, A2, X, ...
         self.label = label
@@ -280,7 +287,9 @@ class Problem:
     # If check_constraints is True, this chooses the first validator that matches
     # contains 'constraints_file' in its source.
     # _validators maps from input/output to the list of validators.
-    def validators(problem, validator_type, check_constraints=False):
+    # build(validator_type, validators) builds the validators and returns whether all of them
+    # built. By default, they are built in parallel in a separate ProgressBar.
+    def validators(problem, validator_type, check_constraints=False, *, build=None):
         assert validator_type in ['input_format', 'output_format', 'output']
 
         # For custom validation, treat 'output' and 'output_format' validators the same.
@@ -298,14 +307,7 @@ class Problem:
                     problem, config.tools_root / 'support' / 'default_output_validator.cpp'
                 )
             ]
-            bar = ProgressBar(f'Build {validator_type} validators', items=validators)
-            ok = True
-            for p in validators:
-                bar.start(p)
-                ok &= p.build(bar)
-                bar.done()
-            bar.finalize(print_done=False)
-            if not ok:
+            if not (build or Problem._build_validators)(validator_type, validators):
                 validators = False
             problem._validators[key] = validators
             return validators
@@ -382,13 +384,22 @@ class Problem:
                 for path in paths
             ]
 
+        # All validators must build.
+        if not (build or Problem._build_validators)(validator_type, validators):
+            validators = False
+
+        problem._validators[key] = validators
+        return validators
+
+    @staticmethod
+    def _build_validators(validator_type, validators):
         bar = ProgressBar(f'Build {validator_type} validators', items=validators)
-        ok = True
+        # Appending is atomic, unlike `ok &= ...` from multiple threads.
+        results = []
 
         def build_program(p):
-            nonlocal ok
             localbar = bar.start(p)
-            ok &= p.build(localbar)
+            results.append(p.build(localbar))
             localbar.done()
 
         p = parallel.Parallel(build_program)
@@ -397,13 +408,7 @@ class Problem:
         p.done()
 
         bar.finalize(print_done=False)
-
-        # All validators must build.
-        if not ok:
-            validators = False
-
-        problem._validators[key] = validators
-        return validators
+        return all(results)
 
     def run_submissions(problem):
         needans = False if problem.interactive else True
@@ -427,25 +432,98 @@ class Problem:
         if problem.validators('output') is False:
             return False
 
-        ok = True
+        submission_list = [s for verdict in submissions for s in submissions[verdict]]
+
+        # All runs of all submissions share a single queue, so that workers do not
+        # sit idle while the last runs of each submission finish.
+        # Each submission prints its results in a separate section of the bar.
+        bar = ProgressBar(
+            'Running',
+            count=len(testcases) * len(submission_list),
+            max_len=max(len(t.name) for t in testcases),
+            # When true, the ProgressBar will print a newline before the first error log.
+            needs_leading_newline=False if config.args.verbose else True,
+        )
+        p = parallel.Parallel(lambda run: run.submission.process_run(run, bar))
+
         verdict_table = []
-        # When true, the ProgressBar will print a newline before the first error log.
-        needs_leading_newline = False if config.args.verbose else True
-        for verdict in submissions:
-            for submission in submissions[verdict]:
-                d = dict()
-                verdict_table.append(d)
-                submission_ok, printed_newline = submission.run_all_testcases(
-                    max_submission_len, table_dict=d, needs_leading_newline=needs_leading_newline
-                )
-                needs_leading_newline = not printed_newline
-                ok &= submission_ok
+        for submission in submission_list:
+            d = dict()
+            verdict_table.append(d)
+            submission.run_all_testcases(testcases, p, bar, max_submission_len, table_dict=d)
+
+        p.done()
+        bar.finalize(print_done=False)
+
+        if config.args.verbose >= 2:
+            metrics = p.metrics()
+            log(
+                f'{metrics["tasks"]} runs, max queue depth {metrics["queue_depth"][1]}, '
+                f'cpu utilization {metrics["utilization"]:.0%}, max reserved memory {metrics["memory"]}MB'
+            )
+
+        ok = all(s.verdict in s.expected_verdicts for s in submission_list)
 
         if config.args.table:
             Problem._print_table(verdict_table, testcases, submissions)
 
+        if config.args.repeat:
+            problem._suggest_timelimit(submission_list)
+
         return ok
 
+    # Suggest a timelimit from the durations measured with --repeat: TIMELIMIT_AC_FACTOR
+    # times the p95 duration of the slowest testcase of any accepted submission. This is
+    # checked against the median duration of the fastest time limit exceeded submission.
+    def _suggest_timelimit(problem, submission_list):
+        slowest_ac = None
+        fastest_tle = None
+        for submission in submission_list:
+            if not submission.durations:
+                continue
+            if submission.expected_verdicts == ['ACCEPTED'] and submission.verdict == 'ACCEPTED':
+                for name, durations in submission.durations.items():
+                    p95 = run.duration_statistics(durations)['p95']
+                    if slowest_ac is None or p95 > slowest_ac[0]:
+                        slowest_ac = (p95, submission.name, name)
+            if (
+                submission.expected_verdicts == ['TIME_LIMIT_EXCEEDED']
+                and submission.verdict == 'TIME_LIMIT_EXCEEDED'
+            ):
+                name, durations = max(
+                    submission.durations.items(), key=lambda item: statistics.median(item[1])
+                )
+                median = statistics.median(durations)
+                if fastest_tle is None or median < fastest_tle[0]:
+                    fastest_tle = (median, submission.name, name)
+
+        if slowest_ac is None:
+            warn('No accepted submissions were run. Cannot suggest a timelimit.')
+            return
+
+        timelimit = math.ceil(config.TIMELIMIT_AC_FACTOR * slowest_ac[0] * 10) / 10
+        print(file=sys.stderr)
+        print(
+            f'Slowest accepted:            {slowest_ac[0]:6.3f}s {slowest_ac[1]} @ {slowest_ac[2]} (p95)',
+            file=sys.stderr,
+        )
+        if fastest_tle is not None:
+            # Aborted submissions were stopped at the timeout and may be even slower.
+            at_least = '>=' if fastest_tle[0] >= problem.settings.timeout else '  '
+            print(
+                f'Fastest time limit exceeded: {fastest_tle[0]:6.3f}s{at_least} {fastest_tle[1]} @ {fastest_tle[2]} (median)',
+                file=sys.stderr,
+            )
+        print(
+            f'{Style.BRIGHT}Suggested timelimit:         {timelimit:6.1f}s{Style.RESET_ALL} '
+            f'({config.TIMELIMIT_AC_FACTOR} x slowest accepted, current: {problem.settings.timelimit}s)',
+            file=sys.stderr,
+        )
+        if fastest_tle is not None and fastest_tle[0] <= timelimit:
+            warn(
+                f'{fastest_tle[1]} takes {fastest_tle[0]:.3f}s on {fastest_tle[2]} and would pass the suggested timelimit.'
+            )
+
     # Takes a list of submissions and runs them against the chosen testcases.
     # Instead of validating the output, this function just prints all output to the
     # terminal.
@@ -528,17 +606,92 @@ class Problem:
                 print(str.format('(Type {})', resultant_id[resultant]), end='', file=sys.stderr)
             print(end='\n', file=sys.stderr)
 
+    # The sha256 digest of the file at path, or with tokens=True of its whitespace separated
+    # tokens (see hash_file_tokens). Digests are stored in ~tmp/<problem>/digests.yaml by
+    # save_digests, and reused as long as the size and modification time of the file did not
+    # change. Safe to call from multiple threads.
+    def file_digest(self, path, tokens=False):
+        key = str(path.resolve())
+        kind = 'tokens' if tokens else 'sha256'
+        stat = path.stat()
+        with self._digests_lock:
+            if self._digests is None:
+                self._digests = {}
+                digests_path = self.tmpdir / 'digests.yaml'
+                if digests_path.is_file():
+                    try:
+                        data = yamllib.safe_load(digests_path.read_text())
+                        if isinstance(data, dict):
+                            self._digests = data
+                    except (OSError, yamllib.YAMLError):
+                        pass
+            entry = self._digests.get(key)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime_ns:
+                entry = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+                self._digests[key] = entry
+            if kind in entry:
+                return entry[kind]
+
+        # Hash outside the lock, so that other threads can hash other files meanwhile.
+        digest = hash_file_tokens(path) if tokens else hash_file(path)
+        with self._digests_lock:
+            entry[kind] = digest
+        return digest
+
+    # Store the digests computed by file_digest, for use by the next invocation.
+    def save_digests(self):
+        with self._digests_lock:
+            if self._digests is None:
+                return
+            # Drop entries of files that were removed.
+            digests = {key: entry for key, entry in self._digests.items() if Path(key).is_file()}
+            digests_path = self.tmpdir / 'digests.yaml'
+            try:
+                digests_path.parent.mkdir(parents=True, exist_ok=True)
+                # Write to a temporary file first, so that concurrent invocations never read a
+                # partial file.
+                tmp_path = digests_path.with_suffix('.yaml_')
+                tmp_path.write_text(yamllib.dump(digests))
+                tmp_path.replace(digests_path)
+            except OSError:
+                pass
+
     def reset_testcase_hashes(self):
+        # Map from the size of the .in file to a map from its digest to the testcase.
+        # The first testcase of each size is stored under None, and is only hashed once a
+        # second testcase of the same size is found.
         self._testcase_hashes = {}
+        # Map from the digest of the tokens of the .in file to the testcase.
+        self._testcase_token_hashes = {}
 
     # Returns None for new testcases or the Testcase object it equals.
+    # Only the sizes and digests of the testcases are stored, so that memory usage does not
+    # depend on the size of the testcases.
     def matches_existing_testcase(self, t):
         if t.bad_input or t.bad_output:
             return None
-        d = t.in_path.read_text()
-        if d in self._testcase_hashes:
-            return self._testcase_hashes[d]
-        self._testcase_hashes[d] = t
+        testcases = self._testcase_hashes.setdefault(t.in_path.stat().st_size, {})
+        if not testcases:
+            testcases[None] = t
+            return None
+        if None in testcases:
+            first = testcases.pop(None)
+            testcases[self.file_digest(first.in_path)] = first
+        digest = self.file_digest(t.in_path)
+        if digest in testcases:
+            return testcases[digest]
+        testcases[digest] = t
+        return None
+
+    # Returns None or an earlier testcase whose .in file has the same tokens as the .in file of
+    # the given testcase, i.e. only differs in whitespace. Used with --near-duplicates.
+    def matches_existing_testcase_tokens(self, t):
+        if t.bad_input or t.bad_output:
+            return None
+        digest = self.file_digest(t.in_path, tokens=True)
+        if digest in self._testcase_token_hashes:
+            return self._testcase_token_hashes[digest]
+        self._testcase_token_hashes[digest] = t
         return None
 
     # Validate the format of the input or output files.
@@ -573,22 +726,60 @@ class Problem:
 
         problem.reset_testcase_hashes()
 
+        # Find duplicate testcases first, in the order of the testcases.
+        duplicates = {}
+        near_duplicates = {}
+        if validator_type == 'input_format':
+            for testcase in testcases:
+                if testcase.included:
+                    continue
+                t2 = problem.matches_existing_testcase(testcase)
+                if t2 is not None:
+                    duplicates[testcase] = t2
+                elif config.args.near_duplicates:
+                    t2 = problem.matches_existing_testcase_tokens(testcase)
+                    if t2 is not None:
+                        near_duplicates[testcase] = t2
+
+        # The result and the constraints found for each testcase. The constraints are merged
+        # in the order of the testcases afterwards, so that the result does not depend on the
+        # order in which the testcases are validated.
+        results = {}
+        testcase_constraints = {}
+
         # validate the testcases
         bar = ProgressBar(action, items=[t.name for t in testcases])
-        for testcase in testcases:
-            bar.start(testcase.name)
 
-            if validator_type == 'input_format' and not testcase.included:
-                t2 = problem.matches_existing_testcase(testcase)
-                if t2 is not None:
-                    bar.error(f'Duplicate testcase: identical to {t2.name}')
-                    ok = False
-                    continue
+        def validate_testcase(testcase):
+            localbar = bar.start(testcase.name)
+            if testcase in duplicates:
+                localbar.error(f'Duplicate testcase: identical to {duplicates[testcase].name}')
+                return
+            if testcase in near_duplicates:
+                localbar.warn(
+                    f'Testcase only differs in whitespace from {near_duplicates[testcase].name}'
+                )
+
+            local_constraints = None if constraints is None else {}
+            results[testcase] = testcase.validate_format(
+                validator_type, bar=localbar, constraints=local_constraints
+            )
+            testcase_constraints[testcase] = local_constraints
+            localbar.done()
+
+        p = parallel.Parallel(validate_testcase)
+        for testcase in testcases:
+            p.put(testcase)
+        p.done()
 
-            success &= testcase.validate_format(validator_type, bar=bar, constraints=constraints)
-            bar.done()
+        success = all(results.values())
+        if constraints is not None:
+            for testcase in testcases:
+                if testcase_constraints.get(testcase):
+                    validate.merge_constraints(constraints, testcase_constraints[testcase])
 
         bar.finalize(print_done=True)
+        problem.save_digests()
 
         # Make sure all constraints are satisfied.
         if constraints:
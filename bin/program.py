@@ -2,8 +2,11 @@ import re
 import shutil
 import stat
 import subprocess
+import tempfile
 import threading
 
+import cache
+import zygote
 from util import *
 from colorama import Fore
 
@@ -28,6 +31,10 @@ manual:
     run: '{run}'
 '''
 
+# The maximum duration in seconds of the training run that creates a class data sharing
+# archive, see Program._add_cds_archive.
+CDS_TRAINING_TIMEOUT = 5
+
 # The cached languages.yaml for the current contest.
 _languages = None
 _languages_lock = threading.Lock()
@@ -79,6 +86,7 @@ def languages():
 #
 # After build() has been called, the following are available:
 # - run_command:    command to be executed. E.g. ['/path/to/run'] or ['python3', '/path/to/main.py']. `None` if something failed.
+# - hash:           hash of the source files and the compile and run commands.
 #
 # build() will return the (run_command, message) pair.
 class Program:
@@ -124,6 +132,10 @@ class Program:
         self.compile_command = None
         self.check_constraints = check_constraints
         self.run_command = None
+        # The class data sharing archive used by the run command, see _add_cds_archive.
+        self.cds_archive = None
+        self.zygote = None
+        self.hash = None
         self.timestamp = None
         self.env = {}
 
@@ -346,6 +358,11 @@ class Program:
         if not self.compile_command:
             return True
 
+        if not config.args.force_build and cache.restore(self):
+            self.bar.debug('Restored from build cache')
+            meta_path.write_text(' '.join(self.compile_command))
+            return True
+
         try:
             ret = exec_command(
                 self.compile_command,
@@ -370,6 +387,7 @@ class Program:
             self.bar.error('Failed', data)
             return False
 
+        cache.store(self)
         meta_path.write_text(' '.join(self.compile_command))
         return True
 
@@ -424,6 +442,17 @@ class Program:
         self.compile_command = compile_command.format(**self.env).split()
         run_command = lang_config['run']
         self.run_command = run_command.format(**self.env).split()
+        self.zygote = zygote.Zygote(self)
+
+        # A hash of everything that determines the build: the sources and the compile and
+        # run commands. The build directory is replaced by a placeholder, so that the same
+        # program in a different location has the same hash.
+        hashes = []
+        for f in self.source_files:
+            hashes += [f.name, hash_path(f)]
+        for command in [self.compile_command, self.run_command]:
+            hashes.append(' '.join(command).replace(str(self.tmpdir), '{path}'))
+        self.hash = combine_hashes(hashes)
 
         # Compare the latest source timestamp (self.timestamp) to the last build.
         up_to_date = (
@@ -436,11 +465,92 @@ class Program:
             if not self._compile():
                 return False
 
+        self._add_cds_archive()
+
         if self.path in self.problem._program_callbacks:
             for c in self.problem._program_callbacks[self.path]:
                 c(self)
         return True
 
+    # For programs running on the JVM, create a class data sharing archive of the classes
+    # loaded by a training run of the program with empty stdin, and use it in the run command.
+    # This saves part of the JVM startup time of every run. The archive is removed by
+    # _compile() together with the other build artefacts.
+    def _add_cds_archive(self):
+        if config.args.no_cds or self.language not in ['java', 'kotlin']:
+            return
+
+        archive = self.tmpdir / 'app.jsa'
+        failed_path = self.tmpdir / 'app.jsa.failed_'
+        # JVM options are passed through the kotlin launcher with -J.
+        prefix = '-J' if self.language == 'kotlin' else ''
+
+        def with_options(*options):
+            return self.run_command[:1] + [prefix + o for o in options] + self.run_command[1:]
+
+        if not archive.is_file():
+            if failed_path.is_file():
+                return
+            # The archive is written when the JVM exits, also when the program fails. Write it
+            # to a temporary file, so that an archive cut off by the timeout is never used.
+            # The training run happens in a scratch directory, so that files written by the
+            # program do not end up in the build directory.
+            tmp_path = self.tmpdir / 'app.jsa.tmp_'
+            with open(os.devnull) as stdin, tempfile.TemporaryDirectory(
+                prefix='bapctools_cds_'
+            ) as cwd:
+                ret = exec_command(
+                    with_options(f'-XX:ArchiveClassesAtExit={tmp_path}'),
+                    stdin=stdin,
+                    cwd=cwd,
+                    timeout=CDS_TRAINING_TIMEOUT,
+                )
+            if ret.ok == -9:
+                self.bar.warn(
+                    f'Training run for class data sharing took more than {CDS_TRAINING_TIMEOUT}s'
+                )
+            if ret.ok != -9 and tmp_path.is_file():
+                tmp_path.rename(archive)
+            else:
+                # E.g. Java before version 13, which does not support dynamic archives.
+                self.bar.debug('Could not create a class data sharing archive')
+                if tmp_path.is_file():
+                    tmp_path.unlink()
+                failed_path.write_text('')
+                return
+
+        # A JVM that can not use the archive, e.g. after an update, silently ignores it.
+        self.run_command = with_options(f'-XX:SharedArchiveFile={archive}', '-Xlog:cds*=off')
+        self.cds_archive = archive
+
+    # Run self.run_command + args like exec_command, reading stdin from stdin_path when given,
+    # and writing stdout to stdout_path when given (otherwise, stdout is returned).
+    # Python programs are run in a forked copy of a warm interpreter, see bin/zygote.py.
+    # This must not be used for submissions.
+    # Returns ExecResult.
+    def _exec(self, args, *, cwd, timeout, expect=0, stdin_path=None, stdout_path=None):
+        assert self.run_command is not None
+        result = self.zygote.run(
+            args,
+            cwd=cwd,
+            timeout=timeout,
+            expect=expect,
+            stdin_path=stdin_path,
+            stdout_path=stdout_path,
+        )
+        if result is not None:
+            return result
+
+        with contextlib.ExitStack() as stack:
+            kwargs = {}
+            if stdin_path is not None:
+                kwargs['stdin'] = stack.enter_context(stdin_path.open())
+            if stdout_path is not None:
+                kwargs['stdout'] = stack.enter_context(stdout_path.open('w'))
+            return exec_command(
+                self.run_command + args, expect=expect, timeout=timeout, cwd=cwd, **kwargs
+            )
+
     @staticmethod
     def add_callback(problem, path, c):
         if path not in problem._program_callbacks:
@@ -453,8 +563,10 @@ class Generator(Program):
 
     # Run the generator in the given working directory.
     # May write files in |cwd| and stdout is piped to {name}.in if it's not written already.
+    # When count is given, the generator must write 1.in up to {count}.in instead, and stdout
+    # is ignored. See the count: key in generators.yaml.
     # Returns ExecResult. Success when result.ok is True.
-    def run(self, bar, cwd, name, args=[]):
+    def run(self, bar, cwd, name, args=[], count=None):
         assert self.run_command is not None
 
         in_path = cwd / (name + '.in')
@@ -471,10 +583,7 @@ class Generator(Program):
 
         timeout = config.get_timeout()
 
-        with stdout_path.open('w') as stdout_file:
-            result = exec_command(
-                self.run_command + args, stdout=stdout_file, timeout=timeout, cwd=cwd
-            )
+        result = self._exec(args, cwd=cwd, timeout=timeout, stdout_path=stdout_path)
 
         result.retry = False
 
@@ -488,6 +597,14 @@ class Generator(Program):
             result.retry = True
             return result
 
+        if count is not None:
+            for i in range(1, count + 1):
+                if not (cwd / f'{i}.in').is_file():
+                    bar.log(f'Did not write {i}.in!', color=Fore.RED)
+                    result.ok = False
+                    return result
+            return result
+
         if stdout_path.read_text():
             if in_path.is_file():
                 bar.warn(f'Generator wrote to both {name}.in and stdout. Ignoring stdout.')
@@ -508,5 +625,4 @@ class Visualizer(Program):
     # Run the visualizer.
     # Stdin and stdout are not used.
     def run(self, cwd, args=[]):
-        assert self.run_command is not None
-        return exec_command(self.run_command + args, timeout=config.get_timeout(), cwd=cwd)
+        return self._exec(args, cwd=cwd, timeout=config.get_timeout())
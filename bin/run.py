@@ -1,7 +1,14 @@
+import json
+import math
 import os
+import statistics
 import sys
+import threading
+import yaml as yamllib
 
+import cache
 import config
+import default_output_validator
 import validate
 import program
 import interactive
@@ -10,30 +17,136 @@ import parallel
 from util import *
 from colorama import Fore, Style
 
+# The sanity checks of testcases work on chunks of memory-mapped files, using bytes.translate
+# to handle a chunk at once, so that large testcases are never read into memory completely.
+_SANITY_CHECK_CHUNK_SIZE = 1 << 24
+
+# Testcase input is only allowed to contain newlines and printable characters.
+_VALID_INPUT_BYTES = b'\n' + bytes(range(0x20, 0x7F))
+# User output is additionally allowed to contain all other types of whitespaces.
+_VALID_OUTPUT_BYTES = _VALID_INPUT_BYTES + b'\t\r\v\f'
+# Maps newlines to spaces, to find consecutive whitespace with a single search.
+_NEWLINE_TO_SPACE = bytes.maketrans(b'\n', b' ')
+
+
+# The offset and value of the first byte in data that is not in valid_bytes, or None.
+def _find_invalid_byte(data, valid_bytes):
+    for start in range(0, len(data), _SANITY_CHECK_CHUNK_SIZE):
+        chunk = data[start : start + _SANITY_CHECK_CHUNK_SIZE]
+        invalid = chunk.translate(None, valid_bytes)
+        if invalid:
+            offset = chunk.find(invalid[:1])
+            return start + offset, invalid[0]
+    return None
+
+
+# The offset of the first of two consecutive whitespace characters in data, or None.
+# Assumes that the only possible whitespaces are space and newline.
+def _find_consecutive_whitespace(data):
+    for start in range(0, len(data), _SANITY_CHECK_CHUNK_SIZE):
+        # Overlap the chunks by one byte, to find pairs crossing a chunk boundary.
+        chunk = data[start : start + _SANITY_CHECK_CHUNK_SIZE + 1]
+        offset = chunk.translate(_NEWLINE_TO_SPACE).find(b'  ')
+        if offset != -1:
+            return start + offset
+    return None
+
+
+# Return the min, median, p95 and standard deviation of the given durations.
+def duration_statistics(durations):
+    n = len(durations)
+    return {
+        'min': min(durations),
+        'median': statistics.median(durations),
+        'p95': (
+            statistics.quantiles(durations, n=20, method='inclusive')[18] if n > 1 else durations[0]
+        ),
+        'stddev': statistics.stdev(durations) if n > 1 else 0,
+    }
+
+
+def format_duration_statistics(durations):
+    stats = duration_statistics(durations)
+    return (
+        f'min {stats["min"]:.3f}s, p95 {stats["p95"]:.3f}s, '
+        f'sd {stats["stddev"]:.3f}s, {len(durations)} runs'
+    )
+
+
+# Whether a crashed submission most likely exceeded the memory limit: it used almost all of
+# the memory limit, or printed a typical out of memory error to stderr.
+def _memory_limit_exceeded(result, stderr):
+    memory_limit = get_memory_limit()
+    if (
+        memory_limit
+        and result.peak_rss is not None
+        and result.peak_rss >= config.MLE_FRACTION * memory_limit * 1024 * 1024
+    ):
+        return True
+    return stderr is not None and any(message in stderr for message in config.MLE_MESSAGES)
 
-# Testcas input is only allowed to contain newlines and printable characters
-def _is_invalid_input_byte(byte):
-    if byte == ord('\n'): return False;
-    if byte >= 0x20 and byte < 0x7F : return False;
-    return True
-
-# User output is additionally allowed to contain all other types of whitespaces
-def _is_invalid_output_byte(byte):
-    if byte == ord('\t'): return False;
-    if byte == ord('\r'): return False;
-    if byte == ord('\v'): return False;
-    if byte == ord('\f'): return False;
-    return _is_invalid_input_byte(byte)
-
-# assumes that the only possible whitespaces are space and newline
-def _has_consecutive_whitespaces(bytes):
-    last_whitespace = False
-    for byte in bytes:
-        cur_whitespace = byte == ord(' ') or byte == ord('\n')
-        if cur_whitespace and last_whitespace:
-            return True
-        last_whitespace = cur_whitespace
-    return False
+
+# With --repeat K, a run is repeated until it was done K times, or until the 95% confidence
+# interval of the mean is tight, when at least 3 runs were done.
+def _needs_more_runs(durations):
+    n = len(durations)
+    if n >= (config.args.repeat or 1):
+        return False
+    if n < 3:
+        return True
+    mean = statistics.mean(durations)
+    return 1.96 * statistics.stdev(durations) / math.sqrt(n) > config.REPEAT_PRECISION * mean
+
+
+# Only one thread at a time may append to the --report file.
+_report_lock = threading.Lock()
+
+
+# Append one line of JSON describing a finished run to the --report file.
+def _write_report(run, result, *, expected, cached):
+    record = {
+        'problem': run.problem.name,
+        'submission': str(run.submission.short_path),
+        'testcase': run.testcase.name,
+        'verdict': result.verdict,
+        'mle': bool(result.memory_limit_exceeded),
+        'expected': expected,
+        'cpu_time': result.duration,
+        'wall_time': result.wall_time,
+        'peak_rss': result.peak_rss,
+        'exit_code': result.returncode,
+        'validator_time': result.validator_time,
+        'output_size': run.output_size(),
+        'cached': cached,
+        'core': result.core,
+    }
+    if config.args.repeat:
+        record['durations'] = result.durations
+    with _report_lock:
+        # Opening in append mode for each record keeps lines intact when problems are run
+        # in parallel processes with --problem-jobs.
+        with open(config.args.report, 'a') as report_file:
+            report_file.write(json.dumps(record) + '\n')
+
+
+# With --stream, the amount of output that is kept for the .out file of runs that are not
+# accepted.
+_STREAM_KEPT_OUTPUT = 1 << 20
+
+# The memory in MB reserved in the job queue for a run without a measured peak memory usage.
+_DEFAULT_MEMORY_ESTIMATE = 256
+
+
+# Optional attributes of ExecResult that are stored with the result of a run.
+_STORED_ATTRIBUTES = [
+    'core',
+    'durations',
+    'returncode',
+    'wall_time',
+    'peak_rss',
+    'validator_time',
+    'memory_limit_exceeded',
+]
 
 
 class Testcase:
@@ -82,9 +195,19 @@ class Testcase:
         # testdata.yaml doesn't exist.
         self.testdata_yaml = problem.get_testdata_yaml(self.problem.path / 'data' / self.short_path)
 
+        self._hash = None
+
     def with_suffix(self, ext):
         return self.in_path.with_suffix(ext)
 
+    # The hash of the contents of the .in and .ans file.
+    def hash(self):
+        if self._hash is None:
+            self._hash = combine_hashes(
+                [hash_file(p) if p.is_file() else None for p in [self.in_path, self.ans_path]]
+            )
+        return self._hash
+
     # Return the flags specified in testdata.yaml for the given validator,
     # None if no flags were found, or False if this validator should be skipped.
     def testdata_yaml_validator_flags(self, validator_type, validator):
@@ -196,26 +319,36 @@ class Testcase:
 
         if not config.args.skip_testcase_sanity_checks and success and not bad_testcase :
             if validator_type == 'input_format' and self.in_path.exists():
-                bytes = self.in_path.read_bytes()
-                if any(_is_invalid_input_byte(b) for b in bytes):
-                    bar.warn('Testcase contains unexpected characters but was accepted!')
-                elif len(bytes) == 0:
-                    bar.warn('Testcase is empty but was accepted!')
-                elif bytes[0] == ord(' ') or bytes[0] == ord('\n'):
-                    bar.warn('Testcase starts with whitespace but was accepted!')
-                elif bytes[-1] != ord('\n'):
-                    bar.warn('Testcase does not end with a newline but was accepted!')
-                elif _has_consecutive_whitespaces(bytes):
-                    bar.warn('Testcase contains consecutive whitespace characters but was accepted!')
-                elif len(bytes) > 20_000_000_000:
-                    bar.warn('Testcase is larger than 20Mb!')
+                with map_file(self.in_path) as data:
+                    invalid = _find_invalid_byte(data, _VALID_INPUT_BYTES)
+                    if invalid:
+                        bar.warn(
+                            f'Testcase contains unexpected character {invalid[1]:#04x} at byte {invalid[0]} but was accepted!'
+                        )
+                    elif len(data) == 0:
+                        bar.warn('Testcase is empty but was accepted!')
+                    elif data[0] == ord(' ') or data[0] == ord('\n'):
+                        bar.warn('Testcase starts with whitespace but was accepted!')
+                    elif data[-1] != ord('\n'):
+                        bar.warn('Testcase does not end with a newline but was accepted!')
+                    else:
+                        offset = _find_consecutive_whitespace(data)
+                        if offset is not None:
+                            bar.warn(
+                                f'Testcase contains consecutive whitespace characters at byte {offset} but was accepted!'
+                            )
+                        elif len(data) > 20_000_000_000:
+                            bar.warn('Testcase is larger than 20Mb!')
 
             if validator_type == 'output_format' and self.ans_path.exists():
-                bytes = self.ans_path.read_bytes()
-                if any(_is_invalid_output_byte(b) for b in bytes):
-                    bar.warn('Answere contains unexpected characters but was accepted!')
-                elif len(bytes) > 20_000_000_000:
-                    bar.warn('Output is larger than 20Mb!')
+                with map_file(self.ans_path) as data:
+                    invalid = _find_invalid_byte(data, _VALID_OUTPUT_BYTES)
+                    if invalid:
+                        bar.warn(
+                            f'Answere contains unexpected character {invalid[1]:#04x} at byte {invalid[0]} but was accepted!'
+                        )
+                    elif len(data) > 20_000_000_000:
+                        bar.warn('Output is larger than 20Mb!')
 
         return success
 
@@ -232,6 +365,11 @@ class Run:
             self.problem.tmpdir / 'runs' / self.submission.short_path / self.testcase.short_path
         )
         self.out_path = tmp_path.with_suffix('.out')
+        # With --stream, the size and the start of the output, see _run_streaming.
+        self.streamed_size = None
+        self.streamed_output = None
+        self.result_path = tmp_path.with_suffix('.result')
+        self._stored = None
         self.feedbackdir = tmp_path.with_suffix('.feedbackdir')
         self.feedbackdir.mkdir(exist_ok=True, parents=True)
         # Clean all files in feedbackdir.
@@ -243,32 +381,85 @@ class Run:
 
     # Return an ExecResult object amended with verdict.
     def run(self, *, interaction=None, submission_args=None):
+        with parallel.pinned_core() as core:
+            result = self._run(core, interaction, submission_args)
+        result.core = core
+        if result.durations is None:
+            result.durations = [result.duration]
+        self.result = result
+        return result
+
+    def _run(self, core, interaction, submission_args):
         if self.problem.interactive:
             result = interactive.run_interactive_testcase(
-                self, interaction=interaction, submission_args=submission_args
+                self, interaction=interaction, submission_args=submission_args, cpu=core
             )
+            # With --repeat, use the median duration of the accepted runs. Once a run is not
+            # accepted, its result is used. Runs that write an interaction are not repeated,
+            # since each run appends its interaction to the file.
+            durations = [result.duration]
+            while not interaction and _needs_more_runs(durations) and result.verdict == 'ACCEPTED':
+                result = interactive.run_interactive_testcase(
+                    self, interaction=interaction, submission_args=submission_args, cpu=core
+                )
+                durations.append(result.duration)
+            result.durations = durations
+            if result.verdict == 'ACCEPTED':
+                result.duration = statistics.median(durations)
+            # The submission's stderr is returned as result.out.
+            if result.verdict == 'RUN_TIME_ERROR' and _memory_limit_exceeded(result, result.out):
+                result.memory_limit_exceeded = True
+                result.print_verdict_ = 'RTE (MLE)'
         else:
-            result = self.submission.run(self.testcase.in_path, self.out_path)
+            validator_result = None
+            if self._streaming():
+                result, validator_result = self._run_streaming(core)
+                durations = [result.duration]
+            else:
+                result = self.submission.run(self.testcase.in_path, self.out_path, cpu=core)
+                # With --repeat, use the median duration. Runs that crash or are aborted are
+                # not repeated.
+                durations = [result.duration]
+                while (
+                    _needs_more_runs(durations)
+                    and result.ok is True
+                    and result.duration < self.problem.settings.timeout
+                ):
+                    result = self.submission.run(self.testcase.in_path, self.out_path, cpu=core)
+                    durations.append(result.duration)
+            result.durations = durations
+            result.duration = statistics.median(durations)
+
             if result.duration > self.problem.settings.timelimit:
                 result.verdict = 'TIME_LIMIT_EXCEEDED'
                 if result.duration >= self.problem.settings.timeout:
                     result.print_verdict_ = 'TLE (aborted)'
             elif result.ok is not True:
                 result.verdict = 'RUN_TIME_ERROR'
+                if _memory_limit_exceeded(result, result.err):
+                    result.memory_limit_exceeded = True
+                    result.print_verdict_ = 'RTE (MLE)'
                 if config.args.error:
                     result.err = 'Exited with code ' + str(result.ok) + ':\n' + result.err
                 else:
                     result.err = 'Exited with code ' + str(result.ok)
             else:
                 # Overwrite the result with validator returncode and stdout/stderr, but keep the original duration.
-                duration = result.duration
-                result = self._validate_output()
+                submission_result = result
+                if validator_result is None:
+                    validator_result = self._validate_output()
+                result = validator_result
                 if result is False:
                     error(f'No output validators found for testcase {self.testcase.name}')
                     result = ExecResult(-1, 0, None, None)
                     result.verdict = 'VALIDATOR_CRASH'
                 else:
-                    result.duration = duration
+                    result.validator_time = result.duration
+                    result.duration = submission_result.duration
+                    result.durations = durations
+                    result.returncode = submission_result.returncode
+                    result.wall_time = submission_result.wall_time
+                    result.peak_rss = submission_result.peak_rss
 
                     if result.ok is True:
                         result.verdict = 'ACCEPTED'
@@ -278,6 +469,10 @@ class Run:
                         config.n_error += 1
                         result.verdict = 'VALIDATOR_CRASH'
 
+            # With --stream, only write the start of the output of runs that are not accepted.
+            if self.streamed_output is not None and result.verdict != 'ACCEPTED':
+                self.out_path.write_bytes(self.streamed_output)
+
             # Delete .out files larger than 1MB.
             if (
                 not config.args.error
@@ -286,22 +481,253 @@ class Run:
             ):
                 self.out_path.unlink()
 
-        self.result = result
         return result
 
-    def _validate_output(self):
+    # Whether the output of the submission is piped into the output validator while it runs.
+    # Only the default output validator stops reading as soon as the output is wrong, and
+    # --repeat needs the complete runs.
+    def _streaming(self):
+        return (
+            config.args.stream
+            and self.problem.settings.validation == 'default'
+            and not config.args.repeat
+        )
+
+    # Run the submission with its stdout piped into the output validator. When the validator
+    # rejects the output before it is complete, it closes its stdin and the submission is
+    # killed by SIGPIPE (or fails writing its output).
+    # The output is only written to self.out_path with --error. Otherwise, its size and its
+    # first _STREAM_KEPT_OUTPUT bytes are stored in self.streamed_size and
+    # self.streamed_output, which _run writes to self.out_path when the run is not accepted.
+    # Returns the results of the submission and of the output validator.
+    def _run_streaming(self, core):
+        submission_read, submission_write = os.pipe()
+        validator_read, validator_write = os.pipe()
+        # Whether the validator stopped reading before the output was complete.
+        closed_early = False
+
+        if self.out_path.is_file():
+            self.out_path.unlink()
+        self.streamed_size = 0
+        kept = bytearray()
+
+        def relay():
+            nonlocal closed_early
+            with contextlib.ExitStack() as stack:
+                out_file = (
+                    stack.enter_context(self.out_path.open('wb')) if config.args.error else None
+                )
+                while True:
+                    chunk = os.read(submission_read, 1 << 16)
+                    if not chunk:
+                        break
+                    self.streamed_size += len(chunk)
+                    if out_file is not None:
+                        out_file.write(chunk)
+                    elif len(kept) < _STREAM_KEPT_OUTPUT:
+                        kept.extend(chunk[: _STREAM_KEPT_OUTPUT - len(kept)])
+                    try:
+                        os.write(validator_write, chunk)
+                    except BrokenPipeError:
+                        closed_early = True
+                        break
+            os.close(submission_read)
+            os.close(validator_write)
+
+        validator_result = None
+
+        def validate():
+            nonlocal validator_result
+            with os.fdopen(validator_read, 'rb') as out_file:
+                validator_result = self._validate_output(out_file=out_file)
+
+        threads = [threading.Thread(target=relay), threading.Thread(target=validate)]
+        for thread in threads:
+            thread.start()
+        try:
+            with self.testcase.in_path.open('rb') as inf:
+                result = exec_command(
+                    self.submission.run_command,
+                    stdin=inf,
+                    stdout=submission_write,
+                    stderr=True,
+                    timeout=self.problem.settings.timeout,
+                    cwd=self.submission.tmpdir,
+                    cpu=core,
+                )
+        finally:
+            # The relay only sees the end of the output once all writers are closed.
+            os.close(submission_write)
+            for thread in threads:
+                thread.join()
+
+        if not config.args.error:
+            self.streamed_output = bytes(kept)
+
+        # A submission that failed because the validator already rejected its output is
+        # judged by its output.
+        if closed_early and validator_result and validator_result.ok is False:
+            result.ok = True
+        return result, validator_result
+
+    # The size of the output of the submission in bytes, or None when unknown.
+    def output_size(self):
+        if self.streamed_size is not None:
+            return self.streamed_size
+        return self.out_path.stat().st_size if self.out_path.is_file() else None
+
+    # The key of the stored result of this run. It changes whenever the submission, the
+    # testcase, the output validators (or their flags), or the limits change.
+    def _result_key(self):
+        output_validators = self.problem.validators('output')
+        if output_validators is False:
+            return None
+        values = [
+            cache.build_hash(self.submission),
+            self.testcase.hash(),
+            self.problem.settings.validation,
+            self.problem.settings.validator_flags,
+            self.problem.settings.timelimit,
+            self.problem.settings.timeout,
+            get_memory_limit(),
+            config.args.error,
+            # Pinned runs have more reliable timings.
+            bool(config.args.pin_cores or config.args.no_smt),
+            bool(config.args.no_smt),
+            config.args.repeat,
+            # A class data sharing archive changes the startup time of the JVM.
+            self.submission.cds_archive is not None,
+        ]
+        for output_validator in output_validators:
+            values += [
+                cache.build_hash(output_validator),
+                self.testcase.testdata_yaml_validator_flags('output', output_validator),
+            ]
+        return combine_hashes(values)
+
+    # The result stored by a previous invocation, regardless of whether it is still valid.
+    def _stored_result(self):
+        if self._stored is None:
+            self._stored = False
+            if self.result_path.is_file():
+                try:
+                    data = yamllib.safe_load(self.result_path.read_text())
+                    if isinstance(data, dict) and 'key' in data:
+                        self._stored = data
+                except (OSError, yamllib.YAMLError):
+                    pass
+        return self._stored or None
+
+    # The memory in MB to reserve in the job queue for this run: the peak memory usage of the
+    # previous run on this testcase with some headroom, or a small default. The memory limit
+    # is only enforced by limit_setter, since it limits virtual memory, which is usually much
+    # more than the memory that is actually used.
+    def memory_estimate(self):
+        stored = self._stored_result()
+        peak_rss = stored.get('peak_rss') if stored is not None else None
+        if peak_rss:
+            estimate = math.ceil(1.5 * peak_rss / (1024 * 1024))
+        else:
+            estimate = _DEFAULT_MEMORY_ESTIMATE
+        limit = get_memory_limit()
+        return min(estimate, limit) if limit else estimate
+
+    # Runs that failed before are started first, since they are likely to fail again and
+    # stop the submission early. Samples are started next.
+    def priority(self):
+        stored = self._stored_result()
+        if stored is not None and stored['verdict'] != 'ACCEPTED':
+            return 2
+        return 1 if self.testcase.sample else 0
+
+    # Return the result stored by a previous invocation when nothing changed since, or None.
+    # The files the validator wrote to the feedbackdir are restored as well.
+    # With --rerun nothing is reused. With --rerun-failed only ACCEPTED results well
+    # within the timelimit are reused.
+    def cached_result(self):
+        if config.args.rerun:
+            return None
+        data = self._stored_result()
+        if data is None or data['key'] != self._result_key():
+            return None
+        if config.args.rerun_failed and (
+            data['verdict'] != 'ACCEPTED'
+            or data['duration'] >= config.RERUN_TIMELIMIT_FRACTION * self.problem.settings.timelimit
+        ):
+            return None
+
+        for name, text in data['feedback'].items():
+            (self.feedbackdir / name).write_text(text)
+        self.result = ExecResult(
+            data['ok'],
+            data['duration'],
+            data['err'],
+            data['out'],
+            data['verdict'],
+            data['print_verdict'],
+        )
+        for attribute in _STORED_ATTRIBUTES:
+            setattr(self.result, attribute, data.get(attribute))
+        if self.result.durations is None:
+            self.result.durations = [self.result.duration]
+        return self.result
+
+    # Store the result of this run, together with the feedbackdir, for cached_result.
+    def store_result(self, result):
+        if result.verdict not in config.VERDICTS:
+            return
+        key = self._result_key()
+        if key is None:
+            return
+        feedback = {}
+        for f in self.feedbackdir.iterdir():
+            try:
+                feedback[f.name] = f.read_text()
+            except (OSError, UnicodeDecodeError):
+                # Such results are reported in full when they occur, so never reuse them.
+                return
+        data = {
+            'key': key,
+            'ok': result.ok,
+            'duration': result.duration,
+            'err': result.err,
+            'out': result.out,
+            'verdict': result.verdict,
+            'print_verdict': result.print_verdict_,
+            **{attribute: getattr(result, attribute) for attribute in _STORED_ATTRIBUTES},
+            'feedback': feedback,
+        }
+        # Write to a temporary file first, so that an interrupted run never leaves a
+        # partial result behind.
+        tmp_path = self.result_path.with_suffix('.result_')
+        tmp_path.write_text(yamllib.dump(data))
+        tmp_path.replace(self.result_path)
+
+    # When out_file is given, the output is read from it instead of from self.out_path.
+    def _validate_output(self, out_file=None):
         validator_type = 'output'
         output_validators = self.problem.validators(validator_type)
         if output_validators is False:
             return False
 
         last_result = False
+        # The total cpu time of all output validators.
+        validator_time = 0
         for output_validator in output_validators:
             flags = self.testcase.testdata_yaml_validator_flags(validator_type, output_validator)
             if flags is False:
                 continue
 
-            ret = output_validator.run(self.testcase, self, args=flags)
+            ret = None
+            # Compare in-process instead of starting the default output validator, when possible.
+            if out_file is None and self.problem.settings.validation == 'default':
+                ret = default_output_validator.validate(
+                    self.testcase, self, self.problem.settings.validator_flags + (flags or [])
+                )
+            if ret is None:
+                ret = output_validator.run(self.testcase, self, args=flags, out_file=out_file)
+            validator_time += ret.duration
+            ret.duration = validator_time
 
             judgemessage = self.feedbackdir / 'judgemessage.txt'
             judgeerror = self.feedbackdir / 'judgeerror.txt'
@@ -407,8 +833,9 @@ class Submission(program.Program):
 
     # Run submission on in_path, writing stdout to out_path or stdout if out_path is None.
     # args is used by SubmissionInvocation to pass on additional arguments.
+    # cpu is the cpu to pin the submission to, see parallel.pinned_core.
     # Returns ExecResult
-    def run(self, in_path, out_path, crop=True, args=[], cwd=None):
+    def run(self, in_path, out_path, crop=True, args=[], cwd=None, cpu=None):
         assert self.run_command is not None
         # Just for safety reasons, change the cwd.
         if cwd is None:
@@ -425,126 +852,159 @@ class Submission(program.Program):
                 stderr=None if out_file is None else True,
                 timeout=self.problem.settings.timeout,
                 cwd=cwd,
+                cpu=cpu,
             )
             if out_file:
                 out_file.close()
             return result
 
-    # Run this submission on all testcases for the current problem.
-    # Returns (OK verdict, printed newline)
-    def run_all_testcases(
-        self, max_submission_name_len=None, table_dict=None, *, needs_leading_newline
-    ):
-        runs = [Run(self.problem, self, testcase) for testcase in self.problem.testcases()]
+    # Run this submission on all given testcases.
+    # The runs are added to the queue `p`, which is shared between all submissions,
+    # and their results are reported in a separate section of the shared `bar`.
+    # Once the last run finished, self.verdict, self.print_verdict and self.duration
+    # are set and the summary line is printed.
+    def run_all_testcases(self, testcases, p, bar, max_submission_name_len, table_dict=None):
+        runs = [Run(self.problem, self, testcase) for testcase in testcases]
         max_item_len = max(len(run.name) for run in runs) + max_submission_name_len - len(self.name)
 
-        bar = ProgressBar(
-            'Running ' + self.name,
-            count=len(runs),
-            max_len=max_item_len,
-            needs_leading_newline=needs_leading_newline,
-        )
-
-        max_duration = -1
-
-        verdict = (-100, 'ACCEPTED', 'ACCEPTED', 0)  # priority, verdict, print_verdict, duration
-        verdict_run = None
-
-        def process_run(run, p):
-            nonlocal max_duration, verdict, verdict_run
-
-            localbar = bar.start(run)
+        self.section = bar.add_section('Running ' + self.name, max_item_len)
+        self.table_dict = table_dict
+        self.lock = threading.Lock()
+        self.runs_left = len(runs)
+        self.stopped = False
+
+        self.duration = -1
+        # priority, verdict, print_verdict, duration
+        self.max_verdict = (-100, 'ACCEPTED', 'ACCEPTED', 0)
+        self.verdict_run = None
+        # The durations of each run, see --repeat.
+        self.durations = {}
+        # The maximum peak memory usage in bytes over all runs.
+        self.peak_rss = None
+
+        # Interactive runs use a second process for the output validator.
+        cpus = 2 if self.problem.interactive else 1
+        for run in runs:
+            p.put(run, priority=run.priority(), cpus=cpus, memory=run.memory_estimate())
+
+    # Process a single run queued by run_all_testcases.
+    def process_run(self, run, bar):
+        # Lazy judging: skip remaining runs after the first error.
+        if self.stopped:
+            with bar.lock:
+                bar.count -= 1
+            self._run_done(bar)
+            return
+
+        localbar = bar.start(run, section=self.section)
+        result = run.cached_result()
+        cached = result is not None
+        if not cached:
             result = run.run()
+            run.store_result(result)
 
-            new_verdict = (
-                config.PRIORITY[result.verdict],
-                result.verdict,
-                result.print_verdict(),
-                result.duration,
+        new_verdict = (
+            config.PRIORITY[result.verdict],
+            result.verdict,
+            result.print_verdict(),
+            result.duration,
+        )
+        with self.lock:
+            if new_verdict > self.max_verdict:
+                self.max_verdict = new_verdict
+                self.verdict_run = run
+            self.duration = max(self.duration, result.duration)
+            self.durations[run.name] = result.durations
+            if result.peak_rss is not None:
+                self.peak_rss = max(self.peak_rss or 0, result.peak_rss)
+
+            if self.table_dict is not None:
+                self.table_dict[run.name] = result.verdict == 'ACCEPTED'
+
+        got_expected = result.verdict in ['ACCEPTED'] + self.expected_verdicts
+
+        if config.args.report:
+            _write_report(run, result, expected=got_expected, cached=cached)
+
+        # Print stderr whenever something is printed
+        if result.out and result.err:
+            output_type = 'PROGRAM STDERR' if self.problem.interactive else 'STDOUT'
+            data = (
+                f'STDERR:'
+                + localbar._format_data(result.err)
+                + f'\n{output_type}:'
+                + localbar._format_data(result.out)
+                + '\n'
             )
-            if new_verdict > verdict:
-                verdict = new_verdict
-                verdict_run = run
-            max_duration = max(max_duration, result.duration)
-
-            if table_dict is not None:
-                table_dict[run.name] = result.verdict == 'ACCEPTED'
-
-            got_expected = result.verdict in ['ACCEPTED'] + self.expected_verdicts
-
-            # Print stderr whenever something is printed
-            if result.out and result.err:
-                output_type = 'PROGRAM STDERR' if self.problem.interactive else 'STDOUT'
-                data = (
-                    f'STDERR:'
-                    + localbar._format_data(result.err)
-                    + f'\n{output_type}:'
-                    + localbar._format_data(result.out)
-                    + '\n'
-                )
-            else:
-                data = ''
-                if result.err:
-                    data = crop_output(result.err)
-                if result.out:
-                    data = crop_output(result.out)
-
-            # Add data from feedbackdir.
-            for f in run.feedbackdir.iterdir():
-                if not f.is_file():
-                    localbar.warn(f'Validator wrote to {f} but it\'s not a file.')
-                    continue
-                try:
-                    t = f.read_text()
-                except UnicodeDecodeError:
-                    localbar.warn(
-                        f'Validator wrote to {f} but it cannot be parsed as unicode text.'
-                    )
-                    continue
-                f.unlink()
-                if not t:
-                    continue
-                if len(data) > 0 and data[-1] != '\n':
-                    data += '\n'
-                data += f'{f.name}:' + localbar._format_data(t) + '\n'
-
-            localbar.done(got_expected, f'{result.duration:6.3f}s {result.print_verdict()}', data)
-
-            # Lazy judging: stop on the first error when not in verbose mode.
-            if (
-                not config.args.verbose and not config.args.table
-            ) and result.verdict in config.MAX_PRIORITY_VERDICT:
-                bar.count = None
-                p.stop()
-
-        p = parallel.Parallel(lambda run: process_run(run, p), not self.problem.interactive)
-
-        for run in runs:
-            p.put(run)
+        else:
+            data = ''
+            if result.err:
+                data = crop_output(result.err)
+            if result.out:
+                data = crop_output(result.out)
 
-        p.done()
+        # Add data from feedbackdir.
+        for f in run.feedbackdir.iterdir():
+            if not f.is_file():
+                localbar.warn(f'Validator wrote to {f} but it\'s not a file.')
+                continue
+            try:
+                t = f.read_text()
+            except UnicodeDecodeError:
+                localbar.warn(f'Validator wrote to {f} but it cannot be parsed as unicode text.')
+                continue
+            f.unlink()
+            if not t:
+                continue
+            if len(data) > 0 and data[-1] != '\n':
+                data += '\n'
+            data += f'{f.name}:' + localbar._format_data(t) + '\n'
+
+        message = f'{result.duration:6.3f}s {result.print_verdict()}'
+        if result.core is not None:
+            message += f' (core {result.core})'
+        if config.args.repeat:
+            message += f' ({format_duration_statistics(result.durations)})'
+        if cached:
+            message += ' (cached)'
+        localbar.done(got_expected, message, data)
+
+        # Lazy judging: stop on the first error when not in verbose mode.
+        if (
+            not config.args.verbose and not config.args.table
+        ) and result.verdict in config.MAX_PRIORITY_VERDICT:
+            self.stopped = True
+
+        self._run_done(bar)
+
+    # Print the summary line after the last run of this submission is done.
+    def _run_done(self, bar):
+        with self.lock:
+            self.runs_left -= 1
+            if self.runs_left > 0:
+                return
 
-        self.verdict = verdict[1]
-        self.print_verdict = verdict[2]
-        self.duration = max_duration
+        self.verdict = self.max_verdict[1]
+        self.print_verdict = self.max_verdict[2]
 
         # Use a bold summary line if things were printed before.
-        if bar.logged:
+        if self.section.logged:
             color = (
                 Style.BRIGHT + Fore.GREEN
                 if self.verdict in self.expected_verdicts
                 else Style.BRIGHT + Fore.RED
             )
-            boldcolor = Style.BRIGHT
         else:
             color = Fore.GREEN if self.verdict in self.expected_verdicts else Fore.RED
-            boldcolor = ''
 
-        printed_newline = bar.finalize(
-            message=f'{max_duration:6.3f}s {color}{self.print_verdict:<20}{Style.RESET_ALL} @ {verdict_run.testcase.name}'
-        )
-
-        return (self.verdict in self.expected_verdicts, printed_newline)
+        memory = f'{self.peak_rss / 1024 / 1024:7.1f}MB' if self.peak_rss is not None else ' ' * 9
+        message = f'{self.duration:6.3f}s {memory} {color}{self.print_verdict:<20}{Style.RESET_ALL} @ {self.verdict_run.testcase.name}'
+        # With --repeat, also print the statistics of the slowest testcase.
+        if config.args.repeat and self.durations:
+            name = max(self.durations, key=lambda name: statistics.median(self.durations[name]))
+            stats = format_duration_statistics(self.durations[name])
+            message += f' slowest: {name} ({stats})'
+        bar.end_section(self.section, message)
 
     def test(self):
         print(ProgressBar.action('Running', str(self.name)), file=sys.stderr)
@@ -638,19 +1098,11 @@ class Submission(program.Program):
             super().__init__(self.problem, self.path, skip_double_build_warning=True)
             bar.log('from stdin' if is_tty else 'from file')
 
-            # Launch a separate thread to pass stdin to a pipe.
+            # Pass stdin to a pipe in a separate thread.
             r, w = os.pipe()
             ok = True
             eof = False
 
-            TEE_CODE = R'''
-import sys
-while True:
-    l = sys.stdin.read(1)
-    if l=='': break
-    sys.stdout.write(l)
-    sys.stdout.flush()
-'''
             writer = None
 
             # Wait for first input
@@ -667,7 +1119,8 @@ while True:
                 if not read:
                     return
 
-                writer = subprocess.Popen(['python3', '-c', TEE_CODE], stdin=None, stdout=w)
+                # The writer closes w when stdin is closed or when it is stopped.
+                writer = interactive.Relay(sys.stdin.fileno(), w)
 
                 assert self.run_command is not None
                 result = exec_command(
@@ -693,9 +1146,10 @@ while True:
                 print(file=sys.stderr)
             finally:
                 os.close(r)
-                os.close(w)
                 if writer:
-                    writer.kill()
+                    writer.stop()
+                else:
+                    os.close(w)
             bar.done()
 
             if not is_tty:
@@ -22,6 +22,8 @@ import tempfile
 import shutil
 import colorama
 import json
+import multiprocessing
+import multiprocessing.connection
 
 from pathlib import Path
 
@@ -32,6 +34,7 @@ import export
 import generate
 import fuzz
 import latex
+import parallel
 import run
 import skel
 import slack
@@ -318,12 +321,42 @@ Run this from one of:
     global_parser.add_argument(
         '--force-build', action='store_true', help='Force rebuild instead of only on changed files.'
     )
+    global_parser.add_argument(
+        '--no-build-cache',
+        action='store_true',
+        help='Do not use the persistent build cache shared between problems and contests.',
+    )
+    global_parser.add_argument(
+        '--build-cache',
+        type=Path,
+        help='Directory of the persistent build cache. Default: ~/.cache/bapctools/build.',
+    )
+    global_parser.add_argument(
+        '--build-cache-size',
+        type=int,
+        help='Maximum size of the build cache in MB. Default: 2048.',
+    )
+    global_parser.add_argument(
+        '--no-cds',
+        action='store_true',
+        help='Do not use class data sharing archives to speed up starting Java and Kotlin programs, e.g. to time submissions exactly like a judge system without them.',
+    )
+    global_parser.add_argument(
+        '--no-zygote',
+        action='store_true',
+        help='Start a new interpreter for each run of a Python generator, validator, or visualizer.',
+    )
     global_parser.add_argument(
         '--jobs',
         '-j',
         type=int,
         help='The number of jobs to use. Default: cpu_count()/2.',
     )
+    global_parser.add_argument(
+        '--problem-jobs',
+        type=int,
+        help='The number of problems to process in parallel when running generate, validate, output, run or all for a contest. Default: 1.',
+    )
     global_parser.add_argument(
         '--api',
         help='CCS API endpoint to use, e.g. https://www.domjudge.org/demoweb. Defaults to the value in contest.yaml.',
@@ -448,6 +481,11 @@ Run this from one of:
         action='store_true',
         help='Skip sanity checks on testcases.',
     )
+    validate_parser.add_argument(
+        '--near-duplicates',
+        action='store_true',
+        help='Warn for testcases whose input only differs in whitespace from another testcase.',
+    )
     validate_parser.add_argument(
         '--timeout', '-t', type=int, help='Override the default timeout. Default: 30.'
     )
@@ -613,6 +651,42 @@ Run this from one of:
         action='store_true',
         help='Skip sanity checks on testcases.',
     )
+    rerun_group = runparser.add_mutually_exclusive_group()
+    rerun_group.add_argument(
+        '--rerun',
+        action='store_true',
+        help='Run all submissions, instead of reusing results of unchanged runs.',
+    )
+    rerun_group.add_argument(
+        '--rerun-failed',
+        action='store_true',
+        help='Only reuse results of unchanged runs that were accepted well within the timelimit.',
+    )
+    runparser.add_argument(
+        '--report',
+        type=Path,
+        help='Write a line of JSON for each run to this file, as soon as the run is done.',
+    )
+    runparser.add_argument(
+        '--repeat',
+        type=int,
+        help='Run each submission up to this many times on each testcase, print timing statistics, and suggest a timelimit.',
+    )
+    runparser.add_argument(
+        '--pin-cores',
+        action='store_true',
+        help='Pin each run to its own cpu, for more reliable timings when running in parallel.',
+    )
+    runparser.add_argument(
+        '--no-smt',
+        action='store_true',
+        help='Like --pin-cores, but use only one cpu of each physical core and keep its SMT siblings idle.',
+    )
+    runparser.add_argument(
+        '--stream',
+        action='store_true',
+        help='Pipe the output of submissions directly into the default output validator, and stop them as soon as their output is wrong.',
+    )
 
     # Test
     testparser = subparsers.add_parser(
@@ -658,6 +732,11 @@ Run this from one of:
     allparser.add_argument(
         '--cleanup-generated', action='store_true', help='Clean up generated testcases afterwards.'
     )
+    allparser.add_argument(
+        '--report',
+        type=Path,
+        help='Write a line of JSON for each run to this file, as soon as the run is done.',
+    )
     allparser.add_argument('--force', '-f', action='store_true', help='Delete all untracked files.')
     allparser.add_argument(
         '--skip-testcase-sanity-checks',
@@ -751,6 +830,182 @@ Run this from one of:
     return parser
 
 
+# Actions that can process multiple problems in parallel at the contest level.
+PARALLEL_PROBLEM_ACTIONS = ['generate', 'validate', 'output', 'run', 'all']
+
+
+# Run the current action for a single problem.
+# cpu_count is the number of cores available to this problem.
+def run_problem(problem, level, problem_zips, cpu_count=os.cpu_count()):
+    action = config.args.action
+    success = True
+
+    print(Style.BRIGHT, 'PROBLEM ', problem.name, Style.RESET_ALL, sep='', file=sys.stderr)
+
+    if action in ['generate']:
+        success &= generate.generate(problem)
+    if action in ['all', 'constraints', 'run'] and not config.args.no_generate:
+        # Call `generate` with modified arguments.
+        old_args = argparse.Namespace(**vars(config.args))
+        config.args.check_deterministic = action in ['all', 'constraints']
+        config.args.jobs = cpu_count // 2
+        config.args.add_manual = False
+        config.args.move_manual = False
+        config.args.verbose = 0
+        config.args.repeat = None
+        config.args.skip_visualizer = True
+        success &= generate.generate(problem)
+        config.args = old_args
+    if action in ['fuzz']:
+        success &= fuzz.fuzz(problem)
+    if action in ['pdf', 'all']:
+        # only build the pdf on the problem level, or on the contest level when
+        # --all is passed.
+        if level == 'problem' or (level == 'problemset' and config.args.all):
+            success &= latex.build_problem_pdf(problem)
+    if action in ['solutions']:
+        if level == 'problem':
+            success &= latex.build_problem_pdf(problem, solutions=True)
+    if action in ['validate', 'all']:
+        if not (action == 'validate' and config.args.output):
+            success &= problem.validate_format('input_format')
+    if action in ['validate', 'output', 'all']:
+        if not (action == 'validate' and config.args.input):
+            success &= problem.validate_format('output_format')
+    if action in ['run', 'all']:
+        success &= problem.run_submissions()
+    if action in ['test']:
+        config.args.no_bar = True
+        success &= problem.test_submissions()
+    if action in ['constraints']:
+        success &= constraints.check_constraints(problem)
+    if action in ['zip']:
+        output = problem.path.with_suffix('.zip')
+
+        problem_zips.append(output)
+        if not config.args.skip:
+
+            # Set up arguments for generate.
+            old_args = argparse.Namespace(**vars(config.args))
+            config.args.check_deterministic = not config.args.force
+            config.args.jobs = None
+            config.args.add_manual = False
+            config.args.move_manual = False
+            config.args.verbose = 0
+            config.args.testcases = None
+            config.args.repeat = None
+            config.args.force = False
+            success &= generate.generate(problem)
+            config.args = old_args
+
+            success &= latex.build_problem_pdf(problem)
+            if not config.args.force:
+                success &= problem.validate_format('input_format', constraints={})
+                success &= problem.validate_format('output_format', constraints={})
+
+            # Write to problemname.zip, where we strip all non-alphanumeric from the
+            # problem directory name.
+            success &= export.build_problem_zip(problem, output)
+    if action == 'all' and config.args.cleanup_generated:
+        success &= generate.cleanup_generated(problem)
+
+    return success
+
+
+# Run the current action for a single problem in a forked child process.
+# All output written to stderr is captured in output_file, and the result is sent
+# back over conn as (success, n_error, n_warn).
+def _run_problem_in_child(problem, level, cpu_count, jobs, memory_budget, output_file, conn):
+    os.dup2(output_file.fileno(), sys.stderr.fileno())
+    ProgressBar.current_bar = None
+    config.args.no_bar = True
+    config.args.jobs = jobs
+    parallel.memory_budget = memory_budget
+    config.n_error = 0
+    config.n_warn = 0
+
+    success = False
+    try:
+        success = run_problem(problem, level, [], cpu_count=cpu_count)
+        print(file=sys.stderr)
+    except SystemExit:
+        # fatal() was called. The error was already printed.
+        pass
+    finally:
+        # Kill the helper processes started for this problem.
+        kill_process_groups()
+        sys.stderr.flush()
+        conn.send((success, config.n_error, config.n_warn))
+        conn.close()
+
+
+# Run the current action for num_parallel problems at a time, each in its own
+# process. The --jobs and memory budgets are split evenly over the concurrently running problems.
+# The output of each problem is printed at once, in order, when it is done.
+def run_problems_in_parallel(problems, level, num_parallel):
+    num_parallel = min(num_parallel, len(problems))
+    cpu_count = max(os.cpu_count() // num_parallel, 2)
+    jobs = max(config.args.jobs // num_parallel, 1) if config.args.jobs else config.args.jobs
+    memory_budget = (
+        parallel.memory_budget // num_parallel if parallel.memory_budget is not None else None
+    )
+
+    context = multiprocessing.get_context('fork')
+
+    bar = ProgressBar('Problems', items=[problem.name for problem in problems])
+    success = True
+
+    # Index of the next problem to start and the next problem to print.
+    next_start = 0
+    next_print = 0
+    running = {}  # sentinel -> (index, process, connection)
+    results = [None] * len(problems)  # (success, output)
+    outputs = [tempfile.TemporaryFile() for _ in problems]
+    localbars = [None] * len(problems)
+
+    while next_print < len(problems):
+        while next_start < len(problems) and len(running) < num_parallel:
+            i = next_start
+            next_start += 1
+            localbars[i] = bar.start(problems[i].name)
+            recv_conn, send_conn = context.Pipe(duplex=False)
+            sys.stderr.flush()
+            process = context.Process(
+                target=_run_problem_in_child,
+                args=(problems[i], level, cpu_count, jobs, memory_budget, outputs[i], send_conn),
+            )
+            process.start()
+            send_conn.close()
+            running[process.sentinel] = (i, process, recv_conn)
+
+        for sentinel in multiprocessing.connection.wait(list(running)):
+            i, process, recv_conn = running.pop(sentinel)
+            process.join()
+            problem_success = False
+            if recv_conn.poll():
+                problem_success, n_error, n_warn = recv_conn.recv()
+                config.n_error += n_error
+                config.n_warn += n_warn
+            else:
+                config.n_error += 1
+            recv_conn.close()
+            success &= problem_success
+
+            outputs[i].seek(0)
+            results[i] = outputs[i].read().decode(errors='replace')
+            outputs[i].close()
+            # Errors are part of the output of the problem itself.
+            localbars[i].done(True, 'Done' if problem_success else 'Failed')
+
+        # Print the output of all finished problems, in order.
+        while next_print < len(problems) and results[next_print] is not None:
+            bar.write(results[next_print])
+            next_print += 1
+
+    bar.finalize(print_done=False)
+    return success
+
+
 # Takes a Namespace object returned by argparse.parse_args().
 def run_parsed_arguments(args):
     # Process arguments
@@ -768,6 +1023,11 @@ def run_parsed_arguments(args):
         else:
             config.args.testcases = []
 
+    # Start with an empty run report. Records are appended to it while running.
+    if config.args.report:
+        config.args.report = config.args.report.resolve()
+        config.args.report.write_text('')
+
     # Skel commands.
     if action == 'new_contest':
         skel.new_contest()
@@ -860,82 +1120,30 @@ def run_parsed_arguments(args):
 
     success = True
 
-    for problem in problems:
-        if (
+    problems_to_run = [
+        problem
+        for problem in problems
+        if not (
             level == 'problemset'
             and action in ['pdf', 'export', 'update_problems_yaml']
             and not config.args.all
-        ):
-            continue
-        print(Style.BRIGHT, 'PROBLEM ', problem.name, Style.RESET_ALL, sep='', file=sys.stderr)
-
-        if action in ['generate']:
-            success &= generate.generate(problem)
-        if action in ['all', 'constraints', 'run'] and not config.args.no_generate:
-            # Call `generate` with modified arguments.
-            old_args = argparse.Namespace(**vars(config.args))
-            config.args.check_deterministic = action in ['all', 'constraints']
-            config.args.jobs = os.cpu_count() // 2
-            config.args.add_manual = False
-            config.args.move_manual = False
-            config.args.verbose = 0
-            config.args.skip_visualizer = True
-            success &= generate.generate(problem)
-            config.args = old_args
-        if action in ['fuzz']:
-            success &= fuzz.fuzz(problem)
-        if action in ['pdf', 'all']:
-            # only build the pdf on the problem level, or on the contest level when
-            # --all is passed.
-            if level == 'problem' or (level == 'problemset' and config.args.all):
-                success &= latex.build_problem_pdf(problem)
-        if action in ['solutions']:
-            if level == 'problem':
-                success &= latex.build_problem_pdf(problem, solutions=True)
-        if action in ['validate', 'all']:
-            if not (action == 'validate' and config.args.output):
-                success &= problem.validate_format('input_format')
-        if action in ['validate', 'output', 'all']:
-            if not (action == 'validate' and config.args.input):
-                success &= problem.validate_format('output_format')
-        if action in ['run', 'all']:
-            success &= problem.run_submissions()
-        if action in ['test']:
-            config.args.no_bar = True
-            success &= problem.test_submissions()
-        if action in ['constraints']:
-            success &= constraints.check_constraints(problem)
-        if action in ['zip']:
-            output = problem.path.with_suffix('.zip')
-
-            problem_zips.append(output)
-            if not config.args.skip:
-
-                # Set up arguments for generate.
-                old_args = argparse.Namespace(**vars(config.args))
-                config.args.check_deterministic = not config.args.force
-                config.args.jobs = None
-                config.args.add_manual = False
-                config.args.move_manual = False
-                config.args.verbose = 0
-                config.args.testcases = None
-                config.args.force = False
-                success &= generate.generate(problem)
-                config.args = old_args
-
-                success &= latex.build_problem_pdf(problem)
-                if not config.args.force:
-                    success &= problem.validate_format('input_format', constraints={})
-                    success &= problem.validate_format('output_format', constraints={})
-
-                # Write to problemname.zip, where we strip all non-alphanumeric from the
-                # problem directory name.
-                success &= export.build_problem_zip(problem, output)
-        if action == 'all' and config.args.cleanup_generated:
-            success &= generate.cleanup_generated(problem)
-
-        if len(problems) > 1:
-            print(file=sys.stderr)
+        )
+    ]
+
+    if (
+        level == 'problemset'
+        and action in PARALLEL_PROBLEM_ACTIONS
+        and config.args.problem_jobs
+        and config.args.problem_jobs > 1
+        and len(problems_to_run) > 1
+        and not is_windows()
+    ):
+        success &= run_problems_in_parallel(problems_to_run, level, config.args.problem_jobs)
+    else:
+        for problem in problems_to_run:
+            success &= run_problem(problem, level, problem_zips)
+            if len(problems) > 1:
+                print(file=sys.stderr)
 
     if level == 'problemset':
         print(f'{Style.BRIGHT}CONTEST {contest}{Style.RESET_ALL}', file=sys.stderr)
@@ -1010,7 +1218,10 @@ def main():
 
     parser = build_parser()
     parser.set_defaults(**read_personal_config())
-    run_parsed_arguments(parser.parse_args())
+    try:
+        run_parsed_arguments(parser.parse_args())
+    finally:
+        kill_process_groups()
 
 
 if __name__ == '__main__':
@@ -1031,5 +1242,6 @@ def test(args):
         parser = build_parser()
         run_parsed_arguments(parser.parse_args(args))
     finally:
+        kill_process_groups()
         os.chdir(original_directory)
         ProgressBar.current_bar = None
@@ -1,9 +1,12 @@
 # read problem settings from config files
 
+import hashlib
 import platform
 import shutil
 import time
+import contextlib
 import copy
+import mmap
 import subprocess
 import sys
 import os
@@ -66,6 +69,20 @@ def fatal(msg):
     exit(1)
 
 
+# A contiguous block of output of a ProgressBar, e.g. all runs of one submission.
+# See ProgressBar.add_section.
+class ProgressSection:
+    def __init__(self, prefix, item_width):
+        self.prefix = prefix
+        self.item_width = item_width
+        # Lines logged while an earlier section was still in progress.
+        self.lines = []
+        self.active = False
+        self.logged = False
+        # The summary line, set when all items of this section are done.
+        self.message = None
+
+
 # A class that draws a progressbar.
 # Construct with a constant prefix, the max length of the items to process, and
 # the number of items to process.
@@ -131,6 +148,11 @@ class ProgressBar:
         self.in_progress = set()
         self.item = None
 
+        # Sections that are not yet finished, in order of creation.
+        self.sections = []
+        # The section a copy returned by start() logs to.
+        self.section = None
+
         self.needs_leading_newline = needs_leading_newline
 
     def total_width(self):
@@ -213,7 +235,7 @@ class ProgressBar:
             else:
                 print(self.get_prefix(), bar, sep='', end='\r', flush=True, file=sys.stderr)
 
-    def start(self, item=''):
+    def start(self, item='', *, section=None):
         self.lock.acquire()
         # start may only be called on the root bar.
         assert self.parent is None
@@ -226,6 +248,10 @@ class ProgressBar:
         self.in_progress.add(item)
         bar_copy = copy.copy(self)
         bar_copy.parent = self
+        if section is not None:
+            bar_copy.section = section
+            bar_copy.prefix = section.prefix
+            bar_copy.item_width = section.item_width
 
         if config.args.no_bar:
             self.lock.release()
@@ -258,27 +284,25 @@ class ProgressBar:
         self.clearline()
         self.logged = True
 
-        if self.parent:
-            self.parent.global_logged = True
-            if self.parent.needs_leading_newline:
-                print(file=sys.stderr)
-                self.parent.needs_leading_newline = False
+        line = ''.join(
+            [self.get_prefix(), color, message, ProgressBar._format_data(data), Style.RESET_ALL]
+        )
+
+        if self.section:
+            self.parent._section_log(self.section, line)
         else:
-            self.global_logged = True
-            if self.needs_leading_newline:
-                print(file=sys.stderr)
-                self.needs_leading_newline = False
+            if self.parent:
+                self.parent.global_logged = True
+                if self.parent.needs_leading_newline:
+                    print(file=sys.stderr)
+                    self.parent.needs_leading_newline = False
+            else:
+                self.global_logged = True
+                if self.needs_leading_newline:
+                    print(file=sys.stderr)
+                    self.needs_leading_newline = False
 
-        print(
-            self.get_prefix(),
-            color,
-            message,
-            ProgressBar._format_data(data),
-            Style.RESET_ALL,
-            sep='',
-            flush=True,
-            file=sys.stderr,
-        )
+            print(line, flush=True, file=sys.stderr)
 
         if resume:
             if self.parent:
@@ -350,6 +374,84 @@ class ProgressBar:
             return True
         return False
 
+    # Print text that was not produced through this bar, e.g. the captured output
+    # of another process, without messing up the bar.
+    def write(self, text):
+        self.lock.acquire()
+        self.clearline()
+        print(text, end='', flush=True, file=sys.stderr)
+        if self.parent:
+            self.parent._resume()
+        else:
+            self._resume()
+        self.lock.release()
+
+    # Sections keep the output of items that are processed concurrently but belong
+    # to different groups (e.g. runs of different submissions) together.
+    # Items are assigned to a section via start(item, section=section).
+    # Lines of the oldest unfinished section are printed directly. Lines of later
+    # sections are buffered until all earlier sections are done.
+    # Each section ends with a summary line passed to end_section(). When the summary is
+    # empty, only the lines logged by the section are printed.
+    def add_section(self, prefix, max_len):
+        assert self.parent is None
+        section = ProgressSection(prefix, max_len + 1)
+        self.lock.acquire()
+        self.sections.append(section)
+        if len(self.sections) == 1:
+            self._activate_section(section)
+        self.lock.release()
+        return section
+
+    def end_section(self, section, message):
+        assert self.parent is None
+        self.lock.acquire()
+        self.clearline()
+        section.message = message
+        while len(self.sections) > 0 and self.sections[0].message is not None:
+            done = self.sections.pop(0)
+            if done.message:
+                print(
+                    ProgressBar.action(done.prefix, None, done.item_width, self.total_width()),
+                    done.message,
+                    sep='',
+                    file=sys.stderr,
+                )
+            # When something was printed, add a newline between sections.
+            if done.logged:
+                print(file=sys.stderr)
+            if done.message:
+                self.needs_leading_newline = not done.logged
+            if len(self.sections) > 0:
+                self._activate_section(self.sections[0])
+        self._resume()
+        self.lock.release()
+
+    def _activate_section(self, section):
+        assert self.lock.locked()
+        section.active = True
+        # The bar itself shows the prefix of the section currently being printed.
+        self.prefix = section.prefix
+        self.item_width = section.item_width
+        if len(section.lines) > 0:
+            if self.needs_leading_newline:
+                print(file=sys.stderr)
+                self.needs_leading_newline = False
+            for line in section.lines:
+                print(line, file=sys.stderr)
+            section.lines = []
+
+    def _section_log(self, section, line):
+        assert self.lock.locked()
+        if section.active:
+            if self.needs_leading_newline:
+                print(file=sys.stderr)
+                self.needs_leading_newline = False
+            print(line, flush=True, file=sys.stderr)
+        else:
+            section.lines.append(line)
+        section.logged = True
+
     # Print a final 'Done' message in case nothing was printed yet.
     # When 'message' is set, always print it.
     def finalize(self, *, print_done=True, message=None):
@@ -528,6 +630,72 @@ def glob(path, expression, include_hidden=False):
     return sorted(p for p in path.glob(expression) if keep(p))
 
 
+# Memory-map the file at path for reading, so that large files are not read into memory.
+# Supports the buffer protocol, so it can be used with re and memoryview.
+@contextlib.contextmanager
+def map_file(path):
+    with open(path, 'rb') as f:
+        # Empty files can not be mapped.
+        if os.fstat(f.fileno()).st_size == 0:
+            yield b''
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            yield data
+
+
+# The sha256 hash of the contents of a file.
+def hash_file(path, buffer_size=65536):
+    sha = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(buffer_size)
+            if not data:
+                break
+            sha.update(data)
+    return sha.hexdigest()
+
+
+# The sha256 hash of the whitespace separated tokens of a file, so that files that only
+# differ in the amount and type of whitespace have the same hash.
+def hash_file_tokens(path, buffer_size=65536):
+    sha = hashlib.sha256()
+    # The last token of the previous chunk, which may continue in the next chunk.
+    rest = b''
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(buffer_size)
+            if not data:
+                break
+            tokens = (rest + data).split()
+            rest = tokens.pop() if tokens and not data[-1:].isspace() else b''
+            if tokens:
+                sha.update(b' '.join(tokens) + b' ')
+    if rest:
+        sha.update(rest + b' ')
+    return sha.hexdigest()
+
+
+# The sha256 hash of the contents of a file, or of all files in a directory
+# (including their relative paths).
+def hash_path(path):
+    if not path.is_dir():
+        return hash_file(path)
+    values = []
+    for f in sorted(path.rglob('*')):
+        if f.is_file():
+            values += [f.relative_to(path), hash_file(f)]
+    return combine_hashes(values)
+
+
+# The sha256 hash of a list of strings, e.g. other hashes.
+def combine_hashes(values):
+    sha = hashlib.sha256()
+    for value in values:
+        sha.update(str(value).encode('utf-8'))
+        sha.update(b'\0')
+    return sha.hexdigest()
+
+
 def strip_newline(s):
     if s.endswith('\n'):
         return s[:-1]
@@ -702,6 +870,19 @@ class ExecResult:
         self.out = out
         self.verdict = verdict
         self.print_verdict_ = print_verdict
+        # The cpu the program was pinned to with --pin-cores.
+        self.core = None
+        # All measured durations when the program was run multiple times with --repeat.
+        self.durations = None
+        # The exit code, wall time in seconds, and peak resident memory in bytes of the
+        # program, when known.
+        self.returncode = None
+        self.wall_time = None
+        self.peak_rss = None
+        # For runs of submissions: the cpu time used by the output validator, and whether a
+        # RUN_TIME_ERROR was classified as exceeding the memory limit.
+        self.validator_time = None
+        self.memory_limit_exceeded = False
 
     def print_verdict(self):
         if self.print_verdict_:
@@ -709,8 +890,27 @@ class ExecResult:
         return self.verdict
 
 
-def limit_setter(command, timeout, memory_limit):
+# The peak resident memory in bytes of a child process that exited, from its rusage, or None
+# when it is unknown.
+# The child is started from a fork of BAPCtools, and its ru_maxrss includes the memory it
+# inherited before calling exec. This is at most the peak memory usage of BAPCtools itself,
+# so only values above that floor, measured after the child exited, are the memory usage of
+# the program itself.
+def peak_rss(rusage):
+    if rusage is None:
+        return None
+    floor = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if rusage.ru_maxrss <= floor:
+        return None
+    # ru_maxrss is in bytes on Mac and in kilobytes elsewhere.
+    return rusage.ru_maxrss if is_mac() else rusage.ru_maxrss * 1024
+
+
+def limit_setter(command, timeout, memory_limit, cpu=None):
     def setlimits():
+        if cpu is not None:
+            os.sched_setaffinity(0, {cpu})
+
         if timeout:
             resource.setrlimit(resource.RLIMIT_CPU, (timeout + 1, timeout + 1))
 
@@ -771,6 +971,38 @@ class ResourcePopen(subprocess.Popen):
             return (pid, sts)
 
 
+# Long-running helper processes, like validators in batch mode, each run in their own process
+# group so that forked children can be killed together with them. Ctrl-C is not delivered to
+# these groups, so all remaining ones are killed by kill_process_groups when BAPCtools exits.
+_process_groups = set()
+_process_groups_lock = threading.Lock()
+
+
+# Start `command` in a new process group, with the same arguments as subprocess.Popen.
+def popen_process_group(command, **kwargs):
+    process = subprocess.Popen(command, start_new_session=True, **kwargs)
+    with _process_groups_lock:
+        _process_groups.add(process)
+    return process
+
+
+def kill_process_group(process):
+    with _process_groups_lock:
+        _process_groups.discard(process)
+    try:
+        os.killpg(process.pid, signal.SIGKILL)
+    except OSError:
+        pass
+    process.wait()
+
+
+def kill_process_groups():
+    with _process_groups_lock:
+        processes = list(_process_groups)
+    for process in processes:
+        kill_process_group(process)
+
+
 # Run `command`, returning stderr if the return code is unexpected.
 def exec_command(command, expect=0, crop=True, **kwargs):
     # By default: discard stdout, return stderr
@@ -803,6 +1035,8 @@ def exec_command(command, expect=0, crop=True, **kwargs):
     if (is_windows() or is_wsl()) and 'memory' in kwargs:
         kwargs.pop('memory')
 
+    cpu = kwargs.pop('cpu', None)
+
     process = None
 
     def interrupt_handler(sig, frame):
@@ -822,7 +1056,7 @@ def exec_command(command, expect=0, crop=True, **kwargs):
         if not is_windows() and not is_wsl():
             process = ResourcePopen(
                 command,
-                preexec_fn=limit_setter(command, timeout, get_memory_limit(kwargs)),
+                preexec_fn=limit_setter(command, timeout, get_memory_limit(kwargs), cpu),
                 **kwargs,
             )
         else:
@@ -871,7 +1105,12 @@ def exec_command(command, expect=0, crop=True, **kwargs):
     else:
         duration = tend - tstart
 
-    return ExecResult(ok, duration, err, out)
+    result = ExecResult(ok, duration, err, out)
+    result.returncode = process.returncode
+    result.wall_time = tend - tstart
+    if getattr(process, 'rusage', None) is not None:
+        result.peak_rss = peak_rss(process.rusage)
+    return result
 
 
 def inc_label(label):
@@ -1,13 +1,184 @@
 import program
 import re
+import select
+import subprocess
+import threading
 from util import *
 
 
+# A validator process running in batch mode, see batch_protocol in headers/validation.h.
+class _BatchServer:
+    # forking: whether the server validates each file in a forked process. Otherwise, the cpu
+    # time limit is not set, since the server accumulates the cpu time of all files.
+    def __init__(self, command, cwd, forking):
+        command = [str(x) for x in command]
+        self.process = None
+        self.alive = False
+        try:
+            # Kill forked children of the server together with the server.
+            self.process = popen_process_group(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=cwd,
+                preexec_fn=limit_setter(
+                    command, config.get_timeout() if forking else None, get_memory_limit()
+                ),
+            )
+        except OSError:
+            # The interpreter, e.g. java, is not installed.
+            return
+        self.buffer = b''
+        self.alive = self._read_line(config.get_timeout()) == 'batch'
+
+    # Read a line from the server. Returns None on EOF or after timeout seconds.
+    def _read_line(self, timeout):
+        fd = self.process.stdout.fileno()
+        deadline = time.monotonic() + timeout
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                return None
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                return None
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.decode()
+
+    # Validate in_path with the given arguments, running in directory cwd.
+    # Returns the exit code, or None when the server died or timed out.
+    def request(self, in_path, cwd, args, timeout):
+        fields = [in_path, cwd] + args
+        try:
+            self.process.stdin.write(b''.join(os.fsencode(str(x)) + b'\0' for x in fields) + b'\0')
+            self.process.stdin.flush()
+        except OSError:
+            self.kill()
+            return None
+        line = self._read_line(timeout)
+        if line is None:
+            self.kill()
+            return None
+        return int(line)
+
+    def kill(self):
+        self.alive = False
+        if self.process is not None:
+            kill_process_group(self.process)
+
+
 class Validator(program.Program):
 
     # NOTE: This only works for checktestdata and Viva validators.
     FORMAT_VALIDATOR_LANGUAGES = ['checktestdata', 'viva']
 
+    def __init__(self, problem, path, **kwargs):
+        super().__init__(problem, path, **kwargs)
+        # The command to start the validator in batch mode, or False when batch mode is not
+        # supported. None until first checked.
+        self._batch = None
+        # Whether a batch mode process was started successfully, and whether a thread is
+        # starting the first one.
+        self._batch_checked = False
+        self._batch_probing = False
+        # Idle batch mode processes of this validator.
+        self._batch_servers = []
+        self._batch_lock = threading.Lock()
+
+    # Validators opt in to batch mode by calling batch_protocol(argc, argv) from
+    # headers/validation.h at the start of main, or by importing headers/validation.py.
+    # Viva validators are run in batch mode by support/VivaServer.java, which keeps the
+    # JVM and the parsed pattern alive between files.
+    # Returns the command to start the validator in batch mode, or False.
+    def _batch_command(self):
+        if is_windows() or self.language == 'checktestdata':
+            return False
+        if self.language == 'viva':
+            return [
+                'java',
+                '-cp',
+                self.env['viva_jar'],
+                config.tools_root / 'support' / 'VivaServer.java',
+                self.env['mainfile'],
+                '--batch',
+            ]
+        marker = re.compile(
+            r'^\s*(batch_protocol\(\s*argc\s*,\s*argv\s*\)\s*;|import validation\s*$)', re.MULTILINE
+        )
+        for f in self.source_files:
+            try:
+                if marker.search(f.read_text()):
+                    return self.run_command + ['--batch']
+            except (UnicodeDecodeError, OSError):
+                pass
+        return False
+
+    # Validate the file in_path like exec_command(self.run_command + args, stdin=in_path),
+    # using a validator process in batch mode.
+    # Returns an ExecResult, or None when batch mode is not supported.
+    def _run_batch(self, in_path, cwd, args, expect):
+        args = [str(x) for x in args]
+        # Empty strings can not be sent to the server, since they end a request.
+        if '' in args:
+            return None
+        with self._batch_lock:
+            if self._batch is None:
+                self._batch = self._batch_command()
+            if not self._batch:
+                return None
+            command = self._batch
+            server = self._batch_servers.pop() if self._batch_servers else None
+            if server is None:
+                if self._batch_probing:
+                    # Do not wait for the handshake of the first process in other threads.
+                    return None
+                self._batch_probing = not self._batch_checked
+
+        if server is None:
+            server = _BatchServer(command, self.tmpdir, self.language != 'viva')
+            with self._batch_lock:
+                self._batch_probing = False
+                if server.alive:
+                    self._batch_checked = True
+                else:
+                    # The validator does not implement the protocol after all.
+                    self._batch = False
+            if not server.alive:
+                server.kill()
+                return None
+
+        for name in ['validator_stdout_', 'validator_stderr_']:
+            if (cwd / name).is_file():
+                (cwd / name).unlink()
+
+        timeout = config.get_timeout()
+        tstart = time.monotonic()
+        returncode = server.request(in_path.resolve(), cwd.resolve(), args, timeout)
+        tend = time.monotonic()
+        if server.alive:
+            with self._batch_lock:
+                self._batch_servers.append(server)
+
+        def read_output(name):
+            path = cwd / name
+            if not path.is_file():
+                return None
+            text = path.read_bytes().decode('utf-8', 'replace')
+            path.unlink()
+            return crop_output(text)
+
+        if returncode is None:
+            returncode = -signal.SIGKILL
+        ok = True if returncode == expect else returncode
+        result = ExecResult(
+            ok, tend - tstart, read_output('validator_stderr_'), read_output('validator_stdout_')
+        )
+        result.returncode = returncode
+        result.wall_time = tend - tstart
+        return result
+
     # Return ExecResult
     def _run_format_validator(self, testcase, cwd):
         assert self.language in Validator.FORMAT_VALIDATOR_LANGUAGES
@@ -28,6 +199,9 @@ class Validator(program.Program):
                 )
 
         if self.language == 'viva':
+            result = self._run_batch(main_path, cwd, [], expect=1 if bad else 0)
+            if result is not None:
+                return result
             # Called as `viva validator.viva testcase.in`.
             result = exec_command(
                 self.run_command + [main_path.resolve()], expect=1 if bad else 0, cwd=cwd
@@ -35,9 +209,27 @@ class Validator(program.Program):
             return result
 
 
+# Merge the constraints in new into constraints. Both map a location to a tuple
+# (name, has_low, has_high, vmin, vmax, low, high).
+def merge_constraints(constraints, new):
+    for loc, (name, has_low, has_high, vmin, vmax, low, high) in new.items():
+        if loc in constraints:
+            c = constraints[loc]
+            has_low |= c[1]
+            has_high |= c[2]
+            if c[3] < vmin:
+                vmin = c[3]
+                low = c[5]
+            if c[4] > vmax:
+                vmax = c[4]
+                high = c[6]
+        constraints[loc] = (name, has_low, has_high, vmin, vmax, low, high)
+
+
 def _merge_constraints(constraints_path, constraints):
     # Merge with previous constraints.
     if constraints_path.is_file():
+        new = {}
         for line in constraints_path.read_text().splitlines():
             loc, name, has_low, has_high, vmin, vmax, low, high = line.split()
             has_low = bool(int(has_low))
@@ -50,17 +242,8 @@ def _merge_constraints(constraints_path, constraints):
                 vmax = int(vmax)
             except:
                 vmax = float(vmax)
-            if loc in constraints:
-                c = constraints[loc]
-                has_low |= c[1]
-                has_high |= c[2]
-                if c[3] < vmin:
-                    vmin = c[3]
-                    low = c[5]
-                if c[4] > vmax:
-                    vmax = c[4]
-                    high = c[6]
-            constraints[loc] = (name, has_low, has_high, vmin, vmax, low, high)
+            merge_constraints(new, {loc: (name, has_low, has_high, vmin, vmax, low, high)})
+        merge_constraints(constraints, new)
 
         constraints_path.unlink()
 
@@ -92,11 +275,13 @@ class InputValidator(Validator):
             assert isinstance(args, list)
             run_command += args
 
-        with testcase.in_path.open() as in_file:
-            ret = exec_command(
-                run_command,
-                expect=config.RTV_WA if testcase.bad_input else config.RTV_AC,
-                stdin=in_file,
+        expect = config.RTV_WA if testcase.bad_input else config.RTV_AC
+        ret = self._run_batch(testcase.in_path, cwd, run_command[len(self.run_command) :], expect)
+        if ret is None:
+            ret = self._exec(
+                run_command[len(self.run_command) :],
+                expect=expect,
+                stdin_path=testcase.in_path,
                 cwd=cwd,
                 timeout=config.get_timeout(),
             )
@@ -116,9 +301,10 @@ class InputValidator(Validator):
 class OutputValidator(Validator):
     subdir = 'output_validators'
 
-    # When run is None, validate the testcase. Otherwise, validate the output of the given run.
+    # When run is None, validate the testcase. Otherwise, validate the output of the given run,
+    # read from out_file when given and from run.out_path otherwise.
     # Return ExecResult
-    def run(self, testcase, run=None, constraints=None, args=None):
+    def run(self, testcase, run=None, constraints=None, args=None, out_file=None):
         if run is None:
             # When used as a format validator, act like an InputValidator.
             cwd = self.problem.tmpdir / 'data' / testcase.short_path.with_suffix('.feedbackdir')
@@ -145,11 +331,15 @@ class OutputValidator(Validator):
                 assert isinstance(args, list)
                 run_command += args
 
-            with testcase.ans_path.open() as ans_file:
-                ret = exec_command(
-                    run_command,
-                    expect=config.RTV_WA if testcase.bad_output else config.RTV_AC,
-                    stdin=ans_file,
+            expect = config.RTV_WA if testcase.bad_output else config.RTV_AC
+            ret = self._run_batch(
+                testcase.ans_path, cwd, run_command[len(self.run_command) :], expect
+            )
+            if ret is None:
+                ret = self._exec(
+                    run_command[len(self.run_command) :],
+                    expect=expect,
+                    stdin_path=testcase.ans_path,
                     cwd=cwd,
                     timeout=config.get_timeout(),
                 )
@@ -164,14 +354,24 @@ class OutputValidator(Validator):
         if self.language in Validator.FORMAT_VALIDATOR_LANGUAGES:
             return False
 
-        with run.out_path.open() as out_file:
+        args = (
+            [testcase.in_path.resolve(), testcase.ans_path.resolve(), run.feedbackdir]
+            + self.problem.settings.validator_flags
+            + (args if args else [])
+        )
+        if out_file is not None:
+            # The output is read while the submission is still running, see Run._run_streaming.
             return exec_command(
-                self.run_command
-                + [testcase.in_path.resolve(), testcase.ans_path.resolve(), run.feedbackdir]
-                + self.problem.settings.validator_flags
-                + (args if args else []),
+                self.run_command + args,
                 expect=config.RTV_AC,
                 stdin=out_file,
                 cwd=run.feedbackdir,
-                timeout=config.get_timeout(),
+                timeout=config.get_timeout() + self.problem.settings.timeout,
             )
+        return self._exec(
+            args,
+            expect=config.RTV_AC,
+            stdin_path=run.out_path,
+            cwd=run.feedbackdir,
+            timeout=config.get_timeout(),
+        )
@@ -0,0 +1,177 @@
+import select
+import subprocess
+import threading
+from util import *
+
+# Run Python generators, validators, and visualizers in forked copies of a warm interpreter,
+# see support/zygote.py. Starting the interpreter and importing modules like numpy often
+# takes much longer than generating or validating a small testcase.
+# Submissions are never run this way, since their timing must be the same as on the judges.
+
+# The languages in config/languages.yaml that are run as `<interpreter> {mainfile}` with a
+# Python 3 interpreter.
+PYTHON3_LANGUAGES = ['python3', 'python3b', 'cpython3', 'cpython3b', 'cpython']
+
+
+# A running support/zygote.py process.
+class _Server:
+    def __init__(self, command, tmpdir, index):
+        command = [str(x) for x in command]
+        self.process = None
+        self.alive = False
+        # The files the stdout and stderr of runs are written to, when not given.
+        self.stdout_path = tmpdir / f'zygote_{index}_stdout_'
+        self.stderr_path = tmpdir / f'zygote_{index}_stderr_'
+        try:
+            # Kill forked children of the server together with the server.
+            self.process = popen_process_group(
+                command,
+                stdin=subprocess.PIPE,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.DEVNULL,
+                cwd=tmpdir,
+                # The cpu time limit is set for each run by the forked children.
+                preexec_fn=limit_setter(command, None, get_memory_limit()),
+            )
+        except OSError:
+            return
+        self.buffer = b''
+        self.alive = self._read_line(config.get_timeout()) == 'zygote'
+
+    # Read a line from the server. Returns None on EOF or after timeout seconds.
+    def _read_line(self, timeout):
+        fd = self.process.stdout.fileno()
+        deadline = time.monotonic() + timeout
+        while b'\n' not in self.buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                return None
+            chunk = os.read(fd, 4096)
+            if not chunk:
+                return None
+            self.buffer += chunk
+        line, self.buffer = self.buffer.split(b'\n', 1)
+        return line.decode()
+
+    # Returns the (exit code, cpu time, peak rss) of the run, or None when the server died or
+    # timed out. The peak rss is None when it is not above that of the server.
+    def request(self, fields, timeout):
+        try:
+            self.process.stdin.write(b''.join(os.fsencode(str(x)) + b'\0' for x in fields) + b'\0')
+            self.process.stdin.flush()
+        except OSError:
+            self.kill()
+            return None
+        line = self._read_line(timeout)
+        if line is None:
+            self.kill()
+            return None
+        returncode, duration, maxrss = line.split()
+        return int(returncode), float(duration), int(maxrss) if maxrss != '-1' else None
+
+    def kill(self):
+        self.alive = False
+        if self.process is not None:
+            kill_process_group(self.process)
+
+
+# The zygote servers of a single program.
+class Zygote:
+    def __init__(self, program):
+        self.command = None
+        if (
+            not config.args.no_zygote
+            and not is_windows()
+            and program.language in PYTHON3_LANGUAGES
+            and len(program.run_command) == 2
+        ):
+            self.command = [
+                program.run_command[0],
+                config.tools_root / 'support' / 'zygote.py',
+                program.run_command[1],
+            ]
+        self.tmpdir = program.tmpdir
+        # Idle servers.
+        self._servers = []
+        self._count = 0
+        self._lock = threading.Lock()
+
+    # Run the program with the given arguments like exec_command, with stdin and stdout read
+    # from and written to the given paths. When stdout_path is None, stdout is returned.
+    # Returns an ExecResult, or None when the program can not be run in a zygote.
+    def run(self, args, *, cwd, timeout, expect=0, stdin_path=None, stdout_path=None):
+        args = [str(x) for x in args]
+        # Empty strings can not be sent to the server.
+        if '' in args:
+            return None
+        with self._lock:
+            if self.command is None:
+                return None
+            if self._servers:
+                server = self._servers.pop()
+            else:
+                server = None
+                self._count += 1
+                index = self._count
+
+        if server is None:
+            server = _Server(self.command, self.tmpdir, index)
+            if not server.alive:
+                # E.g. the interpreter is not installed, or it is not Python 3 after all.
+                server.kill()
+                with self._lock:
+                    self.command = None
+                return None
+
+        stdout = stdout_path or server.stdout_path
+        fields = [
+            Path(cwd).resolve(),
+            Path(stdin_path).resolve() if stdin_path else os.devnull,
+            Path(stdout).resolve(),
+            server.stderr_path.resolve(),
+            int(timeout) + 1 if timeout else 0,
+        ] + args
+
+        if config.args.verbose >= 2:
+            print('cd', cwd, '; ', end='', file=sys.stderr)
+            print(*self.command, *args, end='', file=sys.stderr)
+            if stdin_path:
+                print(' < ', stdin_path, end='', file=sys.stderr)
+            print(file=sys.stderr)
+
+        tstart = time.monotonic()
+        reply = server.request(fields, timeout or config.DEFAULT_TIMEOUT)
+        tend = time.monotonic()
+        if server.alive:
+            with self._lock:
+                self._servers.append(server)
+
+        if reply is None:
+            # Timeout, or the server died. Like exec_command, report the run as killed.
+            returncode, duration, maxrss = -signal.SIGKILL, tend - tstart, None
+        else:
+            returncode, duration, maxrss = reply
+
+        # -2 corresponds to SIGINT, as in exec_command. Ctrl-C itself is not delivered to the
+        # process group of the server, which is killed when BAPCtools exits instead.
+        if returncode == -signal.SIGINT:
+            if threading.current_thread() is threading.main_thread():
+                fatal('Child process interrupted.')
+            else:
+                raise ChildProcessError()
+
+        def read_output(path):
+            if not path.is_file():
+                return None
+            text = path.read_bytes().decode('utf-8', 'replace')
+            path.unlink()
+            return crop_output(text)
+
+        ok = True if returncode == expect else returncode
+        out = read_output(server.stdout_path) if stdout_path is None else None
+        result = ExecResult(ok, duration, read_output(server.stderr_path), out)
+        result.returncode = returncode
+        result.wall_time = tend - tstart
+        if maxrss is not None:
+            result.peak_rss = maxrss if is_mac() else maxrss * 1024
+        return result
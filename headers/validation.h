@@ -14,10 +14,15 @@
 // Compile with -Duse_source_location to enable
 // std::experimental::source_location. This is needed for constraints checking.
 
+// Input validators, and output validators validating .ans files, can support a batch mode to
+// validate many files with a single validator process, by calling batch_protocol(argc, argv)
+// at the start of main. See batch_protocol below.
+
 #include <algorithm>
 #include <array>
 #include <bitset>
 #include <cassert>
+#include <cerrno>
 #include <charconv>
 #include <cstring>
 #include <fstream>
@@ -38,6 +43,12 @@
 #include <variant>
 #include <vector>
 
+#if __has_include(<sys/wait.h>)
+#include <fcntl.h>
+#include <sys/wait.h>
+#include <unistd.h>
+#endif
+
 #ifdef use_source_location
 #include <experimental/source_location>
 constexpr bool has_source_location = true;
@@ -73,6 +84,7 @@ const std::string_view ws_sensitive_flag         = "space_change_sensitive";
 const std::string_view constraints_file_flag     = "--constraints_file";
 const std::string_view generate_flag             = "--generate";
 const std::string_view generate_binary_substring = "generat";
+const std::string_view batch_flag                = "--batch";
 
 inline struct ArbitraryTag {
 	static constexpr bool unique     = false;
@@ -576,6 +588,106 @@ T& select(std::pair<T, T>& in, std::mt19937_64& rng) {
 
 } // namespace Random
 
+// When run as `./validator --batch`, the validator reads requests from stdin. Each request
+// is a list of NUL-terminated strings, followed by an empty string:
+//     input file, working directory, arguments...
+// For each request, the process forks. The child validates the input file as if it was
+// called as `./validator arguments... < input` in the working directory, with stdout and
+// stderr written to validator_stdout_ and validator_stderr_ in that directory.
+// The parent writes the exit code of the child to stdout, followed by a newline.
+// A child killed by a signal is reported as minus the signal number.
+//
+// On startup, the process writes "batch\n" to stdout, and it exits when stdin is closed.
+// Relative paths in a request are relative to its working directory.
+//
+// Validators opt in to batch mode by calling this at the start of main, before reading
+// anything from stdin:
+//     int main(int argc, char** argv) {
+//         batch_protocol(argc, argv);
+//         InputValidator v(argc, argv);
+// When not in batch mode, this does nothing. Otherwise, this only returns in the child
+// processes, with argc and argv replaced by the arguments of the request.
+inline void batch_protocol(int& argc, char**& argv) {
+	if(argc != 2 or argv[1] != batch_flag) return;
+#if __has_include(<sys/wait.h>)
+	auto write_all = [](const std::string& s) {
+		for(size_t pos = 0; pos < s.size();) {
+			auto n = write(1, s.data() + pos, s.size() - pos);
+			if(n < 0 and errno == EINTR) continue;
+			if(n < 0) exit(1);
+			pos += n;
+		}
+	};
+	std::string buffer;
+	size_t pos = 0;
+	// Read the next NUL-terminated string from stdin. Returns false on EOF.
+	auto read_string = [&](std::string& s) {
+		while(true) {
+			auto end = buffer.find('\0', pos);
+			if(end != std::string::npos) {
+				s   = buffer.substr(pos, end - pos);
+				pos = end + 1;
+				return true;
+			}
+			buffer.erase(0, pos);
+			pos = 0;
+			char chunk[4096];
+			auto n = read(0, chunk, sizeof chunk);
+			if(n < 0 and errno == EINTR) continue;
+			if(n <= 0) return false;
+			buffer.append(chunk, n);
+		}
+	};
+	auto redirect = [](int fd, const std::string& path, int flags) {
+		int file = open(path.c_str(), flags, 0644);
+		if(file < 0 or dup2(file, fd) < 0) {
+			std::cerr << "Could not open " << path << std::endl;
+			exit(1);
+		}
+		close(file);
+	};
+
+	write_all("batch\n");
+	std::vector<std::string> request;
+	while(true) {
+		request.clear();
+		std::string s;
+		while(read_string(s) and !s.empty()) request.push_back(s);
+		if(request.empty()) exit(0);
+		if(request.size() < 2) exit(1);
+
+		pid_t pid = fork();
+		if(pid < 0) exit(1);
+		if(pid == 0) {
+			if(chdir(request[1].c_str()) != 0) exit(1);
+			redirect(0, request[0], O_RDONLY);
+			redirect(1, "validator_stdout_", O_WRONLY | O_CREAT | O_TRUNC);
+			redirect(2, "validator_stderr_", O_WRONLY | O_CREAT | O_TRUNC);
+			// The strings must outlive the validator.
+			static std::vector<std::string> args;
+			static std::vector<char*> args_ptrs;
+			args = {argv[0]};
+			args.insert(args.end(), request.begin() + 2, request.end());
+			for(auto& arg : args) args_ptrs.push_back(arg.data());
+			args_ptrs.push_back(nullptr);
+			argc = int(args.size());
+			argv = args_ptrs.data();
+			return;
+		}
+
+		int status;
+		while(waitpid(pid, &status, 0) < 0) {
+			if(errno != EINTR) exit(1);
+		}
+		write_all(std::to_string(WIFEXITED(status) ? WEXITSTATUS(status) : -WTERMSIG(status)) +
+		          "\n");
+	}
+#else
+	std::cerr << batch_flag << " is not supported on this platform!";
+	exit(1);
+#endif
+}
+
 class Validator {
   protected:
 	Validator(bool ws_, bool case_, std::istream& in_, std::string constraints_file_path_ = "",
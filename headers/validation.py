@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Batch mode for Python input validators and output validators, see headers/validation.h.
+#
+# The easiest way to use this is to symlink it from a validator directory, and to import it
+# in the validator after importing all other libraries:
+#     import numpy
+#     import validation
+# When the validator is run as `./validator --batch`, the import only returns in a forked
+# copy of the process for each requested file, with stdin, the working directory and
+# sys.argv set up as if the validator was called normally. This way the interpreter is
+# started and libraries are imported only once. Otherwise, importing this does nothing.
+# BAPCtools only uses batch mode for validators with an `import validation` line.
+#
+# The protocol is the same as that of batch_protocol in validation.h. Since an empty string
+# ends a request, none of the arguments may be empty.
+
+import os
+import sys
+
+batch_flag = '--batch'
+
+
+def _write_all(data):
+    while data:
+        data = data[os.write(1, data) :]
+
+
+def _redirect(fd, path, flags):
+    try:
+        f = os.open(path, flags, 0o644)
+    except OSError:
+        print(f'Could not open {path}', file=sys.stderr)
+        os._exit(1)
+    os.dup2(f, fd)
+    os.close(f)
+
+
+def batch_protocol():
+    if sys.argv[1:] != [batch_flag]:
+        return
+
+    buffer = b''
+    _write_all(b'batch\n')
+    while True:
+        # Read a request: a list of NUL-terminated strings, followed by an empty string.
+        while b'\0\0' not in buffer and not buffer.startswith(b'\0'):
+            chunk = os.read(0, 4096)
+            if not chunk:
+                os._exit(0 if not buffer else 1)
+            buffer += chunk
+        if buffer.startswith(b'\0'):
+            os._exit(0)
+        request, buffer = buffer.split(b'\0\0', 1)
+        request = [os.fsdecode(s) for s in request.split(b'\0')]
+        if len(request) < 2:
+            os._exit(1)
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.chdir(request[1])
+            except OSError:
+                os._exit(1)
+            _redirect(0, request[0], os.O_RDONLY)
+            _redirect(1, 'validator_stdout_', os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            _redirect(2, 'validator_stderr_', os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+            sys.argv = sys.argv[:1] + request[2:]
+            return
+
+        _, status = os.waitpid(pid, 0)
+        if os.WIFEXITED(status):
+            code = os.WEXITSTATUS(status)
+        else:
+            code = -os.WTERMSIG(status)
+        _write_all(f'{code}\n'.encode())
+
+
+batch_protocol()
@@ -5,6 +5,7 @@
 // E.g., check that a graph is connected.
 
 int main(int argc, char** argv) {
+    batch_protocol(argc, argv);
     InputValidator v(argc, argv);
     int n = v.read_integer("n", 0, 100000);
     v.space();
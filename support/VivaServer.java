@@ -0,0 +1,88 @@
+// Validate many files against a single Viva pattern in one JVM.
+//
+// Run as `java -cp viva.jar VivaServer.java pattern.viva --batch`.
+// This implements the batch protocol of headers/validation.h: each request read from stdin
+// is a list of NUL-terminated strings (input file, working directory, arguments), followed
+// by an empty string. The Viva messages for the input file are written to validator_stdout_
+// in the working directory, and the exit code `java -jar viva.jar pattern.viva input` would
+// have (0 for valid files, 1 otherwise) is written to stdout, followed by a newline.
+// The input file must be an absolute path, since the working directory of the JVM can not
+// be changed.
+
+import java.io.BufferedInputStream;
+import java.io.ByteArrayOutputStream;
+import java.io.File;
+import java.io.FileInputStream;
+import java.io.FileOutputStream;
+import java.io.IOException;
+import java.io.InputStream;
+import java.io.PrintStream;
+import java.nio.charset.StandardCharsets;
+import java.util.ArrayList;
+import java.util.List;
+
+import org.vanb.viva.VIVA;
+
+public class VivaServer {
+	// Read a NUL-terminated string. Returns null on EOF.
+	static String readString(InputStream in) throws IOException {
+		ByteArrayOutputStream s = new ByteArrayOutputStream();
+		while(true) {
+			int c = in.read();
+			if(c < 0) return null;
+			if(c == 0) return s.toString(StandardCharsets.UTF_8.name());
+			s.write(c);
+		}
+	}
+
+	public static void main(String[] args) throws IOException {
+		if(args.length != 2 || !args[1].equals("--batch")) {
+			System.err.println("Usage: VivaServer pattern.viva --batch");
+			System.exit(1);
+		}
+
+		// Viva may write to System.out, which is used for the replies.
+		PrintStream replies = System.out;
+		System.setOut(System.err);
+
+		VIVA viva = new VIVA();
+		viva.setOutputStream(System.err);
+		boolean parsed;
+		try(InputStream pattern = new FileInputStream(args[0])) {
+			parsed = viva.setPattern(pattern);
+		}
+		// Without a valid pattern, let the caller fall back to running Viva for each file.
+		if(!parsed) System.exit(1);
+
+		replies.print("batch\n");
+		replies.flush();
+
+		InputStream in = new BufferedInputStream(System.in);
+		while(true) {
+			List<String> request = new ArrayList<>();
+			String s;
+			while((s = readString(in)) != null && !s.isEmpty()) request.add(s);
+			if(request.isEmpty()) System.exit(0);
+			if(request.size() < 2) System.exit(1);
+
+			File messagesFile = new File(request.get(1), "validator_stdout_");
+			boolean ok;
+			try(PrintStream messages =
+			        new PrintStream(new FileOutputStream(messagesFile), true, "UTF-8")) {
+				viva.setOutputStream(messages);
+				System.setOut(messages);
+				try {
+					ok = viva.testInputFile(request.get(0));
+				} catch(Exception e) {
+					e.printStackTrace(messages);
+					ok = false;
+				}
+				System.setOut(System.err);
+				viva.setOutputStream(System.err);
+			}
+
+			replies.print((ok ? 0 : 1) + "\n");
+			replies.flush();
+		}
+	}
+}
@@ -2,6 +2,7 @@
 #include <cassert>
 #include <cctype>
 #include <cmath>
+#include <cstdio>
 #include <fstream>
 #include <iomanip>
 #include <ios>
@@ -38,6 +39,65 @@ string quick_diff(const string& out, const string& ans) {
 	return {};
 }
 
+// Reads the team output from stdin in chunks, so that it is compared while the submission is
+// still writing it, and a wrong answer is reported as soon as the output diverges.
+struct OutputReader {
+	vector<char> buf = vector<char>(1 << 16);
+	size_t pos = 0, len = 0;
+
+	// Only the start of the output is stored, for quick_diff.
+	static constexpr size_t head_size = 256;
+	string head;
+	size_t newlines = 0;
+
+	int peek() {
+		if(pos == len) {
+			len = fread(buf.data(), 1, buf.size(), stdin);
+			pos = 0;
+			if(len == 0) return EOF;
+		}
+		return (unsigned char)buf[pos];
+	}
+	int get() {
+		int c = peek();
+		if(c == EOF) return EOF;
+		++pos;
+		if(head.size() < head_size) head += c;
+		if(c == '\n') ++newlines;
+		return c;
+	}
+	// Read until quick_diff can be computed.
+	void read_for_diff() {
+		while(newlines <= 1 and get() != EOF) {}
+	}
+};
+
+bool is_space(int c) { return c != EOF and isspace(c); }
+
+// Split into tokens, depending on space_change_sensitive.
+// With space_change_sensitive, each whitespace character is a separate token.
+// Returns false when there are no more tokens.
+template <typename Reader>
+bool next_word(Reader& s, string& w) {
+	w.clear();
+	if(not space_change_sensitive)
+		while(is_space(s.peek())) s.get();
+	if(s.peek() == EOF) return false;
+	if(is_space(s.peek())) {
+		w += s.get();
+		return true;
+	}
+	while(s.peek() != EOF and not is_space(s.peek())) w += s.get();
+	return true;
+}
+
+struct StringReader {
+	const string& s;
+	size_t pos = 0;
+	int peek() const { return pos < s.size() ? (unsigned char)s[pos] : EOF; }
+	int get() { return pos < s.size() ? (unsigned char)s[pos++] : EOF; }
+};
+
 pair<bool, string> default_output_validator(const string& ans_path, const string& feedback_dir) {
 	// Read answer.
 	string ans = [&] {
@@ -47,114 +107,113 @@ pair<bool, string> default_output_validator(const string& ans_path, const string
 		return ans_stream.str();
 	}();
 
-	// Read stdin.
-	string out = [] {
-		stringstream out_stream;
-		cin >> noskipws;
-		out_stream << cin.rdbuf();
-		return out_stream.str();
-	}();
-
-	if(out == ans) return {true, ""};
-
 	// Make lower case if needed.
-	if(not case_sensitive) {
-		for(auto& c : ans) c = tolower(c);
-		for(auto& c : out) c = tolower(c);
-		if(out == ans) return {true, "case"};
-	}
+	string ans_lower = ans;
+	if(not case_sensitive)
+		for(auto& c : ans_lower) c = tolower(c);
 
 	const auto& floatabs = float_absolute_tolerance;
 	const auto& floatrel = float_relative_tolerance;
+	const bool floats    = floatabs != 0 or floatrel != 0;
 
-	if(space_change_sensitive and floatabs == 0 and floatrel == 0)
-		return {false, quick_diff(out, ans)};
-
-	// Split into tokens, depending on space_change_sensitive.
-	auto words = [](const string& st) {
-		stringstream s(st);
-		vector<string> words;
+	vector<string> ans_words;
+	{
+		StringReader reader{ans_lower};
 		string w;
-		if(space_change_sensitive) {
-			s >> noskipws;
-			while(!s.eof()) {
-				if(s >> w) {
-					words.push_back(w);
-				} else {
-					s.clear();
-					assert(s.fail());
-					char c;
-					if(s >> c) {
-						assert(isspace(c));
-						words.emplace_back(1, c);
-					}
-				}
-			}
-		} else {
-			while(s >> w) words.push_back(w);
-		}
-		return words;
-	};
-	const auto ans_words = words(ans);
-	const auto out_words = words(out);
-
-	if(ans_words == out_words) {
-		assert(not space_change_sensitive);
-		return {true, "white space"};
+		while(next_word(reader, w)) ans_words.push_back(w);
 	}
 
-	if(floatabs == 0 and floatrel == 0) {
-		return {false, quick_diff(out, ans)};
-	}
+	OutputReader out;
+	// Whether the output read so far equals the answer exactly, or after making it lower case.
+	bool exact = true, lower_equal = true;
+	// Whether all tokens read so far are equal.
+	bool words_equal = true;
+	size_t out_size  = 0;
 
-	if(out_words.size() != ans_words.size()) {
-		return {false, quick_diff(out, ans)};
-	}
+	auto wrong_answer = [&] {
+		out.read_for_diff();
+		if(out.newlines > 1) return pair<bool, string>{false, ""};
+		string out_head = out.head;
+		if(not case_sensitive)
+			for(auto& c : out_head) c = tolower(c);
+		return pair<bool, string>{false, quick_diff(out_head, ans_lower)};
+	};
 
 	long double max_abs_err = 0;
 	long double max_rel_err = 0;
-	for(int i = 0; i < out_words.size(); ++i) {
-		const auto& w1 = ans_words[i];
-		const auto& w2 = out_words[i];
-		if(w1 != w2) {
-			size_t p1 = 0, p2 = 0;
-			// If the answer term doesn't parse as a float, don't try the output term.
-			// In this case, we always need equality of w1 and w2.
-			long double v1, v2;
-			try {
-				v1 = stold(w1, &p1);
-			} catch(exception& e) {
-				return {false, quick_diff(w2, w1)};
+	size_t i = 0;
+	string w2;
+	while(true) {
+		// Read the next token, keeping track of exact equality.
+		w2.clear();
+		if(not space_change_sensitive) {
+			while(is_space(out.peek())) {
+				int c = out.get();
+				exact &= out_size < ans.size() and ans[out_size] == c;
+				lower_equal &= out_size < ans.size() and ans_lower[out_size] == tolower(c);
+				++out_size;
 			}
-			if(p1 < w1.size()) return {false, quick_diff(w2, w1)};
+		}
+		if(out.peek() == EOF) break;
+		do {
+			int c = out.get();
+			exact &= out_size < ans.size() and ans[out_size] == c;
+			lower_equal &= out_size < ans.size() and ans_lower[out_size] == tolower(c);
+			++out_size;
+			w2 += case_sensitive ? c : tolower(c);
+			if(is_space(c)) break;
+		} while(out.peek() != EOF and not is_space(out.peek()));
 
-			// If the output term doesn't parse as a float -> WA.
-			try {
-				v2 = stold(w2, &p2);
-			} catch(exception& e) {
-				return {false, quick_diff(out, ans)};
-			}
-			if(p2 < w2.size()) return {false, quick_diff(w2, w1)};
+		if(i == ans_words.size()) return wrong_answer();
+		const auto& w1 = ans_words[i++];
+		if(w1 == w2) continue;
+		words_equal = false;
+		if(not floats) return wrong_answer();
 
-			// OK if w1 and w2 represent the same (possibly nan/inf) value.
-			if(v1 == v2) continue;
+		size_t p1 = 0, p2 = 0;
+		// If the answer term doesn't parse as a float, don't try the output term.
+		// In this case, we always need equality of w1 and w2.
+		long double v1, v2;
+		try {
+			v1 = stold(w1, &p1);
+		} catch(exception& e) {
+			return {false, quick_diff(w2, w1)};
+		}
+		if(p1 < w1.size()) return {false, quick_diff(w2, w1)};
 
-			// If both parse as float -> compare the absolute and relative differences.
-			auto abserr = abs(v1 - v2);
-			auto relerr = v1 != 0 ? abs((v1 - v2) / v1) : 1000;
-			max_abs_err = max(max_abs_err, abserr);
-			max_rel_err = max(max_rel_err, relerr);
+		// If the output term doesn't parse as a float -> WA.
+		try {
+			v2 = stold(w2, &p2);
+		} catch(exception& e) {
+			return wrong_answer();
+		}
+		if(p2 < w2.size()) return {false, quick_diff(w2, w1)};
 
-			// Catch inequality of nan and inf values.
-			if(isnan(v1) != isnan(v2) or isinf(v1) != isinf(v2)) {
-				return {false, quick_diff(w2, w1)};
-			}
+		// OK if w1 and w2 represent the same (possibly nan/inf) value.
+		if(v1 == v2) continue;
 
-			if(not(abserr <= float_absolute_tolerance or relerr <= float_relative_tolerance)) {
-				return {false, quick_diff(w2, w1)};
-			}
+		// If both parse as float -> compare the absolute and relative differences.
+		auto abserr = abs(v1 - v2);
+		auto relerr = v1 != 0 ? abs((v1 - v2) / v1) : 1000;
+		max_abs_err = max(max_abs_err, abserr);
+		max_rel_err = max(max_rel_err, relerr);
+
+		// Catch inequality of nan and inf values.
+		if(isnan(v1) != isnan(v2) or isinf(v1) != isinf(v2)) {
+			return {false, quick_diff(w2, w1)};
+		}
+
+		if(not(abserr <= float_absolute_tolerance or relerr <= float_relative_tolerance)) {
+			return {false, quick_diff(w2, w1)};
 		}
 	}
+	if(i < ans_words.size()) return wrong_answer();
+
+	exact &= out_size == ans.size();
+	lower_equal &= out_size == ans.size();
+	if(exact) return {true, ""};
+	if(not case_sensitive and lower_equal) return {true, "case"};
+	if(words_equal) return {true, "white space"};
 
 	stringstream message;
 	message << setprecision(2);
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# Run a Python program in forked copies of a warm interpreter.
+#
+# Run as `python3 zygote.py program.py`, using the interpreter of the program.
+# The top-level imports of program.py that are not modules in its own directory are imported
+# once. After writing `zygote` and a newline to stdout, requests are read from stdin. Each
+# request is a list of NUL-terminated strings, followed by an empty string:
+#     working directory, stdin file, stdout file, stderr file, cpu time limit, arguments...
+# The files are paths, and the cpu time limit is in seconds (0 for no limit). Since an empty
+# string ends the request, none of the strings may be empty. For each request, program.py is
+# run as __main__ in a forked copy of this process, with sys.argv, the working directory and
+# the standard streams set up as if the program was started normally. The reply is a line
+#     <exit code> <user+system cpu time in seconds> <peak resident memory as in ru_maxrss>
+# where the exit code is negative when the program was killed by a signal. Since forked
+# children inherit the memory of this process, the peak resident memory is -1 when it is not
+# above that of this process.
+
+import ast
+import atexit
+import importlib
+import os
+import resource
+import runpy
+import sys
+import traceback
+
+
+def _write_all(fd, data):
+    while data:
+        data = data[os.write(fd, data) :]
+
+
+def _redirect(fd, path, flags):
+    f = os.open(path, flags, 0o644)
+    os.dup2(f, fd)
+    os.close(f)
+
+
+# The absolute module names imported at the top level of the program, including those in
+# top-level try blocks like `try: import numpy`.
+def _top_level_imports(program):
+    with open(program, 'rb') as f:
+        tree = ast.parse(f.read(), program)
+    body = []
+    for node in tree.body:
+        body.append(node)
+        if isinstance(node, ast.Try):
+            body += node.body
+    modules = []
+    for node in body:
+        if isinstance(node, ast.Import):
+            modules += [alias.name for alias in node.names]
+        if isinstance(node, ast.ImportFrom) and node.level == 0:
+            modules.append(node.module)
+    return modules
+
+
+# Import the modules the program depends on, except for modules in the directory of the
+# program: those may depend on sys.argv or the working directory, or have state that must
+# not be shared between runs.
+def _preimport(program, directory):
+    try:
+        modules = _top_level_imports(program)
+    except (OSError, SyntaxError, ValueError):
+        return
+    for module in modules:
+        name = module.split('.')[0]
+        if os.path.exists(os.path.join(directory, name + '.py')) or os.path.isdir(
+            os.path.join(directory, name)
+        ):
+            continue
+        try:
+            importlib.import_module(module)
+        except Exception:
+            # The program reports the error itself when it is run.
+            pass
+
+
+# Run the program as __main__ like `python3 program.py`, and return its exit code.
+def _run(program, args):
+    sys.argv = [program] + args
+    try:
+        runpy.run_path(program, run_name='__main__')
+        code = 0
+    except SystemExit as e:
+        if e.code is None:
+            code = 0
+        elif isinstance(e.code, int):
+            code = e.code
+        else:
+            print(e.code, file=sys.stderr)
+            code = 1
+    except BaseException as e:
+        # Like the interpreter, print the traceback starting at the program.
+        tb = e.__traceback__
+        while tb is not None and tb.tb_frame.f_code.co_filename != program:
+            tb = tb.tb_next
+        traceback.print_exception(type(e), e, tb or e.__traceback__)
+        code = 1
+    try:
+        atexit._run_exitfuncs()
+        sys.stdout.flush()
+        sys.stderr.flush()
+    except BaseException:
+        code = code or 1
+    return code
+
+
+def main():
+    if len(sys.argv) != 2:
+        print('Usage: zygote.py program.py', file=sys.stderr)
+        sys.exit(1)
+    program = os.path.abspath(sys.argv[1])
+
+    # Keep the request and reply pipes away from the imported modules and the program.
+    requests = os.dup(0)
+    replies = os.dup(1)
+    _redirect(0, os.devnull, os.O_RDONLY)
+    os.dup2(2, 1)
+
+    # Like `python3 program.py`, use the directory of the program after resolving symlinks.
+    directory = os.path.dirname(os.path.realpath(program))
+    del sys.path[0]
+    _preimport(program, directory)
+    sys.path.insert(0, directory)
+
+    buffer = b''
+    _write_all(replies, b'zygote\n')
+    while True:
+        # Read a request: a list of NUL-terminated strings, followed by an empty string.
+        while b'\0\0' not in buffer and not buffer.startswith(b'\0'):
+            chunk = os.read(requests, 4096)
+            if not chunk:
+                os._exit(0 if not buffer else 1)
+            buffer += chunk
+        if buffer.startswith(b'\0'):
+            os._exit(0)
+        request, buffer = buffer.split(b'\0\0', 1)
+        request = [os.fsdecode(s) for s in request.split(b'\0')]
+        if len(request) < 5:
+            os._exit(1)
+        cwd, stdin, stdout, stderr, cpu = request[:5]
+
+        pid = os.fork()
+        if pid == 0:
+            try:
+                os.close(requests)
+                os.close(replies)
+                os.chdir(cwd)
+                _redirect(0, stdin, os.O_RDONLY)
+                _redirect(1, stdout, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+                _redirect(2, stderr, os.O_WRONLY | os.O_CREAT | os.O_TRUNC)
+                if int(cpu):
+                    resource.setrlimit(resource.RLIMIT_CPU, (int(cpu), int(cpu)))
+            except (OSError, ValueError):
+                os._exit(1)
+            os._exit(_run(program, request[5:]))
+
+        _, status, usage = os.wait4(pid, 0)
+        if os.WIFEXITED(status):
+            code = os.WEXITSTATUS(status)
+        else:
+            code = -os.WTERMSIG(status)
+        cpu_time = usage.ru_utime + usage.ru_stime
+        maxrss = usage.ru_maxrss
+        if maxrss <= resource.getrusage(resource.RUSAGE_SELF).ru_maxrss:
+            maxrss = -1
+        _write_all(replies, f'{code} {cpu_time} {maxrss}\n'.encode())
+
+
+main()
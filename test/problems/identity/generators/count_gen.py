@@ -0,0 +1,9 @@
+#!/usr/bin/env python3
+import sys
+import random
+
+# Write {count} testcases at once.
+random.seed(sys.argv[1])
+for i in range(1, int(sys.argv[2]) + 1):
+    with open(f'{i}.in', 'w') as f:
+        f.write(f'{random.randint(0, 1000)}\n')
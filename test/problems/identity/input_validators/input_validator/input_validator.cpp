@@ -1,6 +1,7 @@
 #include "validation.h"
 
 int main(int argc, char** argv) {
+	batch_protocol(argc, argv);
 	InputValidator v(argc, argv);
 	int n = v.read_integer("n", 0, 1000);
 	v.newline();
@@ -0,0 +1,137 @@
+import os
+import pytest
+from pathlib import Path
+
+import cache
+import config
+import util
+
+config.set_default_args()
+
+
+class _Bar:
+    def debug(self, *args, **kwargs):
+        pass
+
+
+# A minimal stand-in for program.Program, with the attributes used by the cache.
+class _Program:
+    def __init__(self, tmpdir, compiler, source='int main() {}'):
+        self.tmpdir = tmpdir
+        self.tmpdir.mkdir(parents=True, exist_ok=True)
+        source_path = self.tmpdir / 'main.cpp'
+        source_path.write_text(source)
+        self.input_files = [source_path]
+        self.language = 'cpp'
+        self.compile_command = [str(compiler), 'main.cpp']
+        self.run_command = [str(self.tmpdir / 'run')]
+        self.hash = util.combine_hashes([source, ' '.join(self.compile_command)])
+        self.bar = _Bar()
+
+    # Simulate running the compile command.
+    def compile(self, size=10):
+        (self.tmpdir / 'run').write_bytes(b'x' * size)
+
+
+def _compiler(path, version):
+    path.write_text(f'#!/bin/sh\necho {version}\n')
+    path.chmod(0o755)
+    return path
+
+
+@pytest.fixture
+def build_cache(tmp_path):
+    old = config.args.build_cache, config.args.build_cache_size, config.args.no_build_cache
+    config.args.build_cache = tmp_path / 'cache'
+    config.args.build_cache_size = 2048
+    config.args.no_build_cache = False
+    cache._compiler_versions.clear()
+    yield tmp_path
+    config.args.build_cache, config.args.build_cache_size, config.args.no_build_cache = old
+    cache._compiler_versions.clear()
+
+
+class TestBuildCache:
+    def test_hit(self, build_cache):
+        compiler = _compiler(build_cache / 'cc', 'cc 1.0')
+        a = _Program(build_cache / 'a', compiler)
+        assert not cache.restore(a)
+        a.compile()
+        cache.store(a)
+
+        # The same program in another build directory restores the artefacts.
+        b = _Program(build_cache / 'b', compiler)
+        assert cache.restore(b)
+        assert (b.tmpdir / 'run').read_bytes() == (a.tmpdir / 'run').read_bytes()
+
+    def test_miss_on_source_change(self, build_cache):
+        compiler = _compiler(build_cache / 'cc', 'cc 1.0')
+        a = _Program(build_cache / 'a', compiler)
+        a.compile()
+        cache.store(a)
+
+        b = _Program(build_cache / 'b', compiler, source='int main() { return 1; }')
+        assert not cache.restore(b)
+        assert not (b.tmpdir / 'run').exists()
+
+    def test_miss_on_compiler_change(self, build_cache):
+        compiler = _compiler(build_cache / 'cc', 'cc 1.0')
+        a = _Program(build_cache / 'a', compiler)
+        a.compile()
+        cache.store(a)
+
+        # An update of the compiler changes its --version output.
+        _compiler(compiler, 'cc 2.0')
+        cache._compiler_versions.clear()
+        b = _Program(build_cache / 'b', compiler)
+        assert not cache.restore(b)
+
+    def test_disabled(self, build_cache):
+        compiler = _compiler(build_cache / 'cc', 'cc 1.0')
+        config.args.no_build_cache = True
+        a = _Program(build_cache / 'a', compiler)
+        a.compile()
+        cache.store(a)
+        assert not config.args.build_cache.exists()
+        assert not cache.restore(_Program(build_cache / 'b', compiler))
+
+    def test_lru_eviction(self, build_cache):
+        config.args.build_cache_size = 1
+        megabyte = 1024 * 1024
+        programs = []
+        for i in range(3):
+            compiler = _compiler(build_cache / f'cc{i}', f'cc {i}')
+            p = _Program(build_cache / f'p{i}', compiler)
+            p.compile(size=megabyte // 3)
+            cache.store(p)
+            programs.append(p)
+            # Make the entries clearly ordered by time of last use.
+            entry = config.args.build_cache / cache._key(p)
+            os.utime(entry, (1000 + i, 1000 + i))
+
+        # Using the oldest entry marks it as recently used.
+        assert cache.restore(_Program(build_cache / 'q0', programs[0].compile_command[0]))
+
+        # The cache is full, so storing another entry evicts the least recently used one.
+        compiler = _compiler(build_cache / 'cc3', 'cc 3')
+        p = _Program(build_cache / 'p3', compiler)
+        p.compile(size=megabyte // 3)
+        cache.store(p)
+
+        entries = [e for e in config.args.build_cache.iterdir() if not e.name.startswith('.')]
+        total = sum(cache._entry_size(e) for e in entries)
+        assert total <= megabyte
+        assert (config.args.build_cache / cache._key(programs[0])).is_dir()
+        assert not (config.args.build_cache / cache._key(programs[1])).is_dir()
+        assert (config.args.build_cache / cache._key(p)).is_dir()
+
+    def test_unwritable_cache_directory(self, build_cache):
+        # A file in place of a parent directory makes the cache directory impossible to
+        # create, also when running as root.
+        (build_cache / 'file').write_text('')
+        config.args.build_cache = build_cache / 'file' / 'cache'
+        compiler = _compiler(build_cache / 'cc', 'cc 1.0')
+        a = _Program(build_cache / 'a', compiler)
+        a.compile()
+        cache.store(a)
+        assert not cache.restore(_Program(build_cache / 'b', compiler))
@@ -6,6 +6,7 @@ import hashlib
 import tempfile
 from pathlib import Path
 
+import default_output_validator
 import problem
 import run
 import validate
@@ -60,6 +61,15 @@ def validator(request):
     os.chdir(RUN_DIR)
 
 
+# The (flags, ans, out) tests for which the in-process validator falls back to the C++
+# validator, since the error is too close to the tolerance.
+IN_PROCESS_FALLBACKS = [
+    ('float_absolute_tolerance 1', '10 11', '11.000000001 11'),
+    ('float_tolerance 0.5', '1000 0.001', '500 -0.499'),
+    ('float_tolerance 0.5', '1000 0.001', '1500 0.501'),
+]
+
+
 class MockRun:
     pass
 
@@ -94,3 +104,29 @@ class TestDefaultOutputValidators:
             for k in vars(result):
                 print(k, " -> ", getattr(result, k))
         assert result.ok == exp
+
+
+@pytest.mark.usefixtures('validator')
+class TestInProcessDefaultOutputValidator:
+    @pytest.mark.parametrize('testdata', read_tests())
+    def test_in_process_default_output_validator(self, validator, testdata):
+        problem, _ = validator
+        flags, ans, out, exp = testdata
+
+        (problem.tmpdir / 'data').mkdir(exist_ok=True, parents=True)
+        ans_path = problem.tmpdir / 'data/test.ans'
+        out_path = problem.tmpdir / 'data/test.out'
+        ans_path.write_text(ans)
+        out_path.write_text(out)
+
+        t = run.Testcase(problem, problem.tmpdir / 'data/test.in', short_path=Path('test'))
+        r = MockRun()
+        r.out_path = out_path
+
+        result = default_output_validator.validate(t, r, flags.split())
+        # None means that the C++ validator must be used.
+        if (flags, ans, out) in IN_PROCESS_FALLBACKS:
+            assert result is None
+        else:
+            assert result is not None
+            assert result.ok == (exp is True)
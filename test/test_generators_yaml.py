@@ -43,3 +43,38 @@ class TestGeneratorConfig:
     def test_bad_generators_yamls(self, yamldoc):
         with pytest.raises(SystemExit) as e:
             MockGeneratorConfig(MockProblem()).parse_yaml(yamldoc)
+
+    def test_dependency_graph_include(self):
+        gen_config = MockGeneratorConfig(MockProblem())
+        gen_config.parse_yaml(yaml.safe_load('''
+generators:
+  gen: [gen.py]
+data:
+  sample:
+    type: directory
+    data:
+      '01': gen 1
+  secret:
+    type: directory
+    data:
+      group_a:
+        type: directory
+        include: [sample/01]
+      group_b:
+        type: directory
+        # Includes the symlink created by group_a.
+        include: [secret/group_a/01]
+        data:
+          '02': gen 2
+'''))
+        rules, dependencies = gen_config.dependency_graph()
+        dependencies = {str(r.path): sorted(str(d.path) for d in dependencies[r]) for r in rules}
+        assert dependencies == {
+            '.': [],
+            'sample': ['.'],
+            'sample/01': ['sample'],
+            'secret': ['.'],
+            'secret/group_a': ['sample/01', 'secret'],
+            'secret/group_b': ['secret', 'secret/group_a'],
+            'secret/group_b/02': ['secret/group_b'],
+        }
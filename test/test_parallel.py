@@ -0,0 +1,65 @@
+import pytest
+import threading
+import time
+
+import config
+import parallel
+
+config.set_default_args()
+
+
+# Run tasks with run_graph and return the tasks in the order they were started.
+def run(tasks, dependencies, num_threads, f=None):
+    started = []
+    done = set()
+    lock = threading.Lock()
+
+    def run_task(task):
+        with lock:
+            # All dependencies must be done before a task starts.
+            assert all(d in done for d in dependencies.get(task, []))
+            started.append(task)
+        if f:
+            f(task)
+        with lock:
+            done.add(task)
+
+    parallel.run_graph(run_task, tasks, dependencies, num_threads)
+    assert done == set(tasks)
+    return started
+
+
+class TestRunGraph:
+    @pytest.mark.parametrize('num_threads', [False, 1, 4])
+    def test_dependency_order(self, num_threads):
+        tasks = list(range(20))
+        # Tasks only depend on tasks that come later, so that they can not run in order.
+        dependencies = {i: [j for j in tasks if j > i and (i + j) % 4 == 1] for i in tasks}
+        started = run(tasks, dependencies, num_threads, lambda task: time.sleep(0.001))
+        assert sorted(started) == tasks
+
+    def test_priority_by_index(self):
+        # c is ready from the start and b only once a is done, but b comes first in tasks.
+        def slow_a(task):
+            if task == 'a':
+                time.sleep(0.1)
+
+        assert run(['a', 'b', 'c'], {'b': ['a']}, 1, slow_a) == ['a', 'b', 'c']
+
+    def test_without_threads(self):
+        dependencies = {'a': ['c'], 'b': ['a'], 'd': ['b', 'c']}
+        assert run(['a', 'b', 'c', 'd'], dependencies, False) == ['c', 'a', 'b', 'd']
+
+    @pytest.mark.parametrize('num_threads', [False, 1, 4])
+    def test_error(self, num_threads):
+        started = []
+
+        def f(task):
+            started.append(task)
+            if task == 'a':
+                raise ValueError(task)
+
+        with pytest.raises(ValueError):
+            parallel.run_graph(f, ['a', 'b', 'c'], {'b': ['a'], 'c': ['b']}, num_threads)
+        # The dependents of the failed task are not started.
+        assert started == ['a']
@@ -2,6 +2,7 @@ import pytest
 import yaml
 import os
 import io
+import shutil
 from pathlib import Path
 
 import tools
@@ -188,6 +189,30 @@ class TestNewContestProblem:
         tools.test(['tmp', '--clean', '--contest', 'contest_name'])
 
 
+@pytest.mark.usefixtures('tmp_contest_dir')
+class TestInteractiveRepeat:
+    def test_interaction_unchanged(self):
+        problem_dir = Path('boolfindrepeat')
+        shutil.copytree(RUN_DIR / 'test/problems/boolfind', problem_dir)
+        os.chdir(problem_dir)
+        # Keep a single accepted submission, so that it is used as the default solution.
+        Path('submissions/accepted/BoolfindTestCorrect.java').unlink()
+        Path('submissions/accepted/boolfind-test-correct.cc').unlink()
+        interaction = Path('data/sample/1.interaction')
+        submission = 'submissions/accepted/boolfind-test-correct.c'
+        try:
+            interaction.unlink(missing_ok=True)
+            tools.test(['run', submission])
+            expected = interaction.read_text()
+            interaction.unlink()
+            tools.test(['tmp', '--clean'])
+            # The interaction of the sample is written only once, also when runs are repeated.
+            tools.test(['run', '--repeat', '3', submission])
+            assert interaction.read_text() == expected
+        finally:
+            tools.test(['tmp', '--clean'])
+
+
 class TestReadProblemConfig:
     def test_read_problem_config(self):
         p = problem.Problem(RUN_DIR / 'test/problems/test_problem_config', Path('/tmp/xyz'))
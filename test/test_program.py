@@ -0,0 +1,120 @@
+import pytest
+from pathlib import Path
+
+import config
+import program
+
+config.set_default_args()
+
+
+class _Bar:
+    def __init__(self):
+        self.warnings = []
+
+    def debug(self, *args, **kwargs):
+        pass
+
+    def warn(self, message):
+        self.warnings.append(message)
+
+
+# A minimal stand-in for program.Program, with the attributes used by _add_cds_archive.
+class _Program:
+    _add_cds_archive = program.Program._add_cds_archive
+
+    def __init__(self, tmpdir, java, language='java'):
+        self.tmpdir = tmpdir
+        self.tmpdir.mkdir(parents=True, exist_ok=True)
+        self.language = language
+        self.run_command = [str(java), 'Main']
+        self.cds_archive = None
+        self.bar = _Bar()
+
+
+# A fake java that records its training runs, and writes the archive unless told otherwise.
+def _java(path, script='touch "$archive"'):
+    path.write_text(f'''#!/bin/sh
+for arg in "$@"; do
+    case "$arg" in
+        *-XX:ArchiveClassesAtExit=*)
+            archive="${{arg#*=}}"
+            echo run >> "{path}.training"
+            {script}
+            ;;
+    esac
+done
+''')
+    path.chmod(0o755)
+    return path
+
+
+def _training_runs(java):
+    training = Path(f'{java}.training')
+    return len(training.read_text().split()) if training.is_file() else 0
+
+
+class TestClassDataSharing:
+    def test_archive(self, tmp_path):
+        java = _java(tmp_path / 'java')
+        p = _Program(tmp_path / 'build', java)
+        p._add_cds_archive()
+        archive = tmp_path / 'build' / 'app.jsa'
+        assert archive.is_file()
+        assert p.run_command == [
+            str(java),
+            f'-XX:SharedArchiveFile={archive}',
+            '-Xlog:cds*=off',
+            'Main',
+        ]
+        assert p.cds_archive == archive
+
+        # The archive is reused by later builds.
+        p = _Program(tmp_path / 'build', java)
+        p._add_cds_archive()
+        assert _training_runs(java) == 1
+        assert p.run_command[1] == f'-XX:SharedArchiveFile={archive}'
+
+    def test_kotlin(self, tmp_path):
+        java = _java(tmp_path / 'kotlin')
+        p = _Program(tmp_path / 'build', java, language='kotlin')
+        p._add_cds_archive()
+        assert p.run_command[1:3] == [
+            f'-J-XX:SharedArchiveFile={tmp_path / "build" / "app.jsa"}',
+            '-J-Xlog:cds*=off',
+        ]
+
+    def test_unsupported(self, tmp_path):
+        java = _java(tmp_path / 'java', script='true')
+        for _ in range(2):
+            p = _Program(tmp_path / 'build', java)
+            p._add_cds_archive()
+            assert p.run_command == [str(java), 'Main']
+        # The failure is remembered.
+        assert _training_runs(java) == 1
+
+    def test_timeout(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(program, 'CDS_TRAINING_TIMEOUT', 1)
+        java = _java(tmp_path / 'java', script='sleep 3; touch "$archive"')
+        p = _Program(tmp_path / 'build', java)
+        p._add_cds_archive()
+        assert p.run_command == [str(java), 'Main']
+        assert len(p.bar.warnings) == 1
+
+    def test_scratch_directory(self, tmp_path):
+        # Files written by the training run are not kept.
+        java = _java(tmp_path / 'java', script='touch testcase.in "$archive"')
+        p = _Program(tmp_path / 'build', java)
+        p._add_cds_archive()
+        assert sorted(f.name for f in (tmp_path / 'build').iterdir()) == ['app.jsa']
+
+    def test_disabled(self, tmp_path):
+        config.args.no_cds = True
+        try:
+            java = _java(tmp_path / 'java')
+            p = _Program(tmp_path / 'build', java)
+            p._add_cds_archive()
+        finally:
+            config.args.no_cds = False
+        assert p.run_command == [str(java), 'Main']
+        assert p.cds_archive is None
+        assert _training_runs(java) == 0
@@ -0,0 +1,97 @@
+import pytest
+import sys
+from pathlib import Path
+
+import config
+import util
+import zygote
+
+config.set_default_args()
+
+PROGRAM = '''import os
+import sys
+
+print(*sys.argv[1:])
+print(os.getcwd())
+print(sys.stdin.read(), end='')
+mode = sys.argv[1]
+if mode == 'none':
+    sys.exit()
+if mode == 'int':
+    sys.exit(3)
+if mode == 'str':
+    sys.exit('message')
+if mode == 'raise':
+    raise ValueError('boom')
+'''
+
+
+# A minimal stand-in for program.Program, with the attributes used by Zygote.
+class _Program:
+    def __init__(self, tmpdir):
+        self.tmpdir = tmpdir
+        path = tmpdir / 'program.py'
+        path.write_text(PROGRAM)
+        self.language = 'python3'
+        self.run_command = [sys.executable, path]
+
+
+@pytest.fixture
+def program(tmp_path):
+    yield zygote.Zygote(_Program(tmp_path))
+    util.kill_process_groups()
+
+
+class TestZygote:
+    def test_args_cwd_and_stdin(self, program, tmp_path):
+        cwd = tmp_path / 'cwd'
+        cwd.mkdir()
+        stdin = tmp_path / 'stdin'
+        stdin.write_text('input\n')
+        result = program.run(['ok', 'a b', 'c'], cwd=cwd, timeout=10, stdin_path=stdin)
+        assert result.ok is True
+        assert result.returncode == 0
+        assert result.out == f'ok a b c\n{cwd.resolve()}\ninput\n'
+
+    def test_stdout_path(self, program, tmp_path):
+        stdout = tmp_path / 'stdout'
+        result = program.run(['ok'], cwd=tmp_path, timeout=10, stdout_path=stdout)
+        assert result.ok is True
+        assert result.out is None
+        assert stdout.read_text() == f'ok\n{tmp_path.resolve()}\n'
+
+    @pytest.mark.parametrize(
+        'mode,returncode,err',
+        [('none', 0, ''), ('int', 3, ''), ('str', 1, 'message'), ('raise', 1, 'ValueError: boom')],
+    )
+    def test_exit_code(self, program, tmp_path, mode, returncode, err):
+        result = program.run([mode], cwd=tmp_path, timeout=10)
+        assert result.returncode == returncode
+        assert result.ok is (True if returncode == 0 else returncode)
+        assert err in (result.err or '')
+
+    def test_expect(self, program, tmp_path):
+        assert program.run(['int'], cwd=tmp_path, timeout=10, expect=3).ok is True
+
+    def test_server_is_reused(self, program, tmp_path):
+        for _ in range(3):
+            assert program.run(['ok'], cwd=tmp_path, timeout=10).ok is True
+        assert program._count == 1
+
+    def test_kill_process_groups(self, program, tmp_path):
+        assert program.run(['ok'], cwd=tmp_path, timeout=10).ok is True
+        process = program._servers[0].process
+        assert process.poll() is None
+        util.kill_process_groups()
+        assert process.poll() is not None
+
+    def test_empty_argument(self, program, tmp_path):
+        # Empty strings can not be sent to the server, so the program is not run.
+        assert program.run(['ok', ''], cwd=tmp_path, timeout=10) is None
+
+    def test_disabled(self, tmp_path):
+        config.args.no_zygote = True
+        try:
+            assert zygote.Zygote(_Program(tmp_path)).run(['ok'], cwd=tmp_path, timeout=10) is None
+        finally:
+            config.args.no_zygote = False